@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" Bundling of the static assets, into minified files with hashed names.
+
+Each bundle is built from its sources in static/, and written to static/dist/
+as <name>.<hash>.<ext>, along with a gzipped copy, and a manifest mapping
+bundle names to the built files.  Since the name of a built file changes
+with its content, it can be cached forever.
+
+Bundles are built on first use, if they are out of date, or with:
+
+    python assets.py
+
+"""
+
+# Standard library
+import gzip
+import hashlib
+from io import BytesIO
+import json
+import os
+from os.path import abspath, dirname, exists, join, splitext
+import re
+import threading
+
+HERE = dirname(abspath(__file__))
+STATIC = join(HERE, 'static')
+DIST = join(STATIC, 'dist')
+MANIFEST = 'manifest.json'
+
+# Bundles, and the files in static/ they are made of.
+BUNDLES = {
+    'css/statiki.css': ['css/custom.css'],
+    'js/statiki.js': ['js/custom.js'],
+}
+
+CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+CSS_SPACE_RE = re.compile(r'\s+')
+CSS_PUNCTUATION_RE = re.compile(r'\s*([{};,])\s*')
+
+_lock = threading.Lock()
+_manifest = {}
+
+
+def build(static=STATIC, dist=DIST):
+    """ Build all the bundles that are out of date, and return the manifest.
+
+    """
+
+    manifest = {}
+
+    for name, sources in sorted(BUNDLES.items()):
+        content = '\n'.join(_read(join(static, source)) for source in sources)
+        content = minify(name, content)
+        base, ext = splitext(name)
+        built = '%s.%s%s' % (base, hashlib.sha1(content).hexdigest()[:10], ext)
+        path = join(dist, built)
+
+        # The gzipped copy goes first, since a bundle is served once the
+        # plain file exists.
+        if not exists(path):
+            _write(path + '.gz', _gzip(content))
+            _write(path, content)
+
+        manifest[name] = built
+
+    _write(join(dist, MANIFEST), json.dumps(manifest, indent=2))
+
+    return manifest
+
+
+def get_built_name(name):
+    """ Return the name of the built file for a bundle, building if needed.
+
+    """
+
+    if name not in _manifest:
+        with _lock:
+            if name not in _manifest:
+                _manifest.update(build())
+
+    return _manifest[name]
+
+
+def minify(name, content):
+    """ Return the content, minified, based on the type of the bundle. """
+
+    if name.endswith('.css'):
+        content = CSS_COMMENT_RE.sub('', content)
+        content = CSS_SPACE_RE.sub(' ', content)
+        content = CSS_PUNCTUATION_RE.sub(r'\1', content)
+
+    else:
+        # Only indentation and blank lines; JS relies on newlines for
+        # semicolon insertion.
+        content = '\n'.join(
+            line.strip() for line in content.splitlines() if line.strip()
+        )
+
+    return content.strip() + '\n'
+
+
+#### Private protocol #########################################################
+
+def _gzip(content):
+    data = BytesIO()
+    with gzip.GzipFile(fileobj=data, mode='wb', compresslevel=9) as f:
+        f.write(content)
+
+    return data.getvalue()
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def _write(path, content):
+    """ Write the content to the path, atomically. """
+
+    if not exists(dirname(path)):
+        os.makedirs(dirname(path))
+
+    temp = '%s.%s.tmp' % (path, os.getpid())
+    with open(temp, 'wb') as f:
+        f.write(content)
+    os.rename(temp, path)
+
+
+if __name__ == '__main__':
+    for name, built in sorted(build().items()):
+        print '%s -> %s' % (name, join(DIST, built))
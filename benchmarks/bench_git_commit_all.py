@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" Benchmark committing a large number of deleted files, in the fabfile.
+
+Creates a local repository with a lot of committed files, deletes them and
+times committing the deletions using one `git rm` per file (the old way), and
+using `_git_commit_all` from the fabfile.
+
+Usage:
+    python benchmarks/bench_git_commit_all.py [--files N]
+
+"""
+
+# Standard library.
+import argparse
+import os
+from os.path import abspath, dirname, join
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# 3rd party library.
+from fabric.api import hide
+
+# Local library.
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'utils'))
+import travis_fabfile
+
+
+def create_repo(path, count):
+    """ Create a repository with count committed files, and delete them. """
+
+    subprocess.check_output(['git', 'init', '-q', path])
+    subprocess.check_output(['git', 'config', 'user.name', 'Bench'], cwd=path)
+    subprocess.check_output(
+        ['git', 'config', 'user.email', 'bench@example.com'], cwd=path
+    )
+
+    posts = join(path, 'posts')
+    os.makedirs(posts)
+    for i in range(count):
+        with open(join(posts, 'post-%05d.html' % i), 'w') as f:
+            f.write('Post %d\n' % i)
+
+    subprocess.check_output(['git', 'add', '.'], cwd=path)
+    subprocess.check_output(['git', 'commit', '-q', '-m', 'Add'], cwd=path)
+    shutil.rmtree(posts)
+
+
+def commit_one_by_one():
+    """ The old way of committing deletions, one process per file. """
+
+    deleted = subprocess.check_output(['git', 'ls-files', '--deleted', '-z'])
+    for path in deleted.split('\x00'):
+        if len(path.strip()) > 0:
+            subprocess.check_output(['git', 'rm', '-q', path])
+
+    subprocess.check_output(['git', 'add', '.'])
+    subprocess.check_output(['git', 'commit', '-q', '-m', 'Delete'])
+
+
+def commit_all():
+    """ Commit deletions using the fabfile. """
+
+    with hide('everything'):
+        travis_fabfile._git_commit_all('Delete')
+
+
+def run(name, function, count):
+    """ Time the given function against a fresh repository. """
+
+    temp_dir = tempfile.mkdtemp()
+    old_cwd = os.getcwd()
+
+    try:
+        create_repo(temp_dir, count)
+        os.chdir(temp_dir)
+        start = time.time()
+        function()
+        duration = time.time() - start
+        remaining = subprocess.check_output(['git', 'ls-files']).split()
+
+    finally:
+        os.chdir(old_cwd)
+        shutil.rmtree(temp_dir)
+
+    assert len(remaining) == 0, 'Deletions were not committed'
+    print('%-20s %8.2fs' % (name, duration))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=10000)
+    args = parser.parse_args()
+
+    print('Committing %d deleted files' % args.files)
+    run('git rm per file', commit_one_by_one, args.files)
+    run('_git_commit_all', commit_all, args.files)
+
+
+if __name__ == '__main__':
+    main()
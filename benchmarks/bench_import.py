@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" Benchmark the time taken to import and create the app, in a new process.
+
+This is the start up cost paid by each worker on a dyno restart, or when
+scaling up.  Runs a fresh interpreter for each run, and reports the median
+time along with the slowest of the modules imported by statiki, measured by
+wrapping __import__ (Python 2 has no `-X importtime`).  Exits with an error
+if the median is over the budget.
+
+Usage:
+    python benchmarks/bench_import.py [--runs N] [--budget SECONDS]
+
+"""
+
+# Standard library.
+import argparse
+import json
+from os.path import abspath, dirname
+import subprocess
+import sys
+
+ROOT = dirname(dirname(abspath(__file__)))
+
+# Run in a new interpreter, printing the total and per module times as JSON.
+SCRIPT = """
+import __builtin__, json, sys, time
+
+timings = {}
+original = __builtin__.__import__
+depth = [0]
+
+def timed_import(name, *args, **kwargs):
+    direct = depth[0] == 1 and name not in sys.modules
+    depth[0] += 1
+    start = time.time()
+    try:
+        return original(name, *args, **kwargs)
+    finally:
+        depth[0] -= 1
+        if direct:
+            timings[name] = timings.get(name, 0) + time.time() - start
+
+__builtin__.__import__ = timed_import
+start = time.time()
+import statiki
+statiki.create_app()
+total = time.time() - start
+__builtin__.__import__ = original
+print json.dumps({'total': total, 'modules': timings})
+"""
+
+
+def get_timings():
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT], cwd=ROOT)
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=0.7,
+                        help='Maximum median time, in seconds.')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of slowest imports to show.')
+    args = parser.parse_args()
+
+    runs = sorted(
+        (get_timings() for _ in range(args.runs)),
+        key=lambda timings: timings['total']
+    )
+    median = runs[len(runs) // 2]
+
+    print 'Import and create app: %.0f ms (median of %d)' % (
+        median['total'] * 1000, args.runs
+    )
+    modules = sorted(
+        median['modules'].items(), key=lambda item: item[1], reverse=True
+    )
+    for name, seconds in modules[:args.top]:
+        print '    %-30s %7.1f ms' % (name, seconds * 1000)
+
+    if median['total'] > args.budget:
+        print 'Over the budget of %.0f ms!' % (args.budget * 1000)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" Benchmark fetching a long paginated listing, with varying concurrency.
+
+Runs a stand-in GitHub holding a user with many repositories, and lists
+them all, and then only until a repository halfway through is found, with
+each of the given numbers of concurrent requests.  Reports the time taken
+and the number of pages fetched.
+
+Usage:
+    python benchmarks/bench_listing.py [--repos N] [--per-page N]
+                                       [--latency SECONDS]
+                                       [--concurrency N [N ...]]
+
+"""
+
+# Standard library.
+import argparse
+from os.path import abspath, dirname
+import sys
+import time
+
+# Local library.
+HERE = dirname(abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, dirname(HERE))
+from fake_upstreams import FakeGitHub
+import http_utils
+
+
+def list_repos(github, concurrency, per_page, until=None):
+    """ Return the names listed, and the number of pages fetched. """
+
+    del github.calls[:]
+    pages = http_utils.iter_pages(
+        '%s/user/repos' % github.url, concurrency=concurrency,
+        headers={'Authorization': 'token token-fred'},
+        params={'per_page': per_page},
+    )
+    names = []
+    for page in pages:
+        names.extend(repo['full_name'] for repo in page.json())
+        if until in names:
+            break
+    pages.close()
+
+    return names, len(github.calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repos', type=int, default=10000)
+    parser.add_argument('--per-page', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='Seconds added to each request.')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    github = FakeGitHub(latency=args.latency)
+    for i in range(args.repos):
+        github.add_repo('fred/site-%05d' % i)
+    target = 'fred/site-%05d' % (args.repos // 2)
+
+    print '%-12s %12s %8s %12s %8s' % (
+        'concurrency', 'all (s)', 'pages', 'find (s)', 'pages'
+    )
+    with github:
+        for concurrency in args.concurrency:
+            start = time.time()
+            names, pages = list_repos(github, concurrency, args.per_page)
+            elapsed = time.time() - start
+            assert len(names) == args.repos
+
+            start = time.time()
+            _, find_pages = list_repos(
+                github, concurrency, args.per_page, until=target
+            )
+            find_elapsed = time.time() - start
+
+            print '%-12d %12.2f %8d %12.2f %8d' % (
+                concurrency, elapsed, pages, find_elapsed, find_pages
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" Benchmark completing repository names, for a user with many repositories.
+
+Builds an index of random repository names, and times searches for prefixes
+of one to a few characters, the way they are typed.  Reports the percentiles
+of the time taken by a search, and exits with an error if the 99th
+percentile is over the budget.
+
+Usage:
+    python benchmarks/bench_repo_index.py [--repos N] [--searches N]
+                                          [--budget SECONDS]
+
+"""
+
+# Standard library.
+import argparse
+from os.path import abspath, dirname
+import random
+import string
+import sys
+import time
+
+# Local library.
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+from repo_index import RepoIndex
+
+
+def get_percentile(values, percent):
+    values = sorted(values)
+    return values[int(round(percent / 100.0 * (len(values) - 1)))]
+
+
+def get_random_name():
+    letters = string.ascii_lowercase + string.digits + '-'
+    return ''.join(
+        random.choice(letters) for _ in range(random.randint(3, 20))
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repos', type=int, default=10000)
+    parser.add_argument('--searches', type=int, default=10000)
+    parser.add_argument('--budget', type=float, default=0.001,
+                        help='Maximum 99th percentile, in seconds.')
+    args = parser.parse_args()
+
+    random.seed(0)
+    names = [get_random_name() for _ in range(args.repos)]
+    start = time.time()
+    index = RepoIndex()
+    for name in names:
+        index.add(name, exists=True)
+    print 'Indexed %d repos in %.0f ms' % (
+        len(index), (time.time() - start) * 1000
+    )
+
+    durations = []
+    for _ in range(args.searches):
+        prefix = random.choice(names)[:random.randint(1, 4)]
+        start = time.time()
+        index.search(prefix)
+        durations.append(time.time() - start)
+
+    for percent in (50, 95, 99):
+        print '    p%d %8.1f us' % (
+            percent, get_percentile(durations, percent) * 10 ** 6
+        )
+
+    if get_percentile(durations, 99) > args.budget:
+        print 'Over the budget of %.1f ms!' % (args.budget * 1000)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
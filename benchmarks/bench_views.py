@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" Benchmark the main views end-to-end, against stand-in GitHub and Travis.
+
+Logs in through the OAuth flow of the stand-in GitHub, and times requests to
+create_repo (for new and existing repositories) and manage (for repositories
+already known to Travis), with the given latency added to every upstream
+request.  Reports the median and 95th percentile latency of each scenario,
+along with the upstream calls and database queries made per request.
+
+Usage:
+    python benchmarks/bench_views.py [--requests N] [--latency SECONDS]
+                                     [--output FILE] [--compare FILE]
+
+"""
+
+# Standard library.
+import argparse
+import json
+import os
+from os.path import abspath, dirname, join
+import shutil
+import sys
+import tempfile
+import time
+
+# 3rd party library.
+import requests
+
+# Local library.
+HERE = dirname(abspath(__file__))
+sys.path.insert(0, dirname(HERE))
+sys.path.insert(0, HERE)
+from fake_upstreams import FakeGitHub, FakeTravis, get_environment
+
+
+def get_percentile(values, percent):
+    values = sorted(values)
+    return values[int(round(percent / 100.0 * (len(values) - 1)))]
+
+
+def login(client, statiki):
+    """ Log in a new user, through the OAuth flow of the stand-in GitHub. """
+
+    authorize = client.get('/login').headers['Location']
+    location = requests.get(authorize, allow_redirects=False).headers[
+        'Location'
+    ]
+    client.get(location[location.index('/authorized'):])
+
+    with client.session_transaction() as session:
+        user = statiki.User.get(session['user_id'])
+
+    return user.username
+
+
+def get_scenarios(github, travis, username):
+    """ Return the scenarios to run, as (name, function of i) pairs. """
+
+    github.add_repo(
+        '%s/blog' % username, {'.travis.yml': 'language: python\n'}
+    )
+    travis.add_repo('%s/blog' % username)
+
+    return [
+        ('create_repo_new', lambda i: (
+            '/create_repo', {'repo_name': 'site-%d' % i}
+        )),
+        ('create_repo_existing', lambda i: (
+            '/create_repo', {'repo_name': 'blog'}
+        )),
+        ('manage_known', lambda i: (
+            '/manage', {'full_name': '%s/blog' % username, 'data': ''}
+        )),
+    ]
+
+
+def run(statiki, github, travis, count):
+    """ Run all the scenarios, and return the results for each of them. """
+
+    client = statiki.app.test_client()
+    username = login(client, statiki)
+    results = {}
+
+    for name, get_request in get_scenarios(github, travis, username):
+        timings = []
+        calls = len(github.calls) + len(travis.calls)
+        queries = sum(statiki.DB_QUERIES.values.values())
+
+        for i in range(count):
+            path, data = get_request(i)
+            start = time.time()
+            response = client.post(path, data=data)
+            timings.append(time.time() - start)
+            assert response.status_code == 200, response.data
+
+        calls = len(github.calls) + len(travis.calls) - calls
+        queries = sum(statiki.DB_QUERIES.values.values()) - queries
+        results[name] = {
+            'p50': get_percentile(timings, 50),
+            'p95': get_percentile(timings, 95),
+            'upstream_calls': calls / float(count),
+            'db_queries': queries / float(count),
+        }
+
+    return results
+
+
+def print_results(results, baseline=None):
+    print '%-22s %9s %9s %9s %9s' % (
+        'scenario', 'p50 (ms)', 'p95 (ms)', 'upstream', 'queries'
+    )
+
+    for name, result in sorted(results.items()):
+        print '%-22s %9.1f %9.1f %9.1f %9.1f' % (
+            name, result['p50'] * 1000, result['p95'] * 1000,
+            result['upstream_calls'], result['db_queries']
+        )
+        old = (baseline or {}).get(name)
+        if old is not None:
+            print '%-22s %+8.0f%% %+8.0f%% %+9.1f %+9.1f' % (
+                '  vs. baseline',
+                (result['p50'] / old['p50'] - 1) * 100,
+                (result['p95'] / old['p95'] - 1) * 100,
+                result['upstream_calls'] - old['upstream_calls'],
+                result['db_queries'] - old['db_queries'],
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--output', help='File to save the results to.')
+    parser.add_argument('--compare', help='Results to compare against.')
+    args = parser.parse_args()
+
+    tempdir = tempfile.mkdtemp()
+    github = FakeGitHub(latency=args.latency)
+    travis = FakeTravis(github, latency=args.latency)
+
+    try:
+        with github, travis:
+            os.environ.update(get_environment(github, travis))
+            os.environ['DATABASE_URL'] = 'sqlite:///%s' % join(
+                tempdir, 'bench.db'
+            )
+            import statiki
+
+            statiki.init_db()
+            results = run(statiki, github, travis, args.requests)
+
+    finally:
+        shutil.rmtree(tempdir)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" Stand-in HTTP servers for the GitHub and Travis APIs used by Statiki.
+
+The servers implement just enough of the APIs for Statiki to work against
+them, with configurable latency, rate limits, failure injection and time
+taken by Travis to sync repositories from GitHub.
+
+    with FakeGitHub(latency=0.05) as github, FakeTravis(github) as travis:
+        github.add_repo('fred/blog')
+        with use_upstreams(github, travis):
+            ...
+
+"""
+
+# Standard library.
+import base64
+import BaseHTTPServer
+from contextlib import contextmanager
+import hashlib
+import json
+import random
+import re
+import SocketServer
+import threading
+import time
+from urllib import urlencode
+from urlparse import parse_qsl, urlparse
+
+# A public key, in the format returned by Travis.
+PUBLIC_KEY = """-----BEGIN RSA PUBLIC KEY-----
+MIGfMA0GCSqGSIb3DQEBAQUAA4GNADCBiQKBgQCq3R0oPfQyidFWrXearCGxLzmR
+lzsD/yexw+5DdRIw9J2jkLncO5lCPusVzOaOlN7JnYywfVnHN+6k7YCNtjpw+O8t
+9BGjy8wnRsX9B/jRljT320SEb6NFu5CTt+mfs8EAvg+yr9LQxEKcFclOtkr0baAz
+uwLJkiH9PHaHHXaLqwIDAQAB
+-----END RSA PUBLIC KEY-----
+"""
+
+
+class FakeUpstream(object):
+    """ A stand-in for an upstream service, served over HTTP in a thread.
+
+    Subclasses define ROUTES, a list of (method, path regex, handler name).
+    Handlers are called with the groups of the regex, and the query, headers
+    and body of the request as keyword arguments, and return a status, a
+    body (JSON-able, or a string) and optionally, a dict of headers.
+
+    """
+
+    ROUTES = []
+
+    def __init__(self, latency=0, rate_limit=None, failure_rate=0):
+        # Seconds added to the time taken for each response.
+        self.latency = latency
+        # Number of requests allowed, after which requests are refused.
+        self.rate_limit = rate_limit
+        # Fraction of requests that fail with a 500.
+        self.failure_rate = failure_rate
+        # (method, path) of all the requests handled.
+        self.calls = []
+        self.lock = threading.Lock()
+        self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def url(self):
+        return 'http://%s:%s' % self._server.server_address
+
+    def handle(self, method, path, query, headers, body):
+        """ Return the status, headers and content of the response. """
+
+        with self.lock:
+            self.calls.append((method, path))
+            count = len(self.calls)
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        response_headers = {}
+        if self.rate_limit is not None:
+            remaining = max(self.rate_limit - count, 0)
+            response_headers['X-RateLimit-Limit'] = str(self.rate_limit)
+            response_headers['X-RateLimit-Remaining'] = str(remaining)
+            if count > self.rate_limit:
+                body = {'message': 'API rate limit exceeded'}
+                return self._respond(403, body, response_headers)
+
+        if random.random() < self.failure_rate:
+            return self._respond(500, 'Injected failure', response_headers)
+
+        for route_method, pattern, name in self.ROUTES:
+            match = re.match(pattern + '$', path)
+            if route_method == method and match is not None:
+                result = getattr(self, name)(
+                    *match.groups(), query=query, headers=headers, body=body
+                )
+                status, content = result[:2]
+                if len(result) > 2:
+                    response_headers.update(result[2])
+                return self._respond(status, content, response_headers)
+
+        return self._respond(404, {'message': 'Not Found'}, response_headers)
+
+    def start(self):
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.upstream = self
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    #### Private protocol #####################################################
+
+    def _respond(self, status, content, headers):
+        if isinstance(content, basestring):
+            headers.setdefault('Content-Type', 'text/html; charset=utf-8')
+        else:
+            content = json.dumps(content)
+            headers['Content-Type'] = 'application/json; charset=utf-8'
+
+        return status, headers, content
+
+
+class FakeGitHub(FakeUpstream):
+    """ A stand-in for the GitHub site and API.
+
+    The site is served under /html, and OAuth logins create a new user each
+    time, whose token is 'token-<login>'.
+
+    """
+
+    ROUTES = [
+        ('GET', r'/html/login/oauth/authorize', 'authorize'),
+        ('POST', r'/html/login/oauth/access_token', 'access_token'),
+        ('GET', r'/html/([^/]+/[^/]+)', 'repo_page'),
+        ('GET', r'/status', 'status'),
+        ('GET', r'/user', 'current_user'),
+        ('GET', r'/users/([^/]+)', 'show_user'),
+        ('GET', r'/user/repos', 'list_repos'),
+        ('POST', r'/user/repos', 'create_repo'),
+        ('GET', r'/repos/([^/]+/[^/]+)/contents/(.+)', 'get_contents'),
+        ('PUT', r'/repos/([^/]+/[^/]+)/contents/(.+)', 'put_contents'),
+    ]
+
+    def __init__(self, **kwargs):
+        super(FakeGitHub, self).__init__(**kwargs)
+        self.users = {}
+        self.repos = {}
+
+    def add_repo(self, full_name, files=None):
+        """ Add a repository, with the given files, owned by a new user. """
+
+        owner, _ = full_name.split('/')
+        self.add_user(owner)
+        self.repos[full_name] = dict(files or {})
+
+    def add_user(self, login, type_='User'):
+        if login not in self.users:
+            self.users[login] = {
+                'login': login, 'id': len(self.users) + 1, 'type': type_
+            }
+        return self.users[login]
+
+    def get_repos(self, owner):
+        """ Return the names of the repositories owned by a user. """
+
+        return sorted(
+            name for name in self.repos if name.split('/')[0] == owner
+        )
+
+    #### Handlers #############################################################
+
+    def access_token(self, query, headers, body):
+        code = dict(parse_qsl(body)).get('code', '').strip('"')
+        token = urlencode({'access_token': 'token-%s' % code})
+        return 200, token + '&token_type=bearer'
+
+    def authorize(self, query, headers, body):
+        with self.lock:
+            user = self.add_user('user%d' % (len(self.users) + 1))
+        location = '%s?%s' % (
+            query['redirect_uri'], urlencode({'code': user['login']})
+        )
+        return 302, '', {'Location': location}
+
+    def create_repo(self, query, headers, body):
+        login = self._get_login(query, headers)
+        full_name = '%s/%s' % (login, json.loads(body)['name'])
+        if login is None or full_name in self.repos:
+            return 422, {'message': 'Validation Failed'}
+        self.add_repo(full_name)
+        return 201, {'full_name': full_name}
+
+    def current_user(self, query, headers, body):
+        login = self._get_login(query, headers)
+        if login is None:
+            return 401, {'message': 'Requires authentication'}
+        return 200, self.users[login]
+
+    def get_contents(self, full_name, path, query, headers, body):
+        content = self.repos.get(full_name, {}).get(path)
+        if content is None:
+            return 404, {'message': 'Not Found'}
+        return 200, {
+            'path': path,
+            'sha': hashlib.sha1(content).hexdigest(),
+            'content': base64.b64encode(content),
+        }
+
+    def list_repos(self, query, headers, body):
+        login = self._get_login(query, headers)
+        names = self.get_repos(login)
+        per_page = int(query.get('per_page', 30))
+        page = int(query.get('page', 1))
+        last = max((len(names) - 1) // per_page + 1, 1)
+        items = [
+            {'name': name.split('/')[1], 'full_name': name}
+            for name in names[(page - 1) * per_page:page * per_page]
+        ]
+        links = [
+            '<%s/user/repos?%s>; rel="%s"' % (
+                self.url, urlencode({'page': number, 'per_page': per_page}),
+                rel
+            )
+            for number, rel in [(page + 1, 'next'), (last, 'last')]
+            if page < last
+        ]
+        return 200, items, {'Link': ', '.join(links)} if links else {}
+
+    def put_contents(self, full_name, path, query, headers, body):
+        if full_name not in self.repos:
+            return 404, {'message': 'Not Found'}
+        payload = json.loads(body)
+        files = self.repos[full_name]
+        if path in files and 'sha' not in payload:
+            return 422, {'message': 'sha wasn\'t supplied.'}
+        status = 200 if path in files else 201
+        files[path] = base64.b64decode(payload['content'])
+        return status, {'content': {'path': path}}
+
+    def repo_page(self, full_name, query, headers, body):
+        if full_name not in self.repos:
+            return 404, 'Not Found'
+        return 200, '<html>%s</html>' % full_name
+
+    def show_user(self, login, query, headers, body):
+        return 200, self.add_user(login)
+
+    def status(self, query, headers, body):
+        return 200, (
+            '<div class="status" id="message" data-status="good">'
+            'All systems operational</div>'
+        )
+
+    #### Private protocol #####################################################
+
+    def _get_login(self, query, headers):
+        """ Return the login of the user, given their token. """
+
+        token = query.get('access_token') or (
+            headers.get('Authorization', '').split(' ')[-1]
+        )
+        login = token[len('token-'):] if token.startswith('token-') else None
+
+        return login if login in self.users else None
+
+
+class FakeTravis(FakeUpstream):
+    """ A stand-in for the Travis API, syncing repositories from a FakeGitHub.
+
+    """
+
+    ROUTES = [
+        ('POST', r'/auth/github', 'auth'),
+        ('GET', r'/hooks', 'hooks'),
+        ('PUT', r'/hooks/(\d+)', 'enable_hook'),
+        ('GET', r'/repos/([^/]+/[^/]+)', 'repo'),
+        ('GET', r'/status', 'status'),
+        ('GET', r'/users/', 'current_user'),
+        ('POST', r'/users/sync', 'sync'),
+    ]
+
+    def __init__(self, github, sync_duration=0, **kwargs):
+        super(FakeTravis, self).__init__(**kwargs)
+        self.github = github
+        # Seconds taken by a sync to finish.
+        self.sync_duration = sync_duration
+        self.repos = {}
+        self._syncs = {}
+
+    def add_repo(self, full_name, active=False):
+        """ Add a repository to Travis, as if synced from GitHub. """
+
+        if full_name not in self.repos:
+            owner, name = full_name.split('/')
+            self.repos[full_name] = {
+                'id': len(self.repos) + 1,
+                'owner_name': owner,
+                'name': name,
+                'description': '',
+                'active': active,
+                'private': False,
+                'admin': True,
+            }
+
+        return self.repos[full_name]
+
+    #### Handlers #############################################################
+
+    def auth(self, query, headers, body):
+        github_token = dict(parse_qsl(body)).get('github_token', '')
+        if self.github._get_login({'access_token': github_token}, {}) is None:
+            return 403, {'error': 'not a Travis user'}
+        return 200, {'access_token': 'travis-%s' % github_token}
+
+    def enable_hook(self, repo_id, query, headers, body):
+        login = self._get_login(headers)
+        for repo in self.repos.values():
+            if repo['id'] == int(repo_id) and repo['owner_name'] == login:
+                repo['active'] = json.loads(body)['hook']['active']
+                return 200, {'result': True}
+        return 404, {'file': 'not found'}
+
+    def hooks(self, query, headers, body):
+        login = self._get_login(headers)
+        if login is None:
+            return 401, 'Unauthorized'
+        self._finish_sync(login)
+        return 200, [
+            repo for _, repo in sorted(self.repos.items())
+            if repo['owner_name'] == login
+        ]
+
+    def repo(self, full_name, query, headers, body):
+        if full_name not in self.repos:
+            return 404, {'file': 'not found'}
+        return 200, dict(
+            self.repos[full_name], slug=full_name, public_key=PUBLIC_KEY
+        )
+
+    def status(self, query, headers, body):
+        return 200, (
+            '<div class="page-status status-none">'
+            '<span class="status">All Systems Operational</span></div>'
+        )
+
+    def sync(self, query, headers, body):
+        login = self._get_login(headers)
+        if login is None:
+            return 401, 'Unauthorized'
+        self._syncs.setdefault(login, time.time())
+        return 200, {'result': True}
+
+    def current_user(self, query, headers, body):
+        login = self._get_login(headers)
+        if login is None:
+            return 401, 'Unauthorized'
+        return 200, {
+            'login': login,
+            'is_syncing': not self._finish_sync(login),
+            'synced_at': '2014-05-01T10:00:00Z',
+        }
+
+    #### Private protocol #####################################################
+
+    def _finish_sync(self, login):
+        """ Finish the sync of a user if it is done, and return True if so. """
+
+        started = self._syncs.get(login)
+        if started is not None:
+            if time.time() - started < self.sync_duration:
+                return False
+            for full_name in self.github.get_repos(login):
+                self.add_repo(full_name)
+            del self._syncs[login]
+
+        return True
+
+    def _get_login(self, headers):
+        token = headers.get('Authorization', '').split(' ')[-1]
+        prefix = 'travis-token-'
+        if not token.startswith(prefix):
+            return None
+        return self.github._get_login(
+            {'access_token': token[len('travis-'):]}, {}
+        )
+
+
+def get_environment(github, travis):
+    """ Return the environment variables to configure Statiki with. """
+
+    return {
+        'GITHUB_URL': '%s/html' % github.url,
+        'GITHUB_API_URL': github.url,
+        'GITHUB_STATUS_URL': '%s/status' % github.url,
+        'TRAVIS_API_URL': travis.url,
+        'TRAVIS_STATUS_URL': '%s/status' % travis.url,
+    }
+
+
+@contextmanager
+def use_upstreams(github, travis):
+    """ Point the helper modules at the given stand-ins, in this process. """
+
+    import github_utils
+    import travis_utils
+
+    environment = get_environment(github, travis)
+    settings = [
+        (github_utils, 'GITHUB_URL', environment['GITHUB_URL']),
+        (github_utils, 'API_URL', environment['GITHUB_API_URL']),
+        (github_utils, 'STATUS_URL', environment['GITHUB_STATUS_URL']),
+        (travis_utils, 'API_URL', environment['TRAVIS_API_URL']),
+        (travis_utils, 'STATUS_URL', environment['TRAVIS_STATUS_URL']),
+    ]
+    old = [getattr(module, name) for module, name, _ in settings]
+
+    for module, name, value in settings:
+        setattr(module, name, value)
+
+    try:
+        yield
+
+    finally:
+        for (module, name, _), value in zip(settings, old):
+            setattr(module, name, value)
+
+
+#### Private protocol #########################################################
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._handle()
+
+    do_POST = do_PUT = do_DELETE = do_GET
+
+    def log_message(self, *args):
+        pass
+
+    def _handle(self):
+        parsed = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length > 0 else ''
+
+        status, headers, content = self.server.upstream.handle(
+            self.command, parsed.path, dict(parse_qsl(parsed.query)),
+            self.headers, body
+        )
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+    request_queue_size = 128
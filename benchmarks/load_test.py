@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" Load test Statiki running on gunicorn, against stand-in GitHub and Travis.
+
+Starts gunicorn with the command in the Procfile, pointed at stand-in
+upstreams, and ramps up simulated users, each of whom logs in and then
+repeatedly creates a new repository and manages it.  Since the repositories
+are new, each call to manage waits for Travis to sync.  Anonymous visitors,
+who only read the index and FAQ pages, can be added too.  Reports the
+throughput, the latency percentiles of each step, and the saturation of the
+workers, i.e., the fraction of their capacity in use, as read from the
+in-progress gauge on /metrics.
+
+Each of the given worker classes is run in turn, to compare them.
+
+Usage:
+    python benchmarks/load_test.py [--users N] [--visitors N]
+                                   [--ramp SECONDS]
+                                   [--duration SECONDS] [--workers N]
+                                   [--threads N]
+                                   [--worker-class CLASS [CLASS ...]]
+                                   [--latency SECONDS] [--sync SECONDS]
+                                   [--shared-cache] [--output FILE]
+
+"""
+
+# Standard library.
+import argparse
+import json
+import os
+from os.path import abspath, dirname, join
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# 3rd party library.
+import requests
+
+# Local library.
+HERE = dirname(abspath(__file__))
+ROOT = dirname(HERE)
+sys.path.insert(0, HERE)
+from fake_upstreams import FakeGitHub, FakeTravis, get_environment
+
+STEPS = ('index', 'faq', 'login', 'create_repo', 'manage')
+IN_PROGRESS = 'statiki_requests_in_progress'
+
+
+class SimulatedUser(threading.Thread):
+    """ A user who logs in, and then creates and manages sites until stopped.
+
+    """
+
+    def __init__(self, url, stop_at, record):
+        super(SimulatedUser, self).__init__()
+        self.daemon = True
+        self.url = url
+        self.stop_at = stop_at
+        self.record = record
+        self.session = requests.Session()
+
+    def run(self):
+        if self._step('login', 'get', '/login') is None:
+            return
+
+        count = 0
+        while time.time() < self.stop_at:
+            count += 1
+            data = {'repo_name': 'site-%d' % count}
+            response = self._step('create_repo', 'post', '/create_repo', data)
+            if response is not None:
+                data = {'full_name': response.json()['full_name'], 'data': ''}
+                self._step('manage', 'post', '/manage', data)
+
+    #### Private protocol #####################################################
+
+    def _step(self, name, method, path, data=None):
+        """ Make a request, record it and return the response if it is OK. """
+
+        start = time.time()
+        try:
+            response = getattr(self.session, method)(
+                self.url + path, data=data, timeout=300
+            )
+        except requests.RequestException:
+            response = None
+
+        ok = response is not None and response.status_code == 200
+        self.record(name, start, time.time() - start, ok)
+
+        return response if ok else None
+
+
+class SimulatedVisitor(SimulatedUser):
+    """ An anonymous visitor, who reads the index and FAQ until stopped. """
+
+    def run(self):
+        while time.time() < self.stop_at:
+            self._step('index', 'get', '/')
+            self._step('faq', 'get', '/faq')
+
+
+class SaturationSampler(threading.Thread):
+    """ Periodically reads the requests in progress, from /metrics. """
+
+    def __init__(self, url, interval=0.5):
+        super(SaturationSampler, self).__init__()
+        self.daemon = True
+        self.url = url
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                response = requests.get(
+                    '%s/metrics' % self.url, timeout=self.interval * 4
+                )
+                in_progress = get_in_progress(response.text)
+            except requests.RequestException:
+                # No worker free to answer, even for metrics.
+                in_progress = None
+            self.samples.append(in_progress)
+            self.stopped.wait(self.interval)
+
+
+def get_free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def get_gunicorn_command(port, worker_class, threads):
+    """ Return the command to start the web process, from the Procfile. """
+
+    with open(join(ROOT, 'Procfile')) as f:
+        command = [
+            line.split(':', 1)[1].strip() for line in f
+            if line.startswith('web:')
+        ][0]
+
+    return '%s --bind 127.0.0.1:%d --worker-class %s --threads %d' % (
+        command, port, worker_class, threads
+    )
+
+
+def get_in_progress(text):
+    """ Return the requests in progress, excluding the one for metrics. """
+
+    for line in text.splitlines():
+        if line.startswith(IN_PROGRESS + ' '):
+            return max(float(line.split()[-1]) - 1, 0)
+
+    return 0
+
+
+def get_percentile(values, percent):
+    values = sorted(values)
+    return values[int(round(percent / 100.0 * (len(values) - 1)))]
+
+
+def get_summary(records, samples, capacity, elapsed):
+    """ Return the throughput, latencies and saturation of a run. """
+
+    summary = {
+        'requests': len(records),
+        'errors': len([ok for _, _, _, ok in records if not ok]),
+        'throughput': len([ok for _, _, _, ok in records if ok]) / elapsed,
+    }
+
+    for step in STEPS:
+        durations = [
+            duration for name, _, duration, ok in records
+            if name == step and ok
+        ]
+        if len(durations) > 0:
+            summary[step] = dict(
+                ('p%d' % percent, get_percentile(durations, percent))
+                for percent in (50, 95, 99)
+            )
+
+    # Samples that timed out are counted as fully saturated.
+    saturation = [
+        capacity if sample is None else min(sample, capacity)
+        for sample in samples
+    ]
+    if len(saturation) > 0:
+        summary['saturation'] = {
+            'mean': sum(saturation) / len(saturation) / capacity,
+            'max': max(saturation) / capacity,
+        }
+
+    return summary
+
+
+def run(worker_class, args, environment):
+    """ Run a load test with the given worker class, and return a summary. """
+
+    port = get_free_port()
+    url = 'http://127.0.0.1:%d' % port
+    command = get_gunicorn_command(port, worker_class, args.threads)
+    tempdir = tempfile.mkdtemp()
+    environment = dict(
+        environment,
+        DATABASE_URL=args.database_url or 'sqlite:///%s' % join(
+            tempdir, 'load.db'
+        ),
+        METRICS_DIR=join(tempdir, 'metrics'),
+        WEB_CONCURRENCY=str(args.workers),
+    )
+    if args.shared_cache:
+        environment['CACHE_PATH'] = join(tempdir, 'cache.db')
+
+    subprocess.check_call(
+        [sys.executable, 'statiki.py', 'initdb'],
+        cwd=ROOT, env=environment
+    )
+    server = subprocess.Popen(
+        command, shell=True, cwd=ROOT, env=environment, preexec_fn=os.setsid
+    )
+
+    try:
+        wait_for_server(url)
+        records = []
+        lock = threading.Lock()
+
+        def record(*entry):
+            with lock:
+                records.append(entry)
+
+        sampler = SaturationSampler(url)
+        sampler.start()
+        start = time.time()
+        stop_at = start + args.ramp + args.duration
+        users = []
+        kinds = (
+            [SimulatedUser] * args.users + [SimulatedVisitor] * args.visitors
+        )
+        for kind in kinds:
+            time.sleep(float(args.ramp) / len(kinds))
+            user = kind(url, stop_at, record)
+            user.start()
+            users.append(user)
+
+        for user in users:
+            user.join()
+        elapsed = time.time() - start
+        sampler.stopped.set()
+        sampler.join()
+
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+        shutil.rmtree(tempdir)
+
+    capacity = float(args.workers * args.threads)
+    return get_summary(records, sampler.samples, capacity, elapsed)
+
+
+def print_summaries(summaries):
+    names = sorted(summaries)
+    row = '%-24s' + ' %12s' * len(names)
+    print row % tuple([''] + names)
+
+    def print_row(label, get):
+        values = []
+        for name in names:
+            try:
+                values.append(get(summaries[name]))
+            except KeyError:
+                values.append('-')
+        print row % tuple([label] + values)
+
+    print_row('requests', lambda s: s['requests'])
+    print_row('errors', lambda s: s['errors'])
+    print_row('throughput (req/s)', lambda s: '%.2f' % s['throughput'])
+    for step in STEPS:
+        for percent in ('p50', 'p95', 'p99'):
+            print_row(
+                '%s %s (ms)' % (step, percent),
+                lambda s: '%.0f' % (s[step][percent] * 1000)
+            )
+    print_row(
+        'saturation mean', lambda s: '%.0f%%' % (s['saturation']['mean'] * 100)
+    )
+    print_row(
+        'saturation max', lambda s: '%.0f%%' % (s['saturation']['max'] * 100)
+    )
+
+
+def wait_for_server(url, timeout=30):
+    until = time.time() + timeout
+    while time.time() < until:
+        try:
+            requests.get('%s/faq' % url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+
+    raise RuntimeError('Server at %s did not start' % url)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--visitors', type=int, default=0,
+                        help='Anonymous visitors, reading pages.')
+    parser.add_argument('--ramp', type=float, default=10,
+                        help='Seconds over which users are started.')
+    parser.add_argument('--duration', type=float, default=30,
+                        help='Seconds to run for, after the ramp up.')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--worker-class', nargs='+', default=['sync'],
+                        help='sync, gthread, gevent, eventlet, ...')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='Seconds added to each upstream request.')
+    parser.add_argument('--sync', type=float, default=1,
+                        help='Seconds taken by Travis to sync.')
+    parser.add_argument('--database-url', help='Defaults to a new SQLite db.')
+    parser.add_argument('--shared-cache', action='store_true',
+                        help='Share caches across workers, in SQLite.')
+    parser.add_argument('--output', help='File to save the results to.')
+    args = parser.parse_args()
+
+    github = FakeGitHub(latency=args.latency)
+    travis = FakeTravis(github, sync_duration=args.sync, latency=args.latency)
+    path = os.pathsep.join([dirname(sys.executable), os.environ['PATH']])
+    summaries = {}
+
+    with github, travis:
+        environment = dict(
+            os.environ, PATH=path, **get_environment(github, travis)
+        )
+        for worker_class in args.worker_class:
+            summaries[worker_class] = run(worker_class, args, environment)
+
+    print_summaries(summaries)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summaries, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" Measure the memory used by the gunicorn workers, with and without preload.
+
+Starts gunicorn with the command in the Procfile, against stand-in
+upstreams, makes a few requests so that the workers load what they need,
+and reports the RSS of each worker along with how much of it is shared with
+the other processes, and how much is private.  PSS (proportional set size)
+is each process' fair share of the memory it uses, and adds up to the memory
+actually used.  Reads /proc, so works only on Linux.
+
+Usage:
+    python benchmarks/measure_memory.py [--workers N] [--requests N]
+
+"""
+
+# Standard library.
+import argparse
+import os
+from os.path import abspath, dirname, join
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+# 3rd party library.
+import requests
+
+# Local library.
+HERE = dirname(abspath(__file__))
+ROOT = dirname(HERE)
+sys.path.insert(0, HERE)
+from fake_upstreams import FakeGitHub, FakeTravis, get_environment
+from load_test import get_free_port, get_gunicorn_command, wait_for_server
+
+FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean',
+          'Private_Dirty')
+PATHS = ('/', '/faq', '/status', '/metrics')
+
+
+def get_children(pid):
+    """ Return the pids of the child processes of a process. """
+
+    children = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % name) as f:
+                # The command may have spaces, so split after it.
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (IOError, IndexError):
+            continue
+        if ppid == pid:
+            children.append(int(name))
+
+    return sorted(children)
+
+
+def get_memory(pid):
+    """ Return the memory used by a process, in kB, by field of smaps. """
+
+    memory = dict((field, 0) for field in FIELDS)
+    with open('/proc/%d/smaps' % pid) as f:
+        for line in f:
+            parts = line.split()
+            field = parts[0].rstrip(':')
+            if field in memory:
+                memory[field] += int(parts[1])
+
+    return memory
+
+
+def measure(preload, args, environment):
+    """ Return the memory used by the master and each of the workers. """
+
+    port = get_free_port()
+    url = 'http://127.0.0.1:%d' % port
+    tempdir = tempfile.mkdtemp()
+    environment = dict(
+        environment,
+        DATABASE_URL='sqlite:///%s' % join(tempdir, 'memory.db'),
+        WEB_CONCURRENCY=str(args.workers),
+    )
+    if preload:
+        environment['PRELOAD'] = '1'
+    else:
+        environment.pop('PRELOAD', None)
+
+    subprocess.check_call(
+        [sys.executable, 'statiki.py', 'initdb'], cwd=ROOT, env=environment
+    )
+    command = 'exec %s' % get_gunicorn_command(port, 'sync', 1)
+    server = subprocess.Popen(command, shell=True, cwd=ROOT, env=environment)
+
+    try:
+        wait_for_server(url)
+        for _ in range(args.requests):
+            for path in PATHS:
+                requests.get(url + path)
+        time.sleep(1)
+        workers = get_children(server.pid)
+        memory = [('master', get_memory(server.pid))] + [
+            ('worker %d' % pid, get_memory(pid)) for pid in workers
+        ]
+
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+        shutil.rmtree(tempdir)
+
+    return memory
+
+
+def print_memory(title, memory):
+    print title
+    print '    %-14s %8s %8s %8s %8s' % ('', 'RSS', 'PSS', 'shared', 'private')
+    for name, fields in memory:
+        print '    %-14s %8d %8d %8d %8d' % (
+            name, fields['Rss'], fields['Pss'],
+            fields['Shared_Clean'] + fields['Shared_Dirty'],
+            fields['Private_Clean'] + fields['Private_Dirty'],
+        )
+    print '    %-14s %8s %8d  (kB)' % (
+        'total', '', sum(fields['Pss'] for _, fields in memory)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=20,
+                        help='Requests to each page, before measuring.')
+    args = parser.parse_args()
+
+    github = FakeGitHub()
+    travis = FakeTravis(github)
+    path = os.pathsep.join([dirname(sys.executable), os.environ['PATH']])
+
+    with github, travis:
+        environment = dict(
+            os.environ, PATH=path, **get_environment(github, travis)
+        )
+        for preload in (False, True):
+            memory = measure(preload, args, environment)
+            print_memory('preload' if preload else 'no preload', memory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" Caches used to avoid repeating work across requests.
+
+Data from upstream services is kept in a Cache, which has an LRU tier in
+each process and, when configured, a tier in a SQLite database shared by
+all the processes on the machine, so that the gunicorn workers don't each
+fetch and hold their own copy.
+
+"""
+
+# Standard library
+from collections import OrderedDict
+import cPickle as pickle
+import hashlib
+import logging
+import os
+import threading
+import time
+
+# Local library
+import metrics
+
+LOOKUPS = metrics.Counter(
+    'statiki_cache_lookups_total',
+    'Lookups in the caches of upstream data, by cache and result.',
+    labels=('cache', 'result'),
+)
+
+# With a shared tier, seconds for which values are kept in the local tier,
+# so that invalidations by other processes are seen soon.
+LOCAL_TTL = 10
+# Entries written to the shared tier between removals of old entries.
+CLEANUP_INTERVAL = 100
+
+logger = logging.getLogger('statiki.cache')
+
+_caches = []
+_state = {'shared': None}
+
+
+def configure(path):
+    """ Share the caches across processes, in a SQLite database at path.
+
+    Caches are kept only in each process, if path is empty.
+
+    """
+
+    _state['shared'] = SQLiteStore(path) if path else None
+
+    for cache in _caches:
+        cache.clear_local()
+
+
+def invalidate(namespace):
+    """ Drop the values in the namespace, from all the caches. """
+
+    for cache in _caches:
+        cache.invalidate(namespace)
+
+
+def repo_namespace(full_name):
+    """ Return the namespace for values about a repository. """
+
+    return 'repo:%s' % full_name.lower()
+
+
+def token_namespace(token):
+    """ Return the namespace for values about the user with a token. """
+
+    return 'token:%s' % token
+
+
+class Cache(object):
+    """ Values by key, kept in an LRU tier and optionally, a shared tier.
+
+    Values expire after ttl seconds, if given, and may be put in a
+    namespace, say of a user or a repository, to be dropped together.
+    Values must be picklable, to be kept in the shared tier.  Caches of
+    secrets, like access tokens, are created with shared=False so that
+    their values are kept only in memory, and never written to disk.
+
+    """
+
+    def __init__(self, name, maxsize=128, ttl=None, shared=True):
+        self.name = name
+        self.ttl = ttl
+        self.shared = shared
+        self._local = LRUCache(maxsize)
+        _caches.append(self)
+
+    def __len__(self):
+        return len(self._local)
+
+    def clear(self):
+        self._local.clear()
+        shared = self._get_shared()
+        if shared is not None:
+            shared.clear(self.name)
+
+    def clear_local(self):
+        """ Drop the values kept in this process. """
+
+        self._local.clear()
+
+    def delete(self, key):
+        self._local.delete(key)
+        shared = self._get_shared()
+        if shared is not None:
+            shared.delete(self.name, key)
+
+    def get(self, key, default=None):
+        now = time.time()
+        entry = self._local.get(key)
+        result = 'hit'
+
+        if entry is None or _is_expired(entry[1], now):
+            shared = self._get_shared()
+            entry = shared.get(self.name, key) if shared is not None else None
+            result = 'shared_hit'
+            if entry is None or _is_expired(entry[1], now):
+                entry = None
+                result = 'miss'
+            else:
+                self._set_local(key, entry, now)
+
+        LOOKUPS.inc(cache=self.name, result=result)
+
+        return entry[0] if entry is not None else default
+
+    def invalidate(self, namespace):
+        """ Drop the values in the namespace. """
+
+        namespace = _hash(namespace)
+        for key, entry in self._local.items():
+            if entry[2] == namespace:
+                self._local.delete(key)
+
+        shared = self._get_shared()
+        if shared is not None:
+            shared.invalidate(self.name, namespace)
+
+    def set(self, key, value, namespace=None, ttl=None):
+        now = time.time()
+        ttl = ttl or self.ttl
+        entry = (
+            value,
+            now + ttl if ttl else None,
+            _hash(namespace) if namespace is not None else None,
+        )
+        self._set_local(key, entry, now)
+
+        shared = self._get_shared()
+        if shared is not None:
+            shared.set(self.name, key, entry)
+
+    def stats(self):
+        """ Return the number of lookups, by result, and the local size. """
+
+        stats = dict(
+            (result, LOOKUPS.get(cache=self.name, result=result))
+            for result in ('hit', 'shared_hit', 'miss')
+        )
+        stats['size'] = len(self)
+
+        return stats
+
+    #### Private protocol #####################################################
+
+    def _get_shared(self):
+        """ Return the shared tier, or None if values are kept locally. """
+
+        return _state['shared'] if self.shared else None
+
+    def _set_local(self, key, entry, now):
+        # Keep only briefly, if other processes may change the value.
+        if self._get_shared() is not None:
+            value, expires, namespace = entry
+            local_expires = now + LOCAL_TTL
+            if expires is None or expires > local_expires:
+                entry = (value, local_expires, namespace)
+
+        self._local.set(key, entry)
+
+
+class PageCache(object):
+    """ Rendered pages, along with their strong ETags, by key. """
+
+    def __init__(self):
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+    def get(self, key):
+        """ Return the (body, etag) of the page for the key, if cached. """
+
+        return self._pages.get(key)
+
+    def set(self, key, body):
+        """ Cache the body of a page, and return it along with its etag. """
+
+        page = (body, hashlib.sha1(body).hexdigest())
+        with self._lock:
+            self._pages[key] = page
+
+        return page
+
+
+class LRUCache(object):
+    """ A mapping of at most maxsize items, dropping the least recently used.
+
+    Lookups in caches with a name are counted, by result, in the metrics.
+
+    """
+
+    def __init__(self, maxsize=128, name=None):
+        self.maxsize = maxsize
+        self.name = name
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def items(self):
+        """ Return a list of the (key, value) pairs, least recent first. """
+
+        with self._lock:
+            return list(self._items.items())
+
+    def get(self, key, default=None):
+        with self._lock:
+            hit = key in self._items
+            if hit:
+                value = self._items.pop(key)
+                self._items[key] = value
+
+        if self.name is not None:
+            LOOKUPS.inc(cache=self.name, result='hit' if hit else 'miss')
+
+        return value if hit else default
+
+    def set(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+
+class SQLiteStore(object):
+    """ A tier of caches, in a SQLite database shared by processes.
+
+    The database uses write-ahead logging, so that readers and the writer
+    don't block each other.  Keys and namespaces are stored hashed, so that
+    tokens in them aren't written to disk; values are stored as they are,
+    so caches of secrets must not use this tier.  Holds about maxsize entries,
+    dropping the oldest ones.  Errors are logged and treated as misses, so
+    that a problem with the cache never fails a request.
+
+    """
+
+    def __init__(self, path, maxsize=10000):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+
+    def clear(self, cache):
+        self._execute('DELETE FROM entries WHERE cache = ?', (cache,))
+
+    def delete(self, cache, key):
+        self._execute(
+            'DELETE FROM entries WHERE key = ?', (_hash((cache, key)),)
+        )
+
+    def get(self, cache, key):
+        """ Return the (value, expires, namespace) for the key, or None. """
+
+        rows = self._execute(
+            'SELECT value, expires, namespace FROM entries WHERE key = ?',
+            (_hash((cache, key)),)
+        )
+        if not rows:
+            return None
+
+        value, expires, namespace = rows[0]
+
+        return pickle.loads(str(value)), expires, namespace
+
+    def invalidate(self, cache, namespace):
+        self._execute(
+            'DELETE FROM entries WHERE cache = ? AND namespace = ?',
+            (cache, namespace)
+        )
+
+    def set(self, cache, key, entry):
+        value, expires, namespace = entry
+        self._execute(
+            'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)', (
+                _hash((cache, key)), cache, namespace,
+                buffer(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)),
+                expires, time.time()
+            )
+        )
+
+        self._local.writes = getattr(self._local, 'writes', 0) + 1
+        if self._local.writes % CLEANUP_INTERVAL == 0:
+            self._cleanup()
+
+    #### Private protocol #####################################################
+
+    def _cleanup(self):
+        """ Remove expired entries, and the oldest ones beyond maxsize. """
+
+        self._execute(
+            'DELETE FROM entries WHERE expires < ?', (time.time(),)
+        )
+        self._execute(
+            'DELETE FROM entries WHERE key IN ('
+            'SELECT key FROM entries ORDER BY stored DESC LIMIT -1 OFFSET ?)',
+            (self.maxsize,)
+        )
+
+    def _connect(self):
+        """ Return a connection for this thread, in this process. """
+
+        import sqlite3
+
+        if getattr(self._local, 'pid', None) != os.getpid():
+            if not os.path.exists(self.path):
+                # Only readable by us, since the values are data of users.
+                os.close(os.open(self.path, os.O_CREAT | os.O_WRONLY, 0600))
+            connection = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, cache TEXT, namespace TEXT, '
+                'value BLOB, expires REAL, stored REAL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS entries_namespace '
+                'ON entries (cache, namespace)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS entries_stored ON entries (stored)'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+
+        return self._local.connection
+
+    def _execute(self, query, parameters):
+        """ Run a query, and return the rows, or None if it failed. """
+
+        import sqlite3
+
+        try:
+            return self._connect().execute(query, parameters).fetchall()
+        except (OSError, sqlite3.Error):
+            logger.warning('Cache query failed: %s', query, exc_info=True)
+            return None
+
+
+#### Private protocol #########################################################
+
+def _hash(value):
+    return hashlib.sha1(repr(value)).hexdigest()
+
+
+def _is_expired(expires, now):
+    return expires is not None and expires <= now
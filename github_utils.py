@@ -10,8 +10,29 @@ import base64
 import json
 import re
 
-# 3rd party library
-import requests
+# Local library
+import cache
+import http_utils
+import tracing
+
+# Base URLs of the GitHub site, API and status page.
+GITHUB_URL = 'https://github.com'
+API_URL = 'https://api.github.com'
+STATUS_URL = 'https://status.github.com'
+
+STATUS_RE = re.compile('(<div.*?id="message".*>(.|\s)*?</div>)')
+
+# Full names of the repositories of users, by token.
+_repos = cache.Cache('github_repos', 256, ttl=10 * 60)
+# The status of GitHub, as shown on the status page.
+_status = cache.Cache('github_status', 1, ttl=60)
+
+
+def clear_caches():
+    """ Forget all the data cached from GitHub. """
+
+    for cache_ in (_repos, _status):
+        cache_.clear()
 
 
 def is_user_pages(full_name):
@@ -25,10 +46,11 @@ def is_user_pages(full_name):
     )
 
 
+@tracing.traced
 def is_valid_repository(full_name):
     """ Return True if such a repo exists on GitHub. """
 
-    response = requests.get('https://github.com/%s' % full_name)
+    response = http_utils.get('%s/%s' % (GITHUB_URL, full_name))
     return response.status_code == 200
 
 
@@ -40,23 +62,88 @@ def get_user_and_repo(full_name, token):
     """
 
     user, name = full_name.split('/')
-    url = 'https://api.github.com/users/%s' % user
+    url = '%s/users/%s' % (API_URL, user)
     headers = get_header(token)
 
-    response = requests.get(url, headers=headers)
+    response = http_utils.get(url, headers=headers)
 
     user_type = response.json()['type']
 
     return user, user_type, name
 
 
+def get_file_content(full_name, path, token, ref=None):
+    """ Return the content of a file in a repository, or None. """
+
+    url = '%s/repos/%s/contents/%s' % (API_URL, full_name, path)
+    params = {'ref': ref} if ref is not None else None
+
+    response = http_utils.get(url, headers=get_header(token), params=params)
+
+    if response.status_code == 200:
+        content = base64.b64decode(response.json()['content'])
+
+    else:
+        content = None
+
+    return content
+
+
+def get_rate_limit_remaining(response):
+    """ Return the requests left in the rate limit, as told by a response.
+
+    """
+
+    remaining = response.headers.get('X-RateLimit-Remaining')
+
+    return int(remaining) if remaining is not None else float('inf')
+
+
+@tracing.traced
+def get_repos(token, reserve=0, refresh=False):
+    """ Return the full names of the repositories of the user, or None.
+
+    All the pages of the listing are fetched, several at a time, and the
+    result is cached until asked to refresh.  Gives up, returning None,
+    rather than use up the last `reserve` requests of the rate limit.
+
+    """
+
+    repos = None if refresh else _repos.get(token)
+    if repos is not None:
+        return repos
+
+    url = '%s/user/repos' % API_URL
+    headers = get_header(token)
+    params = {'per_page': 100}
+    repos = []
+
+    pages = http_utils.iter_pages(url, headers=headers, params=params)
+    for response in pages:
+        if response.status_code != 200:
+            return None
+
+        repos.extend(repo['full_name'] for repo in response.json())
+
+        if ('next' in response.links
+                and get_rate_limit_remaining(response) < reserve):
+            return None
+
+    _repos.set(token, repos, namespace=cache.token_namespace(token))
+
+    return repos
+
+
 def get_status():
-    """ Return the server status of GitHub. """
+    """ Return the server status of GitHub; cached for a minute. """
 
-    response = requests.get('https://status.github.com')
-    pattern  = '(<div.*?id="message".*>(.|\s)*?</div>)'
+    status = _status.get(STATUS_URL)
+    if status is None:
+        response = http_utils.get(STATUS_URL)
+        status = STATUS_RE.findall(response.text)[0][0].strip()
+        _status.set(STATUS_URL, status)
 
-    return re.findall(pattern, response.text)[0][0].strip()
+    return status
 
 
 def get_header(token):
@@ -68,15 +155,16 @@ def get_header(token):
     }
 
 
+@tracing.traced
 def exists(full_name, path, token):
     """ Return the sha of a path in a repo, if it exists; else None. """
 
     headers = get_header(token)
 
     url = 'repos/%s/contents/%s' % (full_name, path)
-    url = 'https://api.github.com/' + url
+    url = '%s/%s' % (API_URL, url)
 
-    response = requests.get(url, headers=headers)
+    response = http_utils.get(url, headers=headers)
 
     if response.status_code == 200:
         sha = json.loads(response.text)['sha']
@@ -87,6 +175,7 @@ def exists(full_name, path, token):
     return sha
 
 
+@tracing.traced
 def create_new_repository(full_name, token):
     """ Create a new repository given the name and a token.
 
@@ -98,7 +187,7 @@ def create_new_repository(full_name, token):
         full_name, token
     )
 
-    url = 'https://api.github.com/user/repos'
+    url = '%s/user/repos' % API_URL
     headers = get_header(token)
     homepage = (
         name if is_user_pages(full_name)
@@ -114,13 +203,14 @@ def create_new_repository(full_name, token):
         'has_downloads': False,
     }
 
-    response = requests.post(
+    response = http_utils.post(
         url, data=json.dumps(payload), headers=headers
     )
 
     return response.status_code == 201
 
 
+@tracing.traced
 def commit(path, content, repo, token, extra_payload=None):
     """ Commit the given content to the given path in a repository. """
 
@@ -140,9 +230,9 @@ def commit(path, content, repo, token, extra_payload=None):
     if sha is not None:
         payload['sha'] = sha
 
-    url = 'https://api.github.com/repos/%s/contents/%s' % (repo, path)
+    url = '%s/repos/%s/contents/%s' % (API_URL, repo, path)
 
-    response = requests.put(
+    response = http_utils.put(
         url, data=json.dumps(payload), headers=headers
     )
 
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" Configuration for gunicorn.
+
+Set PRELOAD to load the app once in the master, before forking the workers,
+so that they share the memory used by it, copy-on-write.
+
+"""
+
+import os
+
+preload_app = bool(os.environ.get('PRELOAD'))
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        import statiki
+
+        statiki.warm_up()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        import statiki
+
+        statiki.after_fork()
@@ -0,0 +1,548 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" A thin layer over requests, used for all calls to GitHub and Travis.
+
+Requests can optionally be recorded to a file, as JSON lines, with tokens
+and secure values redacted.  A recorded file can be replayed instead of
+making real requests, optionally taking as long as the recorded requests.
+
+"""
+
+# Standard library
+import base64
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from io import BytesIO
+from itertools import islice
+import json
+import re
+import threading
+import time
+from urllib import urlencode
+from urlparse import parse_qsl, urlparse, urlunparse
+
+# Local library
+import metrics
+import tracing
+
+UPSTREAM_LATENCY = metrics.Histogram(
+    'statiki_upstream_request_seconds',
+    'Latency of requests to upstream services.',
+    labels=('host', 'method'),
+)
+UPSTREAM_REQUESTS = metrics.Counter(
+    'statiki_upstream_requests_total',
+    'Requests to upstream services, by response status.',
+    labels=('host', 'method', 'status'),
+)
+UPSTREAM_ERRORS = metrics.Counter(
+    'statiki_upstream_errors_total',
+    'Failed requests to upstream services; connection errors or 5xx.',
+    labels=('host', 'method', 'error'),
+)
+UPSTREAM_COALESCED = metrics.Counter(
+    'statiki_upstream_coalesced_total',
+    'Requests not made, since an identical one was in flight.',
+    labels=('host', 'method'),
+)
+
+# A request made to an upstream service, as seen by recording().
+Call = namedtuple('Call', ('method', 'url', 'status', 'duration'))
+
+_recorders = []
+# Calls in flight that can be shared: requests by URL, params and headers,
+# and other calls by the keys given to share.
+_flights = {}
+
+# Keys whose values are never written to a recording.
+SECRET_KEYS = frozenset([
+    'access_token', 'client_secret', 'code', 'github_token', 'secure',
+    'token',
+])
+REDACTED = 'REDACTED'
+SECURE_RE = re.compile(r'(secure:\s*)\S+')
+
+# Bytes read at a time, from streamed responses.
+CHUNK_SIZE = 16 * 1024
+# Characters that matter when finding the items of a JSON array.
+ARRAY_TOKEN_RE = re.compile(r'[\[\]{}",]')
+STRING_TOKEN_RE = re.compile(r'["\\]')
+
+_lock = threading.Lock()
+_state = {'record': None, 'replay': None, 'latency': False}
+
+
+def configure(record=None, replay=None, latency=False):
+    """ Record requests to a file, or replay them from one, if given.
+
+    When replaying, latency decides if responses take as long as they did
+    when recorded.
+
+    """
+
+    _state.update(
+        record=record or None,
+        replay=_load_recording(replay) if replay else None,
+        latency=latency,
+    )
+
+
+def get(url, **kwargs):
+    return request('get', url, **kwargs)
+
+
+def iter_json_array(response, fields=None):
+    """ Yield the items of the JSON array in the body of a response.
+
+    The body is parsed incrementally, as it is read, and only the text of
+    the item being parsed is held in memory.  So, for a request made with
+    stream=True, memory used does not grow with the length of the array.
+    If fields are given, each item, an object, is reduced to those fields.
+
+    """
+
+    for item in _parse_array(response.iter_content(CHUNK_SIZE)):
+        if fields is not None:
+            item = dict((field, item.get(field)) for field in fields)
+        yield item
+
+
+def iter_pages(url, concurrency=4, **kwargs):
+    """ Yield the response for each page of a paginated listing, in order.
+
+    If the Link header of the first page points to the last page, the other
+    pages are fetched concurrently, using at most concurrency threads, and
+    never more than concurrency pages ahead of those consumed.  Otherwise,
+    the next links are followed one by one.  Stops after the first response
+    that isn't OK.  Since pages are fetched as they are consumed, a caller
+    that stops early, say once it finds an item, fetches no more pages.
+
+    """
+
+    response = get(url, **kwargs)
+    yield response
+
+    # The URLs of the other pages have the parameters.
+    kwargs.pop('params', None)
+    urls = _get_page_urls(response)
+
+    if urls is None:
+        while response.ok and 'next' in response.links:
+            response = get(response.links['next']['url'], **kwargs)
+            yield response
+        return
+
+    from multiprocessing.pool import ThreadPool
+
+    fetch = tracing.wrap(lambda page_url: get(page_url, **kwargs), 'page')
+    pool = ThreadPool(max(min(concurrency, len(urls)), 1))
+    urls = iter(urls)
+    pending = deque(
+        pool.apply_async(fetch, (url,)) for url in islice(urls, concurrency)
+    )
+
+    try:
+        while response.ok and len(pending) > 0:
+            response = pending.popleft().get()
+            yield response
+            for url in islice(urls, 1):
+                pending.append(pool.apply_async(fetch, (url,)))
+
+    finally:
+        # Pages being fetched are left to finish in the background.
+        pool.close()
+
+
+def post(url, **kwargs):
+    return request('post', url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request('put', url, **kwargs)
+
+
+@contextmanager
+def recording():
+    """ Record all the requests made to upstream services, in the block.
+
+    Yields a list, to which a Call is appended for each request.
+
+    """
+
+    calls = []
+    _recorders.append(calls)
+
+    try:
+        yield calls
+
+    finally:
+        _recorders.remove(calls)
+
+
+def request(method, url, **kwargs):
+    """ Make a request to an upstream service, and record how it went.
+
+    Identical GETs made at the same time, by other threads, or greenlets
+    when gevent or eventlet patch threading, share a single request and
+    its response.  Streamed responses, read only once, are not shared; the
+    work done with them can be, using share.
+
+    """
+
+    if method != 'get' or kwargs.get('stream'):
+        return _request(method, url, kwargs)
+
+    flight, leader = _join_flight(_get_flight_key(url, kwargs))
+    if not leader:
+        UPSTREAM_COALESCED.inc(host=urlparse(url).netloc, method='GET')
+        return flight.wait()
+
+    def get():
+        response = _request(method, url, kwargs)
+        # Read the content, so that it can be used by all the callers.
+        response.content
+        return response
+
+    return flight.run(get)
+
+
+def share(key, func, *args, **kwargs):
+    """ Return func(*args, **kwargs), sharing the call with other callers.
+
+    Callers passing the same key, a tuple, while the call is in flight wait
+    for it, and get its result or error, instead of calling func again.
+
+    """
+
+    flight, leader = _join_flight(key)
+
+    return flight.run(func, *args, **kwargs) if leader else flight.wait()
+
+
+#### Private protocol #########################################################
+
+class _Flight(object):
+    """ A call in flight, whose result is shared with waiting callers. """
+
+    def __init__(self, key):
+        self.key = key
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def run(self, func, *args, **kwargs):
+        """ Call func, and share its result, or error, with the waiters. """
+
+        try:
+            self.result = func(*args, **kwargs)
+            return self.result
+
+        except Exception as e:
+            self.error = e
+            raise
+
+        finally:
+            with _lock:
+                del _flights[self.key]
+            self.done.set()
+
+    def wait(self):
+        """ Return the result, once it arrives, or raise its error. """
+
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+
+        return self.result
+
+
+def _join_flight(key):
+    """ Return the flight for a key, and True if it was started just now. """
+
+    with _lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            return flight, False
+
+        flight = _flights[key] = _Flight(key)
+        return flight, True
+
+
+def _load_recording(path):
+    """ Return the responses in a recording, in order, for each request. """
+
+    responses = {}
+    with open(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            responses.setdefault(entry['request'], []).append(entry)
+
+    return responses
+
+
+def _parse_array(chunks):
+    """ Yield the items of a JSON array, parsed from chunks of its text. """
+
+    text = ''
+    # Where scanning resumes, and where the current item starts.
+    position = start = 0
+    # Nesting of brackets, where the array itself is at depth 1.
+    depth = 0
+    in_string = False
+
+    for chunk in chunks:
+        text += chunk
+
+        while True:
+            if in_string:
+                match = STRING_TOKEN_RE.search(text, position)
+                if match is None:
+                    position = len(text)
+                    break
+                elif match.group() == '"':
+                    in_string = False
+                    position = match.end()
+                elif match.end() < len(text):
+                    # Skip the escaped character.
+                    position = match.end() + 1
+                else:
+                    position = match.start()
+                    break
+                continue
+
+            match = ARRAY_TOKEN_RE.search(text, position)
+            if match is None:
+                position = len(text)
+                break
+
+            token = match.group()
+            position = match.end()
+
+            if token == '"':
+                in_string = True
+
+            elif token in '[{':
+                depth += 1
+                if depth == 1:
+                    start = position
+
+            elif token in ']}':
+                depth -= 1
+                if depth == 1:
+                    yield json.loads(text[start:position])
+                    start = position
+                elif depth == 0:
+                    # Ends the array, and any number or literal before it.
+                    if text[start:match.start()].strip():
+                        yield json.loads(text[start:match.start()])
+                    return
+
+            elif depth == 1:
+                if text[start:match.start()].strip():
+                    yield json.loads(text[start:match.start()])
+                start = position
+
+        # Keep only the text of the item being parsed.
+        text = text[start:]
+        position -= start
+        start = 0
+
+    if depth > 0:
+        raise ValueError('Unterminated JSON array')
+
+
+def _request(method, url, kwargs):
+    """ Make a request to an upstream service, and record how it went. """
+
+    import requests
+
+    parsed = urlparse(url)
+    labels = dict(host=parsed.netloc, method=method.upper())
+    name = '%(method)s %(host)s' % labels
+    start = time.time()
+    response = None
+
+    with tracing.span(name, path=parsed.path) as span:
+        try:
+            response = _send(method, url, kwargs)
+
+        except requests.RequestException as e:
+            UPSTREAM_ERRORS.inc(error=e.__class__.__name__, **labels)
+            raise
+
+        finally:
+            duration = time.time() - start
+            UPSTREAM_LATENCY.observe(duration, **labels)
+            _record(labels['method'], url, response, duration)
+
+        if span is not None:
+            span.attributes.update(
+                status=response.status_code, bytes=_get_size(response)
+            )
+
+    UPSTREAM_REQUESTS.inc(status=response.status_code, **labels)
+    if response.status_code >= 500:
+        UPSTREAM_ERRORS.inc(error=response.status_code, **labels)
+
+    if _state['record'] is not None:
+        _save(method, url, kwargs, response, duration)
+
+    return response
+
+
+def _record(method, url, response, duration):
+    """ Add a call to all the active recorders. """
+
+    status = getattr(response, 'status_code', None)
+    for calls in _recorders:
+        calls.append(Call(method, url, status, duration))
+
+
+def _get_key(method, url, params=None):
+    """ Return the key to save and look up a request, in a recording. """
+
+    parsed = urlparse(url)
+    query = parse_qsl(parsed.query) + sorted((params or {}).items())
+    query = urlencode([
+        (name, REDACTED if name in SECRET_KEYS else value)
+        for name, value in query
+    ])
+
+    return '%s %s' % (method.upper(), urlunparse(parsed._replace(query=query)))
+
+
+def _get_flight_key(url, kwargs):
+    """ Return the key identifying a GET, to find an identical one. """
+
+    return (
+        url,
+        tuple(sorted((kwargs.get('params') or {}).items())),
+        tuple(sorted((kwargs.get('headers') or {}).items())),
+    )
+
+
+def _get_page_urls(response):
+    """ Return the URLs of the pages after this one, if the last is linked.
+
+    """
+
+    if not response.ok or 'last' not in response.links:
+        return None
+
+    parsed = urlparse(response.links['last']['url'])
+    query = parse_qsl(parsed.query)
+    current = int(dict(parse_qsl(urlparse(response.url).query)).get('page', 1))
+    last = int(dict(query).get('page', 0))
+
+    return [
+        urlunparse(parsed._replace(query=urlencode([
+            (name, page if name == 'page' else value) for name, value in query
+        ])))
+        for page in range(current + 1, last + 1)
+    ]
+
+
+def _get_size(response):
+    """ Return the size of the content of a response, if it has been read. """
+
+    content = getattr(response, '_content', None)
+
+    return len(content) if isinstance(content, bytes) else None
+
+
+def _redact(data, key=None):
+    """ Return the data, with secret values replaced. """
+
+    if key in SECRET_KEYS:
+        return REDACTED
+
+    elif isinstance(data, dict):
+        return dict((k, _redact(v, k)) for k, v in data.items())
+
+    elif isinstance(data, list):
+        return [_redact(item) for item in data]
+
+    elif isinstance(data, basestring) and key == 'content':
+        # File contents, base64 encoded by GitHub.
+        try:
+            content = base64.b64decode(data)
+        except TypeError:
+            return data
+        return base64.b64encode(SECURE_RE.sub(r'\1' + REDACTED, content))
+
+    return data
+
+
+def _redact_text(text):
+    try:
+        return json.dumps(_redact(json.loads(text)))
+    except ValueError:
+        query = parse_qsl(text, keep_blank_values=True)
+        if len(query) > 0 and '=' in text and ' ' not in text:
+            return urlencode([
+                (name, REDACTED if name in SECRET_KEYS else value)
+                for name, value in query
+            ])
+        return SECURE_RE.sub(r'\1' + REDACTED, text)
+
+
+def _replay(method, url, kwargs):
+    """ Return a response built from the recording, for the request. """
+
+    import requests
+    from requests.structures import CaseInsensitiveDict
+
+    key = _get_key(method, url, kwargs.get('params'))
+    with _lock:
+        entries = _state['replay'].get(key)
+        if not entries:
+            raise requests.ConnectionError('No recorded response: %s' % key)
+        # The last response for a request is served again, if asked for.
+        entry = entries.pop(0) if len(entries) > 1 else entries[0]
+
+    if _state['latency']:
+        time.sleep(entry['duration'])
+
+    content = entry['body'].encode('utf-8')
+    response = requests.Response()
+    response.status_code = entry['status']
+    response.headers = CaseInsensitiveDict(entry['headers'])
+    response.url = url
+    response.encoding = 'utf-8'
+    response.raw = BytesIO(content)
+    response._content = content
+
+    return response
+
+
+def _save(method, url, kwargs, response, duration):
+    """ Append a sanitized request and response to the recording. """
+
+    headers = dict(
+        (name, value) for name, value in response.headers.items()
+        if name.lower() in ('content-type', 'link')
+        or name.lower().startswith('x-ratelimit')
+    )
+    entry = {
+        'request': _get_key(method, url, kwargs.get('params')),
+        'status': response.status_code,
+        'headers': headers,
+        'body': _redact_text(response.text),
+        'duration': round(duration, 4),
+    }
+
+    with _lock:
+        with open(_state['record'], 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+
+def _send(method, url, kwargs):
+    import requests
+
+    if _state['replay'] is not None:
+        return _replay(method, url, kwargs)
+
+    return getattr(requests, method)(url, **kwargs)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" A small pool of threads, to run work in the background of requests. """
+
+# Standard library
+import logging
+import os
+import Queue
+import threading
+
+# Local library
+import metrics
+import tracing
+
+# Number of threads running jobs, in each process.
+WORKERS = 2
+
+QUEUE_DEPTH = metrics.Gauge(
+    'statiki_job_queue_depth',
+    'Jobs waiting to be run.',
+)
+JOBS = metrics.Counter(
+    'statiki_jobs_total',
+    'Jobs run, by name and outcome.',
+    labels=('name', 'status'),
+)
+
+logger = logging.getLogger('statiki.jobs')
+
+_local = threading.local()
+_lock = threading.Lock()
+_state = {'pid': None, 'queue': None}
+
+
+class Job(object):
+    """ A function to be called in the background, that can be cancelled. """
+
+    def __init__(self, func, args, kwargs):
+        self.name = func.__name__
+        self.func = tracing.wrap(func, 'job:%s' % self.name)
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.done = threading.Event()
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """ Cancel the job; long running jobs should check `cancelled`. """
+
+        self._cancelled.set()
+
+    def run(self):
+        if self.cancelled:
+            status = 'cancelled'
+
+        else:
+            _local.job = self
+            try:
+                self.result = self.func(*self.args, **self.kwargs)
+                status = 'cancelled' if self.cancelled else 'ok'
+            except Exception:
+                logger.exception('Job %s failed', self.name)
+                status = 'error'
+            finally:
+                _local.job = None
+
+        JOBS.inc(name=self.name, status=status)
+        self.done.set()
+
+
+def current():
+    """ Return the job being run in this thread, if any. """
+
+    return getattr(_local, 'job', None)
+
+
+def submit(func, *args, **kwargs):
+    """ Run func with the given arguments in the background.
+
+    The trace of the current request, if any, is carried into the job.
+    Returns the Job.
+
+    """
+
+    job = Job(func, args, kwargs)
+    QUEUE_DEPTH.inc()
+    _get_queue().put(job)
+
+    return job
+
+
+#### Private protocol #########################################################
+
+def _get_queue():
+    """ Return the queue of jobs, starting the threads if required.
+
+    Threads don't survive a fork, so each process starts its own.
+
+    """
+
+    with _lock:
+        if _state['pid'] != os.getpid():
+            _state['queue'] = Queue.Queue()
+            _state['pid'] = os.getpid()
+            for _ in range(WORKERS):
+                thread = threading.Thread(
+                    target=_work, args=(_state['queue'],)
+                )
+                thread.daemon = True
+                thread.start()
+
+    return _state['queue']
+
+
+def _work(queue):
+    while True:
+        job = queue.get()
+        QUEUE_DEPTH.dec()
+        job.run()
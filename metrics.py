@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" Counters, gauges and histograms, exposed in the Prometheus text format.
+
+Each process keeps its own values.  When a directory is configured, every
+process periodically dumps its values to a file there, and the values from
+all the files are added up when exposing them, so that the numbers are
+correct across multiple gunicorn workers.  Gauges of processes that are no
+longer running are ignored.
+
+"""
+
+# Standard library
+import errno
+import json
+import os
+from os.path import join
+import tempfile
+import threading
+import time
+
+# Seconds between dumps of the values of a process.
+FLUSH_INTERVAL = 1
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float('inf')
+)
+
+_lock = threading.Lock()
+_metrics = []
+_state = {'directory': None, 'flushed': 0}
+
+
+class Metric(object):
+    """ A named metric, with values for each combination of labels. """
+
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        _metrics.append(self)
+
+    def get(self, **labels):
+        """ Return the value for the given labels. """
+
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self, values):
+        """ Return (suffix, labels, value) tuples for the given values. """
+
+        return [
+            ('', dict(zip(self.labels, key)), value)
+            for key, value in sorted(values.items())
+        ]
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+
+class Counter(Metric):
+    """ A value that only goes up. """
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        _maybe_flush()
+
+
+class Gauge(Metric):
+    """ A value that can go up and down. """
+
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        _maybe_flush()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[self._key(labels)] = value
+        _maybe_flush()
+
+
+class Histogram(Metric):
+    """ Counts of observed values in buckets, along with their sum. """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=None):
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(buckets or DEFAULT_BUCKETS)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0))
+            counts = [
+                count + (1 if value <= bound else 0)
+                for count, bound in zip(counts, self.buckets)
+            ]
+            self.values[key] = (counts, total + value)
+        _maybe_flush()
+
+    def get(self, **labels):
+        """ Return the number of observations for the given labels. """
+
+        counts, _ = self.values.get(self._key(labels), ([0], 0))
+        return counts[-1]
+
+    def samples(self, values):
+        samples = []
+
+        for key, (counts, total) in sorted(values.items()):
+            labels = dict(zip(self.labels, key))
+            for count, bound in zip(counts, self.buckets):
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                samples.append(('_bucket', dict(labels, le=le), count))
+            samples.append(('_sum', labels, total))
+            samples.append(('_count', labels, counts[-1]))
+
+        return samples
+
+
+def configure(directory=None):
+    """ Set the directory used to share values between processes. """
+
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    _state['directory'] = directory or None
+
+
+def expose():
+    """ Return the values of all the metrics, in Prometheus text format. """
+
+    flush()
+    values = _collect()
+    lines = []
+
+    for metric in _metrics:
+        lines.append('# HELP %s %s' % (metric.name, metric.documentation))
+        lines.append('# TYPE %s %s' % (metric.name, metric.type))
+        for suffix, labels, value in metric.samples(values[metric.name]):
+            lines.append(
+                '%s%s%s %s' % (
+                    metric.name, suffix, _format_labels(labels), float(value)
+                )
+            )
+
+    return '\n'.join(lines) + '\n'
+
+
+def flush():
+    """ Dump the values of this process, if a directory is configured. """
+
+    directory = _state['directory']
+    if directory is None:
+        return
+
+    with _lock:
+        data = dict(
+            (metric.name, [[list(key), value] for key, value in
+                           metric.values.items()])
+            for metric in _metrics
+        )
+        _state['flushed'] = time.time()
+
+    fd, path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.rename(path, join(directory, '%s.json' % os.getpid()))
+
+
+def reset():
+    """ Forget all the values recorded by this process. """
+
+    with _lock:
+        for metric in _metrics:
+            metric.values.clear()
+        _state['flushed'] = 0
+
+
+#### Private protocol #########################################################
+
+def _collect():
+    """ Return the values of all the metrics, added up across processes. """
+
+    with _lock:
+        values = dict(
+            (metric.name, dict(metric.values)) for metric in _metrics
+        )
+
+    directory = _state['directory']
+    if directory is None:
+        return values
+
+    values = dict((metric.name, {}) for metric in _metrics)
+    types = dict((metric.name, metric.type) for metric in _metrics)
+
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+
+        try:
+            pid = int(name[:-len('.json')])
+        except ValueError:
+            # Not written by a process, say a file left by an editor.
+            continue
+
+        try:
+            with open(join(directory, name)) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            continue
+
+        for metric_name, entries in data.items():
+            if metric_name not in values:
+                continue
+            if types[metric_name] == 'gauge' and not _is_running(pid):
+                continue
+            for key, value in entries:
+                _add(values[metric_name], tuple(key), value)
+
+    return values
+
+
+def _add(values, key, value):
+    """ Add a value of a metric, to the values collected so far. """
+
+    if key not in values:
+        values[key] = value
+
+    elif isinstance(value, list):
+        counts, total = values[key]
+        counts = [a + b for a, b in zip(counts, value[0])]
+        values[key] = (counts, total + value[1])
+
+    else:
+        values[key] += value
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for name, value in sorted(labels.items())
+    )
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+
+    return True
+
+
+def _maybe_flush():
+    if (_state['directory'] is not None
+            and time.time() - _state['flushed'] > FLUSH_INTERVAL):
+        flush()
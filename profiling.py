@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" On-demand profiling of requests, in all the worker processes.
+
+Profiling is off unless a directory is configured.  Even then, requests are
+profiled only after profiling is started, which writes a control file to the
+directory, read by all the workers.  Each worker adds up the profiles of
+the requests it sampled, and dumps them into the directory, from where they
+are collected into a single profile.
+
+"""
+
+# Standard library
+import cProfile
+import json
+import os
+from os.path import join
+import pstats
+import random
+import tempfile
+import threading
+import time
+
+CONTROL = 'control.json'
+
+_lock = threading.Lock()
+_state = {'directory': None, 'control': None, 'mtime': None}
+
+
+def configure(directory=None):
+    """ Set the directory used to control and collect profiles. """
+
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    _state.update(directory=directory or None, control=None, mtime=None)
+
+
+def enabled():
+    return _state['directory'] is not None
+
+
+def start(rate=100, seconds=None):
+    """ Profile rate percent of requests, for the next seconds, if given. """
+
+    until = time.time() + seconds if seconds else None
+    _write_control({'rate': rate, 'until': until})
+
+
+def stop():
+    """ Stop profiling requests. """
+
+    _write_control(None)
+
+
+def clear():
+    """ Stop profiling, and remove the profiles collected so far. """
+
+    stop()
+    for name in os.listdir(_state['directory']):
+        if name.endswith('.pstats'):
+            os.remove(join(_state['directory'], name))
+
+
+def get_status():
+    """ Return the current settings of profiling, or None if stopped. """
+
+    control = _read_control()
+    if control is None:
+        return None
+
+    if control['until'] is not None and time.time() > control['until']:
+        return None
+
+    return control
+
+
+def maybe_start():
+    """ Return a running profiler, if this request is to be profiled. """
+
+    if _state['directory'] is None:
+        return None
+
+    control = get_status()
+    if control is None or random.random() * 100 >= control['rate']:
+        return None
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+    return profiler
+
+
+def finish(profiler):
+    """ Stop the profiler, and add its profile to that of this process. """
+
+    profiler.disable()
+    path = join(_state['directory'], '%s.pstats' % os.getpid())
+
+    with _lock:
+        stats = pstats.Stats(profiler)
+        if os.path.exists(path):
+            stats.add(path)
+        stats.dump_stats(path)
+
+
+def collect():
+    """ Return the profiles of all the processes, added up, or None. """
+
+    paths = [
+        join(_state['directory'], name)
+        for name in sorted(os.listdir(_state['directory']))
+        if name.endswith('.pstats')
+    ]
+
+    if len(paths) == 0:
+        return None
+
+    stats = pstats.Stats(paths[0])
+    for path in paths[1:]:
+        stats.add(path)
+
+    return stats
+
+
+def dump(stats):
+    """ Return the stats in the binary pstats format. """
+
+    fd, path = tempfile.mkstemp(suffix='.pstats')
+    os.close(fd)
+
+    try:
+        stats.dump_stats(path)
+        with open(path, 'rb') as f:
+            return f.read()
+
+    finally:
+        os.remove(path)
+
+
+#### Private protocol #########################################################
+
+def _read_control():
+    """ Return the contents of the control file, re-reading it if changed. """
+
+    path = join(_state['directory'], CONTROL)
+
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+
+    if mtime != _state['mtime']:
+        try:
+            with open(path) as f:
+                control = json.load(f)
+        except (IOError, ValueError):
+            return None
+        _state.update(control=control, mtime=mtime)
+
+    return _state['control']
+
+
+def _write_control(control):
+    path = join(_state['directory'], CONTROL)
+
+    if control is None:
+        if os.path.exists(path):
+            os.remove(path)
+
+    else:
+        fd, temp = tempfile.mkstemp(dir=_state['directory'])
+        with os.fdopen(fd, 'w') as f:
+            json.dump(control, f)
+        os.rename(temp, path)
+
+    _state.update(control=None, mtime=None)
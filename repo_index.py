@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" An index of the repositories of a user, to complete their names.
+
+The names are kept sorted, so that the names with a prefix are found by
+bisecting, without scanning all of them.  Each repository has flags, as
+last known from the listings of GitHub and Travis:
+
+    exists: the repository is on GitHub.
+    travis: the repository is listed on Travis.
+    travis_yml: True if it has a .travis.yml, False if it doesn't, and
+                None if that is not known.
+
+"""
+
+# Standard library
+import bisect
+import threading
+import time
+
+# Seconds an index is used for, as long as GitHub listings are cached.
+TTL = 10 * 60
+
+
+class RepoIndex(object):
+    """ Repositories and their flags, by name, searchable by prefix. """
+
+    def __init__(self):
+        self.created = time.time()
+        # Lower cased names, sorted, since GitHub ignores the case.
+        self._keys = []
+        self._repos = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name.lower() in self._repos
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, name, **flags):
+        """ Add a repository, or update the flags of a known one. """
+
+        key = name.lower()
+        with self._lock:
+            if key not in self._repos:
+                bisect.insort(self._keys, key)
+                self._repos[key] = {
+                    'name': name,
+                    'exists': False,
+                    'travis': False,
+                    'travis_yml': None,
+                }
+            self._repos[key].update(flags)
+
+    def is_expired(self, now=None):
+        """ Return True if the index is too old to be trusted. """
+
+        now = time.time() if now is None else now
+
+        return now - self.created > TTL
+
+    def get(self, name):
+        """ Return the flags of a repository, or None if it is not known. """
+
+        repo = self._repos.get(name.lower())
+
+        return dict(repo) if repo is not None else None
+
+    def search(self, prefix, limit=10):
+        """ Return up to limit repositories whose names start with prefix. """
+
+        prefix = prefix.lower()
+        with self._lock:
+            start = bisect.bisect_left(self._keys, prefix)
+            keys = self._keys[start:start + limit]
+
+        return [
+            dict(self._repos[key]) for key in keys if key.startswith(prefix)
+        ]
@@ -31,3 +31,38 @@ SECRET_KEY = get_config_var('SECRET_KEY', 'top secret!')
 CLIENT_ID = get_config_var('CLIENT_ID', 'x'*20)
 CLIENT_SECRET = get_config_var('CLIENT_SECRET', 'y'*40)
 STATE = get_config_var('STATE', '')
+# Directory used to share metrics between worker processes
+METRICS_DIR = get_config_var('METRICS_DIR', '')
+# Requests slower than these many seconds are logged with a trace
+TRACE_SLOW_REQUESTS = get_config_var('TRACE_SLOW_REQUESTS', '')
+# Directory used to control and collect profiles of requests, when set
+PROFILING_DIR = get_config_var('PROFILING_DIR', '')
+# GitHub usernames of admins, separated by commas
+ADMIN_USERS = get_config_var('ADMIN_USERS', '')
+# Upstream services, overridable to use stand-ins
+GITHUB_URL = get_config_var('GITHUB_URL', 'https://github.com')
+GITHUB_API_URL = get_config_var('GITHUB_API_URL', 'https://api.github.com')
+GITHUB_STATUS_URL = get_config_var(
+    'GITHUB_STATUS_URL', 'https://status.github.com'
+)
+TRAVIS_API_URL = get_config_var('TRAVIS_API_URL', 'https://api.travis-ci.org')
+TRAVIS_STATUS_URL = get_config_var(
+    'TRAVIS_STATUS_URL', 'http://status.travis-ci.com'
+)
+# Record upstream requests to, or replay them from, a file
+UPSTREAM_RECORD = get_config_var('UPSTREAM_RECORD', '')
+UPSTREAM_REPLAY = get_config_var('UPSTREAM_REPLAY', '')
+# Set to replay requests taking as long as when recorded
+UPSTREAM_REPLAY_LATENCY = get_config_var('UPSTREAM_REPLAY_LATENCY', '')
+# Seconds for which browsers and CDNs may cache pages for anonymous users
+PAGE_MAX_AGE = get_config_var('PAGE_MAX_AGE', '300')
+# Responses smaller than this many bytes are not compressed
+COMPRESS_MIN_SIZE = get_config_var('COMPRESS_MIN_SIZE', '1024')
+# gzip level for responses; low levels are almost as small, and faster
+COMPRESS_LEVEL = get_config_var('COMPRESS_LEVEL', '4')
+# Fill caches in the background after login, leaving these many requests of
+# the user's GitHub rate limit unused; empty to disable
+PREFETCH_RESERVE = get_config_var('PREFETCH_RESERVE', '500')
+# SQLite database in which the workers share caches of upstream data; empty
+# to keep the caches in each worker
+CACHE_PATH = get_config_var('CACHE_PATH', '')
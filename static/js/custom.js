@@ -23,6 +23,39 @@ $('form#submit-repo').submit(
   }
 );
 
+// Complete repository names as they are typed, after a pause in typing.
+var complete_delay = 200;
+var complete_timer = null;
+var completions = {};
+
+$('input[name="repo_name"]').on('input', function(){
+  var prefix = $(this).val();
+  clearTimeout(complete_timer);
+  show_repo_hint(prefix);
+  complete_timer = setTimeout(function(){ complete_repo_name(prefix); }, complete_delay);
+});
+
+var complete_repo_name = function(prefix) {
+  $.getJSON('/repos', {'prefix': prefix}, function(data){
+    var names = $('#repo-names');
+    names.children().remove();
+    $.each(data.repos, function(i, repo){
+      completions[repo.name.toLowerCase()] = repo;
+      names.append($('<option>').attr('value', repo.name));
+    });
+    show_repo_hint($('input[name="repo_name"]').val());
+  });
+};
+
+var show_repo_hint = function(name) {
+  var repo = completions[name.toLowerCase()];
+  var hint = '';
+  if (repo && repo.exists) {
+    hint = repo.travis_yml ? 'Existing repository, with a .travis.yml' : 'Existing repository';
+  }
+  $('#repo-hint').text(hint);
+};
+
 var continue_to_manage_step = function(created, exists, overwrite, full_name, message, contents) {
 
   if (!created && !exists) {
@@ -79,7 +112,7 @@ var show_form = function(){
 
 var show_dialog = function(message, contents, overwrite, full_name) {
 
-  bootbox.dialog({
+  var dialog = bootbox.dialog({
     message: contents,
     title: '<p>Configure your blog...</p>',
     buttons: {
@@ -100,4 +133,13 @@ var show_dialog = function(message, contents, overwrite, full_name) {
       }
     }
   });
+
+  // File contents are loaded only when their panel is first shown.
+  dialog.on('show.bs.collapse', '.panel-collapse', function(){
+    var pre = $(this).find('pre[data-url]');
+    if (!pre.data('loaded')) {
+      pre.data('loaded', true);
+      $.get(pre.data('url'), function(content){ pre.text(content); }, 'text');
+    }
+  });
 };
@@ -7,27 +7,51 @@
 
 # Standard library.
 from functools import wraps
-from os.path import abspath, dirname, join
+import gzip
+import hashlib
+from io import BytesIO
+import json
+import mimetypes
+from os.path import abspath, dirname, isfile, join
+from StringIO import StringIO
+import sys
+import time
 from urlparse import parse_qsl
 
 # 3rd party library.
 from flask import (
-    flash, Flask, jsonify, redirect, render_template, request, url_for
+    abort, flash, Flask, g, has_request_context, jsonify, make_response,
+    redirect, render_template, request, Response, send_from_directory,
+    session as flask_session, url_for
 )
 from flask_login import (
     current_user, LoginManager, login_user, login_required, logout_user,
     UserMixin
 )
 from flask_sqlalchemy import SQLAlchemy
-from rauth.service import OAuth2Service
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 # Local library.
+import assets
+import cache
 import messages
+import metrics
 import github_utils
+import http_utils
+import jobs
+import profiling
+import repo_index
+import tracing
 import travis_utils
 
-AUTHORIZE_URL = 'https://github.com/login/oauth/authorize'
 SCRIPT = 'travis_fabfile.py'
+# Files committed to the repository, with their commit messages.
+TRAVIS_FILES = [
+    (SCRIPT, 'Add build and deploy script (via Statiki).\n\n[skip ci]'),
+    ('.travis.yml', 'Add .travis.yml (via Statiki).'),
+]
+REPORT = '.statiki-report.json'
 HERE = dirname(abspath(__file__))
 SITE = 'Statiki'
 DESCRIPTION = 'An easy-to-use service for deploying simple web-sites'
@@ -45,19 +69,200 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
-# rauth OAuth 2.0 service wrapper
-github = OAuth2Service(
-    client_id=app.config['CLIENT_ID'],
-    client_secret=app.config['CLIENT_SECRET'],
-    name='github',
-    authorize_url=AUTHORIZE_URL,
-    access_token_url='https://github.com/login/oauth/access_token',
-    base_url='https://api.github.com/'
+# Metrics
+REQUEST_LATENCY = metrics.Histogram(
+    'statiki_request_seconds',
+    'Latency of requests, by view.',
+    labels=('view', 'method', 'status'),
 )
+REQUESTS_IN_PROGRESS = metrics.Gauge(
+    'statiki_requests_in_progress',
+    'Requests currently being handled.',
+)
+DB_QUERIES = metrics.Counter(
+    'statiki_db_queries_total',
+    'Queries run on the database, by view.',
+    labels=('view',),
+)
+PAGE_CACHE = metrics.Counter(
+    'statiki_page_cache_total',
+    'Lookups in the cache of pages for anonymous users, by result.',
+    labels=('view', 'result'),
+)
+PREFETCH_STEPS = metrics.Counter(
+    'statiki_prefetch_steps_total',
+    'Steps of filling the caches after login, by step and result.',
+    labels=('step', 'result'),
+)
+
+# Types of responses that are compressed, if large enough.
+COMPRESS_MIMETYPES = ('application/json', 'text/html')
+
+# Pages rendered for anonymous users; they only change on a deploy.
+pages = cache.PageCache()
+
+# Jobs filling the caches for users who just logged in, by username.
+prefetches = cache.LRUCache(1024)
+
+# Indexes of the repositories of users, by username, to complete names.
+repo_indexes = cache.LRUCache(1024, name='repo_index')
+
+# GitHub usernames of the admins, set by create_app.
+ADMIN_USERS = []
+
+# rauth OAuth 2.0 service wrapper, created on first use.
+AUTHORIZE_URL = '%s/login/oauth/authorize' % app.config['GITHUB_URL']
+github = None
+
+
+def create_app(config=None):
+    """ Configure the app and the services it uses, and return the app.
+
+    config, if given, overrides the settings.
+
+    """
+
+    global ADMIN_USERS, AUTHORIZE_URL, github
+
+    app.config.update(config or {})
+
+    # Metrics, shared across processes using files in METRICS_DIR, if set.
+    metrics.configure(app.config['METRICS_DIR'])
+
+    # Tracing of requests slower than TRACE_SLOW_REQUESTS seconds, if set.
+    threshold = app.config['TRACE_SLOW_REQUESTS']
+    tracing.configure(float(threshold) if threshold else None)
+
+    # Profiling of requests, on demand, if PROFILING_DIR is set.
+    profiling.configure(app.config['PROFILING_DIR'])
+    ADMIN_USERS = app.config['ADMIN_USERS'].replace(',', ' ').split()
+
+    # Upstream services
+    github_utils.GITHUB_URL = app.config['GITHUB_URL']
+    github_utils.API_URL = app.config['GITHUB_API_URL']
+    github_utils.STATUS_URL = app.config['GITHUB_STATUS_URL']
+    travis_utils.API_URL = app.config['TRAVIS_API_URL']
+    travis_utils.STATUS_URL = app.config['TRAVIS_STATUS_URL']
+    AUTHORIZE_URL = '%s/login/oauth/authorize' % app.config['GITHUB_URL']
+    github = None
+
+    # Caches of upstream data, shared by the workers if CACHE_PATH is set.
+    cache.configure(app.config['CACHE_PATH'])
+
+    # Recording of upstream requests, or replaying them, if set.
+    http_utils.configure(
+        record=app.config['UPSTREAM_RECORD'],
+        replay=app.config['UPSTREAM_REPLAY'],
+        latency=bool(app.config['UPSTREAM_REPLAY_LATENCY']),
+    )
+
+    return app
+
+
+def get_github_service():
+    """ Return the OAuth service for GitHub, creating it if required. """
+
+    global github
+
+    if github is None:
+        from rauth.service import OAuth2Service
+
+        github = OAuth2Service(
+            client_id=app.config['CLIENT_ID'],
+            client_secret=app.config['CLIENT_SECRET'],
+            name='github',
+            authorize_url=AUTHORIZE_URL,
+            access_token_url=(
+                '%s/login/oauth/access_token' % app.config['GITHUB_URL']
+            ),
+            base_url='%s/' % app.config['GITHUB_API_URL']
+        )
+
+    return github
+
+
+def warm_up():
+    """ Load everything the workers need, before they are forked.
+
+    Used when gunicorn preloads the app, so that the workers share the
+    memory used by the modules, templates and scripts loaded here.
+
+    """
+
+    # Modules otherwise imported only when first used.
+    import requests
+    import rsa
+    import yaml
+
+    get_github_service()
+    travis_utils.get_script_contents(SCRIPT)
+    for name in assets.BUNDLES:
+        assets.get_built_name(name)
+    for name in app.jinja_loader.list_templates():
+        app.jinja_env.get_template(name)
+
+
+def after_fork():
+    """ Reset the state that must not be shared with the parent process. """
+
+    import random
+
+    random.seed()
+    db.engine.dispose()
+    metrics.reset()
 
 
 #### decorators ###############################################################
 
+def admin_required(func):
+    """ Ensures that the view is visible only to admins; 404 for others. """
+
+    @wraps(func)
+    def decorated_view(*args, **kwargs):
+        if (current_user.is_anonymous()
+                or current_user.username not in ADMIN_USERS):
+            abort(404)
+        return func(*args, **kwargs)
+    return decorated_view
+
+
+def cached_page(func):
+    """ Serves the page for anonymous users from a cache, with an ETag.
+
+    Pages for logged in users, or with flashed messages, are never cached.
+
+    """
+
+    @wraps(func)
+    def decorated_view(*args, **kwargs):
+        if not current_user.is_anonymous() or '_flashes' in flask_session:
+            response = make_response(func(*args, **kwargs))
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+
+        page = pages.get(request.path)
+        if page is None:
+            PAGE_CACHE.inc(view=request.endpoint, result='miss')
+            page = pages.set(
+                request.path, func(*args, **kwargs).encode('utf-8')
+            )
+        else:
+            PAGE_CACHE.inc(view=request.endpoint, result='hit')
+
+        body, etag = page
+        response = Response(body, mimetype='text/html')
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = int(app.config['PAGE_MAX_AGE'])
+        response.vary.add('Cookie')
+
+        return response.make_conditional(request)
+
+    return decorated_view
+
+
 def travis_login_required(func):
     """ Ensures that the view is visible only to a travis user.
 
@@ -120,9 +325,117 @@ def load_user(user_id):
     return User.get(user_id)
 
 
+#### instrumentation ##########################################################
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.time()
+    REQUESTS_IN_PROGRESS.inc()
+    tracing.start_trace(
+        request.endpoint or request.path, method=request.method,
+        path=request.path
+    )
+    if request.endpoint not in ('show_profile', 'download_profile'):
+        g.profiler = profiling.maybe_start()
+
+
+@app.after_request
+def record_request_status(response):
+    g.request_status = response.status_code
+
+    trace = tracing.current()
+    if trace is not None:
+        trace.attributes['status'] = response.status_code
+
+    return response
+
+
+@app.teardown_request
+def record_request_latency(exception=None):
+    start = getattr(g, 'request_start', None)
+    if start is None:
+        return
+
+    tracing.finish_trace()
+    if getattr(g, 'profiler', None) is not None:
+        profiling.finish(g.profiler)
+    REQUESTS_IN_PROGRESS.dec()
+    REQUEST_LATENCY.observe(
+        time.time() - start,
+        view=request.endpoint or '',
+        method=request.method,
+        status=getattr(g, 'request_status', 500),
+    )
+
+
+@app.after_request
+def compress_response(response):
+    """ Gzip HTML and JSON responses larger than COMPRESS_MIN_SIZE. """
+
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES
+            or 'gzip' not in request.accept_encodings):
+        return response
+
+    data = response.get_data()
+    if len(data) < int(app.config['COMPRESS_MIN_SIZE']):
+        return response
+
+    buf = BytesIO()
+    with gzip.GzipFile(
+            fileobj=buf, mode='wb',
+            compresslevel=int(app.config['COMPRESS_LEVEL'])) as f:
+        f.write(data)
+
+    response.set_data(buf.getvalue())
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    # The gzipped body differs from the original, but is equivalent.
+    etag, weak = response.get_etag()
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+
+    return response
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_db_query(*args):
+    DB_QUERIES.inc(view=request.endpoint if has_request_context() else '')
+
+
 #### views ####################################################################
 
+@app.template_global()
+def asset_url(name):
+    """ Return the URL of the built file for a bundle of assets. """
+
+    return url_for('show_asset', filename=assets.get_built_name(name))
+
+
+@app.route('/assets/<path:filename>')
+def show_asset(filename):
+    # Built files have the hash of their content in the name; never stale.
+    gzipped = 'gzip' in request.accept_encodings and isfile(
+        join(assets.DIST, filename + '.gz')
+    )
+    response = send_from_directory(
+        assets.DIST, filename + '.gz' if gzipped else filename,
+        mimetype=mimetypes.guess_type(filename)[0],
+        cache_timeout=365 * 24 * 60 * 60,
+    )
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.cache_control.public = True
+    response.headers['Cache-Control'] += ', immutable'
+    response.vary.add('Accept-Encoding')
+
+    return response
+
+
 @app.route('/')
+@cached_page
 def index():
     context = {
         'user': current_user,
@@ -144,7 +457,7 @@ def authorized():
     redirect_uri = url_for('authorized', _external=True)
     data = dict(code=request.args['code'], redirect_uri=redirect_uri)
 
-    session = github.get_auth_session(data=data)
+    session = get_github_service().get_auth_session(data=data)
 
     # the "me" response
     user = session.get('user').json()
@@ -153,10 +466,21 @@ def authorized():
     user_obj.set_github_token(session.access_token)
     login_user(user_obj)
 
+    # Fill the caches used by the views, while the user picks a repo.
+    repo_indexes.delete(user_obj.username)
+    if app.config['PREFETCH_RESERVE']:
+        cancel_prefetch(user_obj.username)
+        job = jobs.submit(
+            prefetch, session.access_token,
+            int(app.config['PREFETCH_RESERVE'])
+        )
+        prefetches.set(user_obj.username, job)
+
     return redirect(url_for('index'))
 
 
 @app.route('/faq')
+@cached_page
 def show_faq():
 
     # fixme: remove duplication of context
@@ -177,12 +501,18 @@ def login():
         'scope': 'repo'
     }
 
-    return redirect(github.get_authorize_url(**params))
+    return redirect(get_github_service().get_authorize_url(**params))
 
 
 @app.route('/logout')
 @login_required
 def logout():
+    cancel_prefetch(current_user.username)
+    # Forget the data cached for the user.
+    for token in (current_user.github_token, current_user.travis_token):
+        if token is not None:
+            cache.invalidate(cache.token_namespace(token))
+    repo_indexes.delete(current_user.username)
     logout_user()
     return redirect(url_for('index'))
 
@@ -203,22 +533,47 @@ def create_repo():
 
     created = exists = overwrite = False
 
+    # Flags of the repo from the index, if the user has used completion.
+    index = get_cached_repo_index(current_user.username)
+    name = full_name.split('/', 1)[1]
+    repo = index.get(name) if index is not None else None
+    if repo is None:
+        repo = {'travis_yml': None}
+        repo['exists'] = (
+            index is None and github_utils.is_valid_repository(full_name)
+        )
+
     # If repo does not exist, create it.
-    if not github_utils.is_valid_repository(full_name):
+    if not repo['exists']:
         if github_utils.create_new_repository(full_name, github_token):
             created = True
             message = messages.CREATE_REPO_SUCCESS
-        else:
+            repo['travis_yml'] = False
+            # Anything cached for an earlier repo of the same name is stale.
+            cache.invalidate(cache.repo_namespace(full_name))
+
+        # The repo may have been created after the index was built.
+        elif index is not None:
+            repo['exists'] = bool(github_utils.is_valid_repository(full_name))
+
+        if not created and not repo['exists']:
             message = messages.CREATE_REPO_FAILURE
 
-    elif github_utils.exists(full_name, '.travis.yml', github_token):
+    if repo['exists']:
         exists = True
-        overwrite = True
-        message = messages.OVERWRITE_YAML
+        if repo['travis_yml'] is None:
+            repo['travis_yml'] = bool(
+                github_utils.exists(full_name, '.travis.yml', github_token)
+            )
+
+        if repo['travis_yml']:
+            overwrite = True
+            message = messages.OVERWRITE_YAML
+        else:
+            message = messages.REPO_EXISTS
 
-    else:
-        exists = True
-        message = messages.REPO_EXISTS
+    if index is not None and (exists or created):
+        index.add(name, exists=True, travis_yml=repo['travis_yml'])
 
     data = {
         'exists': exists,
@@ -242,17 +597,54 @@ def create_repo():
             # ('THEME', 'bootstrap3'),
         ]
 
+        # Options for the build script, with their defaults as placeholders.
+        BUILD_CONF = [
+            ('BUILD_INCLUDE', '*'),
+            ('BUILD_EXCLUDE', 'README* .travis.yml'),
+            ('BUILD_PROCESSES', 'Number of CPUs'),
+        ]
+
+        files = get_travis_files_preview(full_name)
         context = {
-            'FILES': get_travis_files_content(full_name, github_token, {}),
+            'FILES': files,
             'message': message,
-            'SAMPLE_CONF': SAMPLE_CONF
+            'SAMPLE_CONF': SAMPLE_CONF,
+            'BUILD_CONF': BUILD_CONF,
         }
 
         data['contents'] = render_template('form.html', **context)
+        data['files'] = files
 
     return jsonify(data)
 
 
+@app.route('/repos')
+@login_required
+def complete_repo_name():
+    index = get_repo_index(current_user)
+    repos = index.search(request.args.get('prefix', ''))
+
+    return jsonify(repos=repos)
+
+
+@app.route('/preview/<user>/<repo>/<name>')
+@login_required
+def show_preview(user, repo, name):
+    if (user != current_user.username
+            or name not in [file_name for file_name, _ in TRAVIS_FILES]):
+        abort(404)
+
+    content = get_travis_file_content(
+        name, '%s/%s' % (user, repo), current_user.github_token, {}
+    )
+    response = Response(content, mimetype='text/plain')
+    # The URL has a version, changed with the content.
+    response.cache_control.private = True
+    response.cache_control.max_age = 60 * 60
+
+    return response
+
+
 @app.route('/manage', methods=['POST'])
 @login_required
 @travis_login_required
@@ -282,11 +674,108 @@ def manage():
     enabled = travis_utils.enable_hook(repo_id, travis_token)
     created = create_travis_files(full_name, github_token, data)
 
+    index = get_cached_repo_index(current_user.username)
+    if index is not None:
+        index.add(
+            full_name.split('/', 1)[1], exists=True, travis=True,
+            travis_yml=created['.travis.yml'] or None
+        )
+
     response = get_display_response(enabled, created)
     response['message'] %= dict(USER=current_user.username, REPO=repo_name)
     return jsonify(response)
 
 
+@app.route('/metrics')
+def show_metrics():
+    return Response(metrics.expose(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+@admin_required
+def show_profile():
+
+    if not profiling.enabled():
+        abort(404)
+
+    if request.method == 'POST':
+        action = request.form.get('action', 'start')
+        if action == 'start':
+            try:
+                rate = float(request.form.get('rate') or 100)
+                seconds = float(request.form.get('seconds') or 0)
+            except ValueError:
+                abort(400)
+            # Also rejects nan, which fails all comparisons.
+            if not (0 <= rate <= 100 and 0 <= seconds < float('inf')):
+                abort(400)
+            profiling.start(rate=rate, seconds=seconds or None)
+        elif action == 'stop':
+            profiling.stop()
+        elif action == 'clear':
+            profiling.clear()
+        return redirect(url_for('show_profile'))
+
+    status = profiling.get_status()
+    stats = profiling.collect()
+    output = StringIO()
+    output.write('Profiling: %s\n\n' % (json.dumps(status) or 'stopped'))
+
+    if stats is not None:
+        stats.stream = output
+        stats.sort_stats('cumulative').print_stats(50)
+
+    return Response(output.getvalue(), mimetype='text/plain')
+
+
+@app.route('/admin/profile.pstats')
+@admin_required
+def download_profile():
+
+    stats = profiling.collect() if profiling.enabled() else None
+    if stats is None:
+        abort(404)
+
+    return Response(
+        profiling.dump(stats),
+        mimetype='application/octet-stream',
+        headers={'Content-Disposition': 'attachment; filename=statiki.pstats'}
+    )
+
+
+@app.route('/report/<user>/<repo>')
+@login_required
+def show_report(user, repo):
+
+    full_name = '%s/%s' % (user, repo)
+    branch = 'master' if github_utils.is_user_pages(full_name) else 'gh-pages'
+    content = github_utils.get_file_content(
+        full_name, REPORT, current_user.github_token, ref=branch
+    )
+    try:
+        reports = json.loads(content) if content is not None else []
+    except ValueError:
+        # The report may have been edited or truncated, in the repository.
+        reports = []
+
+    if not isinstance(reports, list):
+        reports = []
+    reports = [report for report in reports if is_valid_report(report)]
+
+    context = {
+        'user': current_user,
+        'SITE': SITE,
+        'DESCRIPTION': DESCRIPTION,
+        'FULL_NAME': full_name,
+        'REPORTS': reports,
+        'MAX_DURATION': max(
+            [report['duration'] for report in reports] or [0]
+        ) or 1,
+    }
+
+    return render_template('report.html', **context)
+
+
 @app.route('/status')
 def show_status():
 
@@ -303,6 +792,15 @@ def show_status():
 
 #### Helper functions #########################################################
 
+def cancel_prefetch(username):
+    """ Cancel filling the caches for the user, if it is not done yet. """
+
+    job = prefetches.get(username)
+    if job is not None:
+        job.cancel()
+        prefetches.delete(username)
+
+
 def create_travis_files(full_name, github_token, config):
     """ Create the files required for Travis CI hooks to work. """
 
@@ -332,6 +830,17 @@ def create_travis_files(full_name, github_token, config):
     return created
 
 
+def get_cached_repo_index(username):
+    """ Return the index of the repositories of a user, unless expired. """
+
+    index = repo_indexes.get(username)
+    if index is not None and index.is_expired():
+        repo_indexes.delete(username)
+        index = None
+
+    return index
+
+
 def get_display_response(enabled, created):
     """ Return the response for the user, based on enabled and created. """
 
@@ -355,8 +864,48 @@ def get_display_response(enabled, created):
     return response
 
 
-def get_travis_files_content(full_name, github_token, config):
-    """ Return the content of the files that will be committed to the repo. """
+def get_repo_index(user):
+    """ Return the index of the repositories of the user.
+
+    Built from the listings of repositories on GitHub and Travis, which are
+    usually cached by prefetching after login.
+
+    """
+
+    index = get_cached_repo_index(user.username)
+    if index is not None:
+        return index
+
+    index = repo_index.RepoIndex()
+    owner = user.username.lower()
+
+    repos = github_utils.get_repos(user.github_token)
+    for full_name in repos or []:
+        if full_name.split('/')[0].lower() == owner:
+            index.add(full_name.split('/', 1)[1], exists=True)
+
+    travis_token = travis_utils.is_travis_user(user.github_token)
+    hooks = (
+        travis_utils.get_hooks(travis_token)
+        if travis_token is not None else None
+    )
+    # Hooks don't tell if a repository has a .travis.yml, even active ones.
+    for hook_owner, name in sorted(hooks or {}):
+        if hook_owner.lower() == owner:
+            index.add(name, travis=True)
+
+    # Without the GitHub listing, the index can't tell what exists.
+    if repos is not None:
+        repo_indexes.set(user.username, index)
+
+    return index
+
+
+def get_travis_file_content(name, full_name, github_token, config):
+    """ Return the content of one of the files committed to the repo. """
+
+    if name == SCRIPT:
+        return travis_utils.get_script_contents(SCRIPT, config)
 
     info         = {
         'GIT_NAME': GIT_NAME,
@@ -366,29 +915,128 @@ def get_travis_files_content(full_name, github_token, config):
 
     user_pages   = github_utils.is_user_pages(full_name)
 
+    return travis_utils.get_yaml_contents(full_name, SCRIPT, info, user_pages)
+
+
+def get_travis_files_content(full_name, github_token, config):
+    """ Return the content of the files that will be committed to the repo. """
+
     travis_files = [
         {
-            'name': SCRIPT,
-            'content': travis_utils.get_script_contents(SCRIPT, config),
-            'message': (
-                'Add build and deploy script (via Statiki).\n\n[skip ci]'
+            'name': name,
+            'content': get_travis_file_content(
+                name, full_name, github_token, config
             ),
-        },
-        {
-            'name': '.travis.yml',
-            'content': travis_utils.get_yaml_contents(
-                full_name, SCRIPT, info, user_pages
-            ),
-            'message': 'Add .travis.yml (via Statiki).',
-        },
+            'message': message,
+        }
+        for name, message in TRAVIS_FILES
+    ]
+
+    return travis_files
+
+
+def get_travis_files_preview(full_name):
+    """ Return the names of the files, with URLs to preview their content.
+
+    The URLs change with the content, which is fetched only if viewed.
+
+    """
+
+    user, repo = full_name.split('/', 1)
+    yaml_info = [
+        full_name, GIT_NAME, GIT_EMAIL, github_utils.is_user_pages(full_name)
     ]
+    versions = {
+        SCRIPT: travis_utils.get_script_contents(SCRIPT),
+        '.travis.yml': json.dumps(yaml_info),
+    }
+
+    travis_files = []
+    for name, _ in TRAVIS_FILES:
+        version = hashlib.sha1(versions[name]).hexdigest()[:10]
+        url = url_for(
+            'show_preview', user=user, repo=repo, name=name, v=version
+        )
+        travis_files.append({'name': name, 'hash': version, 'url': url})
 
     return travis_files
 
+
+def is_valid_report(report):
+    """ Return True if a build report has the fields shown, as expected. """
+
+    number = (int, long, float)
+    if not isinstance(report, dict):
+        return False
+
+    output = report.get('output')
+    phases = report.get('phases')
+
+    return (
+        isinstance(report.get('duration'), number)
+        and isinstance(output, dict)
+        and isinstance(output.get('bytes'), number)
+        and isinstance(phases, list)
+        and all(
+            isinstance(phase, dict)
+            and isinstance(phase.get('duration'), number)
+            for phase in phases
+        )
+    )
+
+
+def prefetch(github_token, reserve):
+    """ Fill the caches of upstream data used by the views, for a user.
+
+    Run in the background after login, and checks between steps if it has
+    been cancelled.  Listing the repositories stops, rather than use up the
+    last `reserve` requests of the user's GitHub rate limit.
+
+    """
+
+    travis_token = run_prefetch_step(
+        'travis_token', travis_utils.is_travis_user, github_token
+    )
+    if travis_token is not None:
+        run_prefetch_step(
+            'travis_hooks', travis_utils.get_hooks, travis_token, refresh=True
+        )
+    run_prefetch_step(
+        'github_repos', github_utils.get_repos, github_token, reserve,
+        refresh=True
+    )
+
+
+def run_prefetch_step(name, func, *args, **kwargs):
+    """ Call func, unless prefetching was cancelled, and count the result.
+
+    """
+
+    job = jobs.current()
+    if job is not None and job.cancelled:
+        result, status = None, 'cancelled'
+
+    else:
+        result = func(*args, **kwargs)
+        status = 'failed' if result is None else 'ok'
+
+    PREFETCH_STEPS.inc(step=name, result=status)
+
+    return result
+
+
 #### Standalone ###############################################################
 
+def init_db():
+    """ Create the tables in the database, if they don't exist. """
+
+    create_app()
+    db.create_all()
+
+
 if __name__ == '__main__':
-    db.create_all()  # pragma: no cover
-    app.run(host='0.0.0.0')  # pragma: no cover
+    init_db()  # pragma: no cover
+    if sys.argv[1:] != ['initdb']:  # pragma: no cover
+        app.run(host='0.0.0.0')  # pragma: no cover
 
 #### EOF ######################################################################
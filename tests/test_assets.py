@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+# Standard library
+import gzip
+import json
+import os
+from os.path import join
+import shutil
+import tempfile
+import unittest
+
+# 3rd-party library
+from mock import patch
+
+# Local library
+import assets
+
+
+class TestAssets(unittest.TestCase):
+
+    def setUp(self):
+        self.static = tempfile.mkdtemp()
+        self.dist = join(self.static, 'dist')
+        for name in ('css', 'js'):
+            os.makedirs(join(self.static, name))
+        self._write('css/custom.css', '/* Comment */\nbody {\n    x: 1;\n}\n')
+        self._write('js/custom.js', 'var a = 1\n\n    var b = 2;\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.static)
+
+    def test_should_build_minified_bundles_with_hashed_names(self):
+        # When
+        manifest = assets.build(self.static, self.dist)
+
+        # Then
+        css = manifest['css/statiki.css']
+        self.assertRegexpMatches(css, r'^css/statiki\.[0-9a-f]{10}\.css$')
+        with open(join(self.dist, css)) as f:
+            self.assertEqual('body{x: 1;}\n', f.read())
+        with open(join(self.dist, manifest['js/statiki.js'])) as f:
+            self.assertEqual('var a = 1\nvar b = 2;\n', f.read())
+        with open(join(self.dist, assets.MANIFEST)) as f:
+            self.assertEqual(manifest, json.load(f))
+
+    def test_should_write_gzipped_bundles(self):
+        # When
+        manifest = assets.build(self.static, self.dist)
+
+        # Then
+        path = join(self.dist, manifest['css/statiki.css'])
+        with open(path) as f, gzip.open(path + '.gz') as g:
+            self.assertEqual(f.read(), g.read())
+
+    def test_should_write_gzipped_bundles_atomically_first(self):
+        # Given
+        written = []
+        write = assets._write
+
+        def record(path, content):
+            written.append(os.path.relpath(path, self.dist))
+            write(path, content)
+
+        # When
+        with patch('assets._write', record):
+            manifest = assets.build(self.static, self.dist)
+
+        # Then
+        css = manifest['css/statiki.css']
+        self.assertLess(written.index(css + '.gz'), written.index(css))
+
+    def test_should_rename_bundle_on_change(self):
+        # Given
+        old = assets.build(self.static, self.dist)
+        self._write('css/custom.css', 'body { y: 2; }')
+
+        # When
+        new = assets.build(self.static, self.dist)
+
+        # Then
+        self.assertNotEqual(old['css/statiki.css'], new['css/statiki.css'])
+        self.assertEqual(old['js/statiki.js'], new['js/statiki.js'])
+
+    #### Private protocol #####################################################
+
+    def _write(self, name, content):
+        with open(join(self.static, name), 'w') as f:
+            f.write(content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" Budgets for the number of upstream calls made by the views.
+
+The views are run against the stand-in GitHub and Travis servers, and every
+request they make is recorded.  A view going over its budget usually means
+an extra round trip crept in; lower the budget when a view gets cheaper.
+
+"""
+
+# Standard library
+from os.path import abspath, dirname, join
+import shutil
+import sys
+import tempfile
+import unittest
+
+# Local library
+HERE = dirname(abspath(__file__))
+sys.path.insert(0, join(dirname(HERE), 'benchmarks'))
+from fake_upstreams import FakeGitHub, FakeTravis, use_upstreams
+import github_utils
+import http_utils
+import statiki
+import travis_utils
+
+USER = 'fred'
+
+# Maximum number of calls to each upstream service, for each view.
+BUDGETS = {
+    'create_repo (new)': {'github': 3, 'travis': 2},
+    'create_repo (existing)': {'github': 2, 'travis': 2},
+    'create_repo (prefetched)': {'github': 3, 'travis': 0},
+    'create_repo (indexed, new)': {'github': 2, 'travis': 0},
+    # One probe for a .travis.yml, which the listings don't tell about.
+    'create_repo (indexed, existing)': {'github': 1, 'travis': 0},
+    'complete_repo_name (prefetched)': {'github': 0, 'travis': 0},
+    'manage (warm)': {'github': 4, 'travis': 5},
+    'manage (sync)': {'github': 4, 'travis': 8},
+    'preview (.travis.yml)': {'github': 0, 'travis': 1},
+    'preview (cached)': {'github': 0, 'travis': 0},
+}
+
+
+class TestBudgets(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.github = FakeGitHub()
+        cls.travis = FakeTravis(cls.github)
+        cls.github.start()
+        cls.travis.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.github.stop()
+        cls.travis.stop()
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        statiki.app.config['SQLALCHEMY_DATABASE_URI'] = (
+            'sqlite:///%s' % join(self.tempdir, 'test.db')
+        )
+        statiki.app.config['TESTING'] = True
+        statiki.db.create_all()
+        self.app = statiki.app.test_client()
+        self.upstreams = use_upstreams(self.github, self.travis)
+        self.upstreams.__enter__()
+
+        self.github.repos.clear()
+        self.travis.repos.clear()
+        github_utils.clear_caches()
+        travis_utils.clear_caches()
+        statiki.repo_indexes.clear()
+        self.github.add_user(USER)
+        user = statiki.User.get_or_create(USER, 1)
+        user.set_github_token('token-%s' % USER)
+        with self.app.session_transaction() as session:
+            session['user_id'] = user.id
+
+    def tearDown(self):
+        self.upstreams.__exit__(None, None, None)
+        statiki.db.session.remove()
+        statiki.db.drop_all()
+        shutil.rmtree(self.tempdir)
+
+    def test_create_repo_new(self):
+        # When
+        calls = self._post('/create_repo', repo_name='blog')
+
+        # Then
+        self.assertWithinBudget(calls, 'create_repo (new)')
+
+    def test_create_repo_prefetched(self):
+        # Given
+        statiki.prefetch('token-%s' % USER, 0)
+
+        # When
+        calls = self._post('/create_repo', repo_name='blog')
+
+        # Then
+        self.assertWithinBudget(calls, 'create_repo (prefetched)')
+
+    def test_create_repo_indexed(self):
+        # Given
+        self.github.add_repo('fred/blog')
+        self.travis.add_repo('fred/blog', active=True)
+        statiki.prefetch('token-%s' % USER, 0)
+        completion = self._get('/repos?prefix=b')
+
+        # When
+        new_calls = self._post('/create_repo', repo_name='site')
+        existing_calls = self._post('/create_repo', repo_name='blog')
+
+        # Then
+        self.assertWithinBudget(completion, 'complete_repo_name (prefetched)')
+        self.assertWithinBudget(new_calls, 'create_repo (indexed, new)')
+        self.assertWithinBudget(
+            existing_calls, 'create_repo (indexed, existing)'
+        )
+
+    def test_create_repo_existing(self):
+        # Given
+        self.github.add_repo('fred/blog', {'.travis.yml': 'language: c\n'})
+
+        # When
+        calls = self._post('/create_repo', repo_name='blog')
+
+        # Then
+        self.assertWithinBudget(calls, 'create_repo (existing)')
+
+    def test_preview(self):
+        # Given
+        self.github.add_repo('fred/blog')
+        self.travis.add_repo('fred/blog')
+        path = '/preview/fred/blog/.travis.yml'
+
+        # When
+        calls = self._get(path)
+        cached_calls = self._get(path)
+
+        # Then
+        self.assertWithinBudget(calls, 'preview (.travis.yml)')
+        self.assertWithinBudget(cached_calls, 'preview (cached)')
+
+    def test_manage_warm(self):
+        # Given
+        self.github.add_repo('fred/blog')
+        self.travis.add_repo('fred/blog')
+
+        # When
+        calls = self._post('/manage', full_name='fred/blog', data='')
+
+        # Then
+        self.assertWithinBudget(calls, 'manage (warm)')
+
+    def test_manage_sync(self):
+        # Given
+        self.github.add_repo('fred/blog')
+
+        # When
+        calls = self._post('/manage', full_name='fred/blog', data='')
+
+        # Then
+        self.assertWithinBudget(calls, 'manage (sync)')
+
+    def test_manage_replayed_with_many_hooks(self):
+        # Given
+        for i in range(2000):
+            self.travis.add_repo('fred/a%04d' % i)
+        self.github.add_repo('fred/blog')
+        self.travis.add_repo('fred/blog')
+        recording = join(self.tempdir, 'manage.jsonl')
+        http_utils.configure(record=recording)
+        self._post('/manage', full_name='fred/blog', data='')
+        http_utils.configure(replay=recording)
+        served = len(self.github.calls) + len(self.travis.calls)
+
+        # When
+        try:
+            calls = self._post('/manage', full_name='fred/blog', data='')
+        finally:
+            http_utils.configure()
+
+        # Then
+        self.assertEqual(
+            served, len(self.github.calls) + len(self.travis.calls)
+        )
+        self.assertWithinBudget(calls, 'manage (warm)')
+
+    def assertWithinBudget(self, calls, view):
+        """ Fail if the calls to any service go over the budget of a view. """
+
+        urls = {
+            'github': (github_utils.API_URL, github_utils.GITHUB_URL),
+            'travis': (travis_utils.API_URL,),
+        }
+        errors = []
+
+        for service, budget in sorted(BUDGETS[view].items()):
+            made = [
+                call for call in calls
+                if any(call.url.startswith(url + '/') for url in urls[service])
+            ]
+            if len(made) > budget:
+                errors.append(
+                    '%s made %d %s calls, over the budget of %d:\n%s' % (
+                        view, len(made), service, budget, '\n'.join(
+                            '    %s %s' % (call.method, call.url)
+                            for call in made
+                        )
+                    )
+                )
+
+        if errors:
+            self.fail('\n'.join(errors))
+
+    #### Private protocol #####################################################
+
+    def _get(self, path):
+        """ Get a view, and return the upstream calls it made. """
+
+        with http_utils.recording() as calls:
+            response = self.app.get(path)
+
+        self.assertEqual(200, response.status_code)
+
+        return calls
+
+    def _post(self, path, **data):
+        """ Post to a view, and return the upstream calls it made. """
+
+        with http_utils.recording() as calls:
+            response = self.app.post(path, data=data)
+
+        self.assertEqual(200, response.status_code)
+
+        return calls
+
+
+if __name__ == '__main__':
+    unittest.main()
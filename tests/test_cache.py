@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+# Standard library
+from os.path import exists, join
+import shutil
+import tempfile
+import unittest
+
+# 3rd-party library
+from mock import patch
+
+# Local library
+import cache
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = join(self.tempdir, 'cache.db')
+
+    def tearDown(self):
+        cache.configure('')
+        shutil.rmtree(self.tempdir)
+
+    def test_should_expire_values(self):
+        # Given
+        hooks = cache.Cache('test_hooks', ttl=60)
+
+        # When
+        with patch('time.time', return_value=1000):
+            hooks.set('token', {'blog': 1})
+        with patch('time.time', return_value=1059):
+            fresh = hooks.get('token')
+        with patch('time.time', return_value=1060):
+            expired = hooks.get('token')
+
+        # Then
+        self.assertEqual({'blog': 1}, fresh)
+        self.assertIsNone(expired)
+
+    def test_should_evict_least_recently_used(self):
+        # Given
+        keys = cache.Cache('test_keys', maxsize=2)
+        keys.set('a', 1)
+        keys.set('b', 2)
+        keys.get('a')
+
+        # When
+        keys.set('c', 3)
+
+        # Then
+        self.assertEqual(2, len(keys))
+        self.assertEqual([1, None, 3], [keys.get(k) for k in 'abc'])
+
+    def test_should_invalidate_namespace_in_all_caches(self):
+        # Given
+        cache.configure(self.path)
+        tokens = cache.Cache('test_tokens')
+        repos = cache.Cache('test_repos')
+        fred = cache.token_namespace('token-fred')
+        tokens.set('token-fred', 'travis-fred', namespace=fred)
+        repos.set('token-fred', ['fred/blog'], namespace=fred)
+        repos.set('token-jane', ['jane/blog'])
+
+        # When
+        cache.invalidate(fred)
+
+        # Then
+        self.assertIsNone(tokens.get('token-fred'))
+        self.assertIsNone(repos.get('token-fred'))
+        self.assertEqual(['jane/blog'], repos.get('token-jane'))
+        # Another process sees the invalidation too.
+        self.assertIsNone(cache.Cache('test_repos').get('token-fred'))
+
+    def test_should_share_values_across_processes(self):
+        # Given
+        cache.configure(self.path)
+        first = cache.Cache('test_status', ttl=60)
+        # Another process, with its own local tier.
+        second = cache.Cache('test_status', ttl=60)
+
+        # When
+        first.set('github', 'All good')
+        value = second.get('github')
+
+        # Then
+        self.assertEqual('All good', value)
+        self.assertEqual(1, second.stats()['shared_hit'])
+        self.assertNotIn('github', self._read_shared_tier())
+
+    def test_should_keep_secrets_out_of_shared_tier(self):
+        # Given
+        cache.configure(self.path)
+        cache.Cache('test_status').set('github', 'All good')
+        tokens = cache.Cache('test_secrets', shared=False)
+
+        # When
+        tokens.set('token-fred', 'travis-fred')
+
+        # Then
+        self.assertEqual('travis-fred', tokens.get('token-fred'))
+        other = cache.Cache('test_secrets', shared=False)
+        self.assertIsNone(other.get('token-fred'))
+        self.assertNotIn('travis-fred', self._read_shared_tier())
+
+    def test_should_bound_size_of_shared_tier(self):
+        # Given
+        store = cache.SQLiteStore(self.path, maxsize=10)
+
+        # When
+        with patch('cache.CLEANUP_INTERVAL', 5):
+            for i in range(50):
+                store.set('test', i, (i, None, None))
+
+        # Then
+        rows = store._execute('SELECT COUNT(*) FROM entries', ())
+        self.assertLessEqual(rows[0][0], 15)
+        self.assertEqual((49, None, None), store.get('test', 49))
+        self.assertIsNone(store.get('test', 0))
+
+    def test_should_treat_shared_tier_errors_as_misses(self):
+        # Given
+        cache.configure(join(self.tempdir, 'missing', 'cache.db'))
+        keys = cache.Cache('test_errors')
+
+        # When
+        keys.set('repo', 'key')
+        value = keys.get('repo')
+
+        # Then
+        self.assertEqual('key', value)
+        self.assertIsNone(cache.Cache('test_errors').get('repo'))
+
+
+    #### Private protocol #####################################################
+
+    def _read_shared_tier(self):
+        """ Return the bytes of the database and its write-ahead log. """
+
+        data = ''
+        for path in (self.path, self.path + '-wal'):
+            if exists(path):
+                with open(path, 'rb') as f:
+                    data += f.read()
+
+        return data
+
+
+if __name__ == '__main__':
+    unittest.main()
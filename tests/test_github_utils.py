@@ -6,12 +6,16 @@
 # Standard library
 import json
 import os
+from os.path import abspath, dirname, join
+import sys
 import unittest
 
 # 3rd-party library
 from mock import Mock, patch
 
 # Local library
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'benchmarks'))
+from fake_upstreams import FakeGitHub, FakeTravis, use_upstreams
 import github_utils
 
 
@@ -28,6 +32,46 @@ THIS_REPO = 'punchagan/statiki'
 GH_TOKEN = get_gh_token(BOGUS)
 
 
+class TestRepoListing(unittest.TestCase):
+
+    def setUp(self):
+        github_utils.clear_caches()
+
+    def test_should_list_all_pages_once(self):
+        # Given
+        github = FakeGitHub()
+        github.add_user('fred')
+        for i in range(250):
+            github.add_repo('fred/site-%03d' % i)
+        travis = FakeTravis(github)
+
+        # When
+        with github, travis, use_upstreams(github, travis):
+            repos = github_utils.get_repos('token-fred')
+            cached = github_utils.get_repos('token-fred')
+
+        # Then
+        self.assertEqual(250, len(repos))
+        self.assertEqual(repos, cached)
+        self.assertEqual(3, len(github.calls))
+
+    def test_should_stop_listing_near_rate_limit(self):
+        # Given
+        github = FakeGitHub(rate_limit=10)
+        github.add_user('fred')
+        for i in range(250):
+            github.add_repo('fred/site-%03d' % i)
+        travis = FakeTravis(github)
+
+        # When
+        with github, travis, use_upstreams(github, travis):
+            repos = github_utils.get_repos('token-fred', reserve=10)
+
+        # Then
+        self.assertIsNone(repos)
+        self.assertEqual(1, len(github.calls))
+
+
 @unittest.skipIf(GH_TOKEN == BOGUS, 'Need a real GitHub token...')
 class TestGitHubUtils(unittest.TestCase):
 
@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+# Standard library
+import base64
+import json
+import os
+from os.path import abspath, dirname, join
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# 3rd-party library
+from mock import Mock, patch
+import requests
+
+# Local library
+ROOT = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, join(ROOT, 'benchmarks'))
+from fake_upstreams import FakeGitHub
+import http_utils
+
+# Parse a large array of hooks in a new process, and print its peak memory.
+MEMORY_SCRIPT = """
+import json, resource, sys
+import http_utils
+
+class Response(object):
+    def iter_content(self, chunk_size):
+        yield '['
+        for i in xrange(int(sys.argv[1])):
+            hook = {'id': i, 'name': 'site-%d' % i, 'owner_name': 'fred',
+                    'active': False, 'description': 'x' * 200}
+            yield (', ' if i else '') + json.dumps(hook)
+        yield ']'
+
+for hook in http_utils.iter_json_array(Response(), ('id', 'name')):
+    pass
+print resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+"""
+
+
+class TestHttpUtils(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.recording = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+
+    def tearDown(self):
+        http_utils.configure()
+        os.remove(self.recording)
+
+    def test_should_count_requests_by_status(self):
+        # Given
+        url = 'https://api.github.com/users/punchagan'
+        labels = dict(host='api.github.com', method='GET', status=404)
+        before = http_utils.UPSTREAM_REQUESTS.get(**labels)
+        response = Mock(status_code=404)
+
+        # When
+        with patch('requests.get', Mock(return_value=response)):
+            http_utils.get(url)
+
+        # Then
+        self.assertEqual(
+            before + 1, http_utils.UPSTREAM_REQUESTS.get(**labels)
+        )
+
+    def test_should_count_connection_errors(self):
+        # Given
+        url = 'https://api.travis-ci.org/hooks'
+        labels = dict(
+            host='api.travis-ci.org', method='GET', error='ConnectionError'
+        )
+        before = http_utils.UPSTREAM_ERRORS.get(**labels)
+        error = Mock(side_effect=requests.ConnectionError)
+
+        # When
+        with patch('requests.get', error):
+            with self.assertRaises(requests.ConnectionError):
+                http_utils.get(url)
+
+        # Then
+        self.assertEqual(before + 1, http_utils.UPSTREAM_ERRORS.get(**labels))
+        self.assertGreater(
+            http_utils.UPSTREAM_LATENCY.get(
+                host='api.travis-ci.org', method='GET'
+            ), 0
+        )
+
+    def test_should_record_calls_within_block(self):
+        # Given
+        url = 'https://api.github.com/users/punchagan'
+        response = Mock(status_code=200)
+
+        # When
+        with patch('requests.get', Mock(return_value=response)):
+            http_utils.get(url)
+            with http_utils.recording() as calls:
+                http_utils.get(url)
+            http_utils.get(url)
+
+        # Then
+        self.assertEqual(1, len(calls))
+        self.assertEqual(('GET', url, 200), calls[0][:3])
+
+    def test_should_replay_recorded_responses(self):
+        # Given
+        url = 'https://api.travis-ci.org/users/'
+        responses = [self._get_response({'is_syncing': syncing})
+                     for syncing in (True, False)]
+        http_utils.configure(record=self.recording)
+        with patch('requests.get', Mock(side_effect=responses)):
+            http_utils.get(url)
+            http_utils.get(url)
+
+        # When
+        http_utils.configure(replay=self.recording)
+        with patch('requests.get', Mock(side_effect=AssertionError)):
+            replayed = [http_utils.get(url).json() for _ in range(3)]
+
+        # Then
+        self.assertEqual(
+            [{'is_syncing': True}] + [{'is_syncing': False}] * 2, replayed
+        )
+
+    def test_should_redact_secrets_in_recording(self):
+        # Given
+        url = 'https://api.github.com/repos/fred/blog/contents/.travis.yml'
+        content = base64.b64encode('env:\n  global:\n    secure: s3cr3t\n')
+        response = self._get_response(
+            {'access_token': 't0k3n', 'content': content}
+        )
+        http_utils.configure(record=self.recording)
+
+        # When
+        with patch('requests.get', Mock(return_value=response)):
+            http_utils.get(url, params={'access_token': 't0k3n'})
+
+        # Then
+        with open(self.recording) as f:
+            recorded = f.read()
+        self.assertNotIn('t0k3n', recorded)
+        body = json.loads(json.loads(recorded)['body'])
+        self.assertNotIn('s3cr3t', base64.b64decode(body['content']))
+
+    def test_should_fail_to_replay_unknown_request(self):
+        # Given
+        http_utils.configure(replay=self.recording)
+
+        # When/Then
+        with self.assertRaises(requests.ConnectionError):
+            http_utils.get('https://api.github.com/users/punchagan')
+
+    #### Private protocol #####################################################
+
+    def _get_response(self, data):
+        response = requests.Response()
+        response.status_code = 200
+        response.headers['Content-Type'] = 'application/json'
+        response._content = json.dumps(data)
+        return response
+
+
+class TestCoalescing(unittest.TestCase):
+
+    url = 'https://api.travis-ci.org/repos/punchagan/statiki'
+
+    def setUp(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.response = Mock(status_code=200)
+
+    def test_should_share_identical_concurrent_gets(self):
+        # Given
+        labels = dict(host='api.travis-ci.org', method='GET')
+        before = http_utils.UPSTREAM_COALESCED.get(**labels)
+
+        # When
+        with patch('requests.get', Mock(side_effect=self._slow_get)) as get:
+            results = self._get_concurrently(
+                {'Authorization': 'token x'}, {'Authorization': 'token x'}
+            )
+
+        # Then
+        self.assertEqual(1, get.call_count)
+        self.assertEqual([self.response, self.response], results)
+        self.assertEqual(
+            before + 1, http_utils.UPSTREAM_COALESCED.get(**labels)
+        )
+
+    def test_should_not_share_gets_with_other_headers(self):
+        # When
+        with patch('requests.get', Mock(side_effect=self._slow_get)) as get:
+            self._get_concurrently(
+                {'Authorization': 'token x'}, {'Authorization': 'token y'}
+            )
+
+        # Then
+        self.assertEqual(2, get.call_count)
+
+    def test_should_share_errors(self):
+        # Given
+        def fail(url, **kwargs):
+            self.started.set()
+            self.release.wait(5)
+            raise requests.ConnectionError()
+
+        # When
+        with patch('requests.get', Mock(side_effect=fail)):
+            results = self._get_concurrently({}, {})
+
+        # Then
+        self.assertTrue(
+            all(isinstance(r, requests.ConnectionError) for r in results)
+        )
+
+    def test_should_share_calls_with_the_same_key(self):
+        # Given
+        joined = threading.Event()
+        wait = http_utils._Flight.wait
+        results = []
+
+        def join(flight):
+            joined.set()
+            return wait(flight)
+
+        def slow_call(value):
+            self.started.set()
+            self.release.wait(5)
+            return value
+
+        def share():
+            results.append(http_utils.share(('test', 1), call, 'hooks'))
+
+        call = Mock(side_effect=slow_call)
+        threads = [threading.Thread(target=share) for _ in range(2)]
+
+        # When
+        with patch('http_utils._Flight.wait', join):
+            threads[0].start()
+            self.started.wait(5)
+            threads[1].start()
+            joined.wait(5)
+            self.release.set()
+            for thread in threads:
+                thread.join(5)
+
+        # Then
+        self.assertEqual(1, call.call_count)
+        self.assertEqual(['hooks', 'hooks'], results)
+
+    def _get_concurrently(self, first_headers, second_headers):
+        """ Make a GET, and another once the first is in flight. """
+
+        results = [None, None]
+        coalesced = http_utils.UPSTREAM_COALESCED.get(
+            host='api.travis-ci.org', method='GET'
+        )
+
+        def get(index, headers):
+            try:
+                results[index] = http_utils.get(self.url, headers=headers)
+            except requests.RequestException as e:
+                results[index] = e
+
+        first = threading.Thread(target=get, args=(0, first_headers))
+        first.start()
+        self.started.wait(5)
+        self.started.clear()
+        second = threading.Thread(target=get, args=(1, second_headers))
+        second.start()
+
+        # Wait for the second to join the first, or to start its own.
+        until = time.time() + 5
+        while time.time() < until and not self.started.is_set():
+            if http_utils.UPSTREAM_COALESCED.get(
+                    host='api.travis-ci.org', method='GET') > coalesced:
+                break
+            time.sleep(0.01)
+
+        self.release.set()
+        first.join(5)
+        second.join(5)
+
+        return results
+
+    def _slow_get(self, url, **kwargs):
+        self.started.set()
+        self.release.wait(5)
+        return self.response
+
+
+class TestJSONStreaming(unittest.TestCase):
+
+    def test_should_parse_array_split_anywhere(self):
+        # Given
+        items = [
+            {'a': 'x"]}\\', 'b': [1, {'c': 2}]}, 1, 'str,]', None, True,
+            2.5, [3], {},
+        ]
+        text = ' %s ' % json.dumps(items)
+
+        for size in (1, 2, 3, 7, len(text)):
+            # When
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            response = Mock(iter_content=Mock(return_value=iter(chunks)))
+            parsed = list(http_utils.iter_json_array(response))
+
+            # Then
+            self.assertEqual(items, parsed)
+
+    def test_should_keep_only_given_fields(self):
+        # Given
+        text = json.dumps([{'id': 1, 'name': 'blog', 'description': 'x'}])
+        response = Mock(iter_content=Mock(return_value=iter([text])))
+
+        # When
+        hooks = list(http_utils.iter_json_array(response, ('id', 'name')))
+
+        # Then
+        self.assertEqual([{'id': 1, 'name': 'blog'}], hooks)
+
+    def test_should_fail_on_unterminated_array(self):
+        # Given
+        response = Mock(iter_content=Mock(return_value=iter(['[{"id": 1}'])))
+
+        # When/Then
+        with self.assertRaises(ValueError):
+            list(http_utils.iter_json_array(response))
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'kB in maxrss')
+    def test_should_parse_in_bounded_memory(self):
+        # Python 2 has no tracemalloc, so compare the peak memory of
+        # processes parsing arrays of very different sizes.  Parsing the
+        # larger one whole would take more than 100 MB.
+
+        # When
+        small, large = [
+            int(subprocess.check_output(
+                [sys.executable, '-c', MEMORY_SCRIPT, str(count)], cwd=ROOT
+            ))
+            for count in (1000, 50000)
+        ]
+
+        # Then
+        self.assertLess(large - small, 1024)
+
+
+class TestPagination(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.github = FakeGitHub()
+        for i in range(1000):
+            cls.github.add_repo('fred/site-%04d' % i)
+        cls.github.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.github.stop()
+
+    def setUp(self):
+        del self.github.calls[:]
+        self.url = '%s/user/repos' % self.github.url
+        self.headers = {'Authorization': 'token token-fred'}
+
+    def test_should_fetch_all_pages_in_order(self):
+        # When
+        pages = http_utils.iter_pages(
+            self.url, headers=self.headers, params={'per_page': 100}
+        )
+        names = [repo['full_name'] for page in pages for repo in page.json()]
+
+        # Then
+        self.assertEqual(self.github.get_repos('fred'), names)
+        self.assertEqual(10, len(self.github.calls))
+
+    def test_should_stop_fetching_when_caller_stops(self):
+        # Given
+        pages = http_utils.iter_pages(
+            self.url, concurrency=2, headers=self.headers,
+            params={'per_page': 100}
+        )
+
+        # When
+        for page in pages:
+            if 'fred/site-0150' in [repo['full_name'] for repo in page.json()]:
+                break
+        pages.close()
+
+        # Then
+        self.assertLessEqual(len(self.github.calls), 4)
+
+    def test_should_follow_next_links_without_last_link(self):
+        # Given
+        first = Mock(ok=True, links={'next': {'url': 'https://x/?page=2'}})
+        second = Mock(ok=True, links={})
+        get = Mock(side_effect=[first, second])
+
+        # When
+        with patch('http_utils.get', get):
+            pages = list(http_utils.iter_pages('https://x/', params={}))
+
+        # Then
+        self.assertEqual([first, second], pages)
+        get.assert_called_with('https://x/?page=2')
+
+
+if __name__ == '__main__':
+    unittest.main()
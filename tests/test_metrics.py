@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+# Standard library
+import json
+import os
+from os.path import join
+import shutil
+import tempfile
+import unittest
+
+# Local library
+import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.metrics = list(metrics._metrics)
+        del metrics._metrics[:]
+
+    def tearDown(self):
+        metrics.configure(None)
+        metrics._metrics[:] = self.metrics
+        shutil.rmtree(self.temp_dir)
+
+    def test_should_expose_counter(self):
+        # Given
+        counter = metrics.Counter('calls_total', 'Calls.', labels=('host',))
+
+        # When
+        counter.inc(host='api.github.com')
+        counter.inc(2, host='api.github.com')
+
+        # Then
+        self.assertIn('# TYPE calls_total counter', metrics.expose())
+        self.assertIn(
+            'calls_total{host="api.github.com"} 3.0', metrics.expose()
+        )
+
+    def test_should_expose_histogram(self):
+        # Given
+        histogram = metrics.Histogram('latency', 'Latency.', buckets=(1, 5))
+
+        # When
+        histogram.observe(0.5)
+        histogram.observe(3)
+
+        # Then
+        exposed = metrics.expose()
+        self.assertIn('latency_bucket{le="1.0"} 1.0', exposed)
+        self.assertIn('latency_bucket{le="5.0"} 2.0', exposed)
+        self.assertIn('latency_sum 3.5', exposed)
+        self.assertIn('latency_count 2.0', exposed)
+
+    def test_should_add_up_values_across_processes(self):
+        # Given
+        metrics.configure(self.temp_dir)
+        counter = metrics.Counter('calls_total', 'Calls.')
+        histogram = metrics.Histogram('latency', 'Latency.', buckets=(1, 5))
+        counter.inc()
+        histogram.observe(3)
+
+        # When
+        pid = os.fork()
+        if pid == 0:
+            metrics.reset()
+            counter.inc(2)
+            histogram.observe(0.5)
+            metrics.flush()
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        # Then
+        exposed = metrics.expose()
+        self.assertIn('calls_total 3.0', exposed)
+        self.assertIn('latency_bucket{le="1.0"} 1.0', exposed)
+        self.assertIn('latency_count 2.0', exposed)
+
+    def test_should_ignore_gauges_of_dead_processes(self):
+        # Given
+        metrics.configure(self.temp_dir)
+        gauge = metrics.Gauge('in_progress', 'In progress.')
+        counter = metrics.Counter('calls_total', 'Calls.')
+        gauge.inc()
+        dead = {'in_progress': [[[], 5]], 'calls_total': [[[], 5]]}
+        with open(join(self.temp_dir, '%d.json' % (2 ** 22 + 1)), 'w') as f:
+            json.dump(dead, f)
+
+        # When
+        exposed = metrics.expose()
+
+        # Then
+        self.assertIn('in_progress 1.0', exposed)
+        self.assertIn('calls_total 5.0', exposed)
+
+    def test_should_ignore_files_not_named_by_pid(self):
+        # Given
+        metrics.configure(self.temp_dir)
+        counter = metrics.Counter('calls_total', 'Calls.')
+        counter.inc()
+        with open(join(self.temp_dir, 'notes.json'), 'w') as f:
+            json.dump({'calls_total': [[[], 5]]}, f)
+
+        # When
+        exposed = metrics.expose()
+
+        # Then
+        self.assertIn('calls_total 1.0', exposed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+# Standard library
+import shutil
+import tempfile
+import unittest
+
+# 3rd-party library
+from mock import patch
+
+# Local library
+import profiling
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        profiling.configure(None)
+        shutil.rmtree(self.temp_dir)
+
+    def test_should_not_profile_when_disabled(self):
+        self.assertIsNone(profiling.maybe_start())
+
+    def test_should_not_profile_until_started(self):
+        # Given
+        profiling.configure(self.temp_dir)
+
+        # When/Then
+        self.assertIsNone(profiling.maybe_start())
+
+    def test_should_profile_sampled_requests(self):
+        # Given
+        profiling.configure(self.temp_dir)
+        profiling.start(rate=50)
+
+        # When
+        with patch('random.random', lambda: 0.4):
+            sampled = profiling.maybe_start()
+        with patch('random.random', lambda: 0.6):
+            skipped = profiling.maybe_start()
+        profiling.finish(sampled)
+
+        # Then
+        self.assertIsNotNone(sampled)
+        self.assertIsNone(skipped)
+
+    def test_should_stop_profiling_after_given_seconds(self):
+        # Given
+        profiling.configure(self.temp_dir)
+        profiling.start(seconds=60)
+
+        # When
+        with patch('time.time', lambda: 2 ** 40):
+            profiler = profiling.maybe_start()
+
+        # Then
+        self.assertIsNone(profiler)
+
+    def test_should_collect_profiles(self):
+        # Given
+        profiling.configure(self.temp_dir)
+        profiling.start()
+
+        # When
+        for _ in range(2):
+            profiler = profiling.maybe_start()
+            sorted(range(1000))
+            profiling.finish(profiler)
+        stats = profiling.collect()
+
+        # Then
+        calls = [
+            (function, info[0]) for (_, _, function), info in
+            stats.stats.items() if 'sorted' in function
+        ]
+        self.assertEqual([('<sorted>', 2)], calls)
+        self.assertGreater(len(profiling.dump(stats)), 0)
+
+    def test_should_clear_profiles(self):
+        # Given
+        profiling.configure(self.temp_dir)
+        profiling.start()
+        profiling.finish(profiling.maybe_start())
+
+        # When
+        profiling.clear()
+
+        # Then
+        self.assertIsNone(profiling.collect())
+        self.assertIsNone(profiling.get_status())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+# Standard library
+import unittest
+
+# Local library
+from repo_index import RepoIndex, TTL
+
+
+class TestRepoIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = RepoIndex()
+        for name in ('statiki', 'Site', 'sites', 'blog', 'stat'):
+            self.index.add(name, exists=True)
+
+    def test_should_find_names_with_prefix(self):
+        # When
+        repos = self.index.search('st')
+
+        # Then
+        self.assertEqual(['stat', 'statiki'], [r['name'] for r in repos])
+
+    def test_should_ignore_case(self):
+        # When
+        repos = self.index.search('SI')
+
+        # Then
+        self.assertEqual(['Site', 'sites'], [r['name'] for r in repos])
+        self.assertIn('site', self.index)
+
+    def test_should_limit_results(self):
+        # When
+        repos = self.index.search('', limit=2)
+
+        # Then
+        self.assertEqual(['blog', 'Site'], [r['name'] for r in repos])
+
+    def test_should_update_flags(self):
+        # Given
+        self.index.add('blog', travis=True, travis_yml=True)
+
+        # When
+        repo = self.index.get('blog')
+
+        # Then
+        self.assertEqual(5, len(self.index))
+        self.assertEqual(
+            {'name': 'blog', 'exists': True, 'travis': True,
+             'travis_yml': True},
+            repo
+        )
+        self.assertIsNone(self.index.get('missing'))
+
+    def test_should_expire(self):
+        # Given
+        created = self.index.created
+
+        # When/Then
+        self.assertFalse(self.index.is_expired(created + TTL))
+        self.assertTrue(self.index.is_expired(created + TTL + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,10 +4,14 @@
 # See the LICENSE file for license rights and limitations (MIT).
 
 from contextlib import contextmanager
+import gzip
+from io import BytesIO
 import json
 import os
 from os.path import abspath, exists, join
 import shutil
+import subprocess
+import sys
 import tempfile
 import unittest
 
@@ -15,8 +19,9 @@ from mock import Mock, patch
 from rauth.service import OAuth2Service
 from requests import Response
 
-import statiki
+import jobs
 import messages
+import statiki
 
 
 GH_TOKEN = 'this-is-a-bogus-token'
@@ -32,6 +37,7 @@ class TestStatiki(unittest.TestCase):
             'sqlite:///%s' % self.db_path
         )
         statiki.app.config['TESTING'] = True
+        statiki.app.config['PREFETCH_RESERVE'] = ''
         statiki.db.create_all()
         self.app = statiki.app.test_client()
 
@@ -97,6 +103,35 @@ class TestStatiki(unittest.TestCase):
         # Then
         self.assertEqual(messages.ONLY_HOOKS_ENABLED, message)
 
+    def test_should_not_import_heavy_modules_on_start(self):
+        # Given
+        heavy = ['rauth', 'requests', 'rsa', 'yaml']
+        script = (
+            'import sys, statiki; statiki.create_app(); '
+            'print [name for name in %r if name in sys.modules]' % heavy
+        )
+
+        # When
+        output = subprocess.check_output(
+            [sys.executable, '-c', script],
+            cwd=statiki.HERE, stderr=subprocess.STDOUT
+        )
+
+        # Then
+        self.assertEqual('[]', output.splitlines()[-1])
+
+    def test_should_turn_off_tracing_when_recreating_app(self):
+        # Given
+        statiki.create_app({'TRACE_SLOW_REQUESTS': '1.5'})
+        enabled = statiki.tracing._state['threshold']
+
+        # When
+        statiki.create_app({'TRACE_SLOW_REQUESTS': ''})
+
+        # Then
+        self.assertEqual(1.5, enabled)
+        self.assertIsNone(statiki.tracing._state['threshold'])
+
     def test_should_show_index(self):
         # Given/When
         response = self.app.get('/')
@@ -105,6 +140,70 @@ class TestStatiki(unittest.TestCase):
         self.assertEqual(200, response.status_code)
         self.assertIn(statiki.DESCRIPTION, response.data)
 
+    def test_should_serve_cached_index_with_etag(self):
+        # Given
+        statiki.pages.clear()
+        hits = statiki.PAGE_CACHE.get(view='index', result='hit')
+        first = self.app.get('/')
+
+        # When
+        response = self.app.get(
+            '/', headers={'If-None-Match': first.headers['ETag']}
+        )
+
+        # Then
+        self.assertEqual(200, first.status_code)
+        self.assertEqual(304, response.status_code)
+        self.assertIn('public', first.headers['Cache-Control'])
+        self.assertIn('Cookie', first.headers['Vary'])
+        self.assertEqual(
+            hits + 1, statiki.PAGE_CACHE.get(view='index', result='hit')
+        )
+
+    def test_should_compress_large_pages(self):
+        # Given
+        statiki.pages.clear()
+        headers = {'Accept-Encoding': 'gzip'}
+        first = self.app.get('/', headers=headers)
+
+        # When
+        headers['If-None-Match'] = first.headers['ETag']
+        response = self.app.get('/', headers=headers)
+
+        # Then
+        body = gzip.GzipFile(fileobj=BytesIO(first.data)).read()
+        self.assertEqual('gzip', first.headers['Content-Encoding'])
+        self.assertIn(statiki.DESCRIPTION, body)
+        self.assertTrue(first.headers['ETag'].startswith('W/'))
+        self.assertEqual(304, response.status_code)
+
+    def test_should_not_cache_index_for_logged_in_users(self):
+        # Given
+        statiki.pages.clear()
+
+        # When
+        with self.logged_in('fred'):
+            response = self.app.get('/')
+
+        # Then
+        self.assertIn('private', response.headers['Cache-Control'])
+        self.assertNotIn('ETag', response.headers)
+        self.assertIsNone(statiki.pages.get('/'))
+
+    def test_should_serve_gzipped_assets_forever(self):
+        # Given
+        with statiki.app.test_request_context():
+            url = statiki.asset_url('css/statiki.css')
+
+        # When
+        response = self.app.get(url, headers={'Accept-Encoding': 'gzip'})
+
+        # Then
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('gzip', response.headers['Content-Encoding'])
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+
     def test_should_redirect_to_authorize_on_login(self):
         # Given/When
         response = self.app.get('/login')
@@ -143,6 +242,154 @@ class TestStatiki(unittest.TestCase):
         self.assertEqual(302, response.status_code)
         self.assertIn(statiki.DESCRIPTION, next_response.data)
 
+    def test_should_prefetch_after_login(self):
+        # Given
+        statiki.app.config['PREFETCH_RESERVE'] = '500'
+
+        # When
+        with patch('jobs.submit') as submit:
+            with self.logged_in():
+                pass
+
+        # Then
+        submit.assert_called_once_with(statiki.prefetch, GH_TOKEN, 500)
+        self.assertTrue(submit.return_value.cancel.called)
+
+    def test_should_stop_prefetch_when_cancelled(self):
+        # Given
+        def is_travis_user(github_token):
+            jobs.current().cancel()
+            return 'travis-token'
+
+        job = jobs.Job(statiki.prefetch, (GH_TOKEN, 500), {})
+        labels = {'step': 'github_repos', 'result': 'cancelled'}
+        cancelled = statiki.PREFETCH_STEPS.get(**labels)
+
+        # When
+        with patch('travis_utils.is_travis_user', is_travis_user):
+            with patch('travis_utils.get_hooks') as get_hooks:
+                with patch('github_utils.get_repos') as get_repos:
+                    job.run()
+
+        # Then
+        self.assertFalse(get_hooks.called)
+        self.assertFalse(get_repos.called)
+        self.assertEqual(
+            cancelled + 1, statiki.PREFETCH_STEPS.get(**labels)
+        )
+
+    def test_should_complete_repo_names(self):
+        # Given
+        statiki.repo_indexes.clear()
+        repos = Mock(return_value=['fred/blog', 'fred/site', 'org/books'])
+        hooks = Mock(return_value={
+            ('fred', 'blog'): {'active': True},
+            ('fred', 'bits'): {'active': False},
+        })
+
+        # When
+        with self.logged_in('fred'):
+            with patch('github_utils.get_repos', repos):
+                with patch('travis_utils.get_hooks', hooks):
+                    response = self.app.get('/repos?prefix=B')
+
+        # Then
+        expected = [
+            {'name': 'bits', 'exists': False, 'travis': True,
+             'travis_yml': None},
+            {'name': 'blog', 'exists': True, 'travis': True,
+             'travis_yml': None},
+        ]
+        self.assertEqual(expected, json.loads(response.data)['repos'])
+
+    def test_should_probe_travis_yml_of_repo_with_active_hook(self):
+        # Given
+        statiki.repo_indexes.clear()
+        repos = Mock(return_value=['fred/blog'])
+        hooks = Mock(return_value={('fred', 'blog'): {'active': True}})
+        exists = Mock(return_value=None)
+
+        # When
+        with self.logged_in('fred'):
+            with patch('github_utils.get_repos', repos):
+                with patch('travis_utils.get_hooks', hooks):
+                    self.app.get('/repos?prefix=b')
+                    with patch('github_utils.exists', exists):
+                        response = self.app.post(
+                            '/create_repo', data={'repo_name': 'blog'}
+                        )
+            index = statiki.repo_indexes.get('fred')
+
+        # Then
+        data = json.loads(response.data)
+        self.assertEqual(1, exists.call_count)
+        self.assertFalse(data['overwrite'])
+        self.assertEqual(messages.REPO_EXISTS, data['message'])
+        self.assertFalse(index.get('blog')['travis_yml'])
+
+    def test_should_create_repo_without_probes_when_indexed(self):
+        # Given
+        statiki.repo_indexes.clear()
+        index = statiki.repo_index.RepoIndex()
+        index.add('blog', exists=True, travis_yml=True)
+        probe = Mock()
+
+        # When
+        with self.logged_in('fred'):
+            # Logging in drops any index, so add it after.
+            statiki.repo_indexes.set('fred', index)
+            with patch('github_utils.is_valid_repository', probe):
+                with patch('github_utils.exists', probe):
+                    response = self.app.post(
+                        '/create_repo', data={'repo_name': 'blog'}
+                    )
+
+        # Then
+        data = json.loads(response.data)
+        self.assertFalse(probe.called)
+        self.assertTrue(data['exists'])
+        self.assertTrue(data['overwrite'])
+
+    def test_should_find_repo_created_after_indexing(self):
+        # Given
+        statiki.repo_indexes.clear()
+        index = statiki.repo_index.RepoIndex()
+        index.add('blog', exists=True, travis_yml=True)
+        create = Mock(return_value=False)
+        probe = Mock(return_value=True)
+
+        # When
+        with self.logged_in('fred'):
+            # Logging in drops any index, so add it after.
+            statiki.repo_indexes.set('fred', index)
+            with patch('github_utils.create_new_repository', create):
+                with patch('github_utils.is_valid_repository', probe):
+                    with patch('github_utils.exists', Mock(return_value=None)):
+                        response = self.app.post(
+                            '/create_repo', data={'repo_name': 'site'}
+                        )
+
+        # Then
+        data = json.loads(response.data)
+        self.assertTrue(create.called)
+        self.assertTrue(data['exists'])
+        self.assertEqual(messages.REPO_EXISTS, data['message'])
+        self.assertTrue(index.get('site')['exists'])
+
+    def test_should_drop_expired_repo_index(self):
+        # Given
+        statiki.repo_indexes.clear()
+        index = statiki.repo_index.RepoIndex()
+        index.created -= statiki.repo_index.TTL + 1
+        statiki.repo_indexes.set('fred', index)
+
+        # When
+        cached = statiki.get_cached_repo_index('fred')
+
+        # Then
+        self.assertIsNone(cached)
+        self.assertIsNone(statiki.repo_indexes.get('fred'))
+
     def test_should_show_travis_signup(self):
         # Given/When
         with self.logged_in(travis_user=False):
@@ -156,13 +403,12 @@ class TestStatiki(unittest.TestCase):
 
     def test_should_create_repo(self):
         # Given
-        content = [{'name': 'bazooka', 'content': 'bar', 'message': ''}]
-        get_content = Mock(return_value=content)
+        get_content = Mock()
 
         # When
         with self.logged_in('punchagan'):
             with patch('github_utils.create_new_repository', Mock()) as create:
-                with patch('statiki.get_travis_files_content', get_content):
+                with patch('statiki.get_travis_file_content', get_content):
                     response = self.app.post(
                         '/create_repo', data={'repo_name': 'foo'}
                     )
@@ -172,10 +418,44 @@ class TestStatiki(unittest.TestCase):
         self.assertEqual(args, ('punchagan/foo', GH_TOKEN))
         data = json.loads(response.data)
         self.assertTrue(data['created'])
-        self.assertIn('bazooka', data['contents'])
-        self.assertIn('bar', data['contents'])
+        self.assertIn('.travis.yml', data['contents'])
+        self.assertEqual(
+            [statiki.SCRIPT, '.travis.yml'],
+            [f['name'] for f in data['files']]
+        )
+        self.assertIn(
+            '/preview/punchagan/foo/.travis.yml?v=', data['files'][1]['url']
+        )
+        self.assertFalse(get_content.called)
         self.assertEqual(messages.CREATE_REPO_SUCCESS, data['message'])
 
+    def test_should_preview_file(self):
+        # Given
+        get_content = Mock(return_value='language: python')
+
+        # When
+        with self.logged_in('punchagan'):
+            with patch('statiki.get_travis_file_content', get_content):
+                response = self.app.get('/preview/punchagan/foo/.travis.yml')
+
+        # Then
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('language: python', response.data)
+        self.assertEqual('text/plain', response.mimetype)
+        self.assertIn('private', response.headers['Cache-Control'])
+        args, _ = get_content.call_args
+        self.assertEqual(args, ('.travis.yml', 'punchagan/foo', GH_TOKEN, {}))
+
+    def test_should_not_preview_others_files(self):
+        # Given/When
+        with self.logged_in('punchagan'):
+            others = self.app.get('/preview/bazooka/foo/.travis.yml')
+            unknown = self.app.get('/preview/punchagan/foo/setup.py')
+
+        # Then
+        self.assertEqual(404, others.status_code)
+        self.assertEqual(404, unknown.status_code)
+
     def test_should_inform_create_repo_failure(self):
         # Given
         create_repo = Mock(return_value=False)
@@ -261,6 +541,150 @@ class TestStatiki(unittest.TestCase):
         self.assertIn('GitHub Status', response.data)
         self.assertIn('Travis Status', response.data)
 
+    def test_should_show_build_report(self):
+        # Given
+        reports = [
+            {
+                'build': '42',
+                'commit': 'abcdef0123',
+                'finished': '2014-05-01T10:00:00Z',
+                'duration': 10.0,
+                'phases': [
+                    {'name': 'build', 'duration': 8.0},
+                    {'name': 'push', 'duration': 2.0},
+                ],
+                'output': {'files': 10, 'bytes': 2048},
+            }
+        ]
+        get_content = Mock(return_value=json.dumps(reports))
+
+        # When
+        with self.logged_in('punchagan'):
+            with patch('github_utils.get_file_content', get_content):
+                response = self.app.get('/report/punchagan/blog')
+
+        # Then
+        args, kwargs = get_content.call_args
+        self.assertEqual(('punchagan/blog', statiki.REPORT), args[:2])
+        self.assertEqual('gh-pages', kwargs['ref'])
+        self.assertEqual(200, response.status_code)
+        self.assertIn('abcdef0', response.data)
+        self.assertIn('width: 80.0%', response.data)
+
+    def test_should_show_no_report_for_malformed_report(self):
+        # Given
+        get_content = Mock(return_value='[{"build": "42", "dur')
+
+        # When
+        with self.logged_in('punchagan'):
+            with patch('github_utils.get_file_content', get_content):
+                response = self.app.get('/report/punchagan/blog')
+
+        # Then
+        self.assertEqual(200, response.status_code)
+        self.assertIn('No build reports', response.data)
+
+    def test_should_skip_reports_of_unexpected_shape(self):
+        # Given
+        reports = [{'build': '41'}, 'oops', {
+            'build': '42', 'commit': 'abcdef0123', 'duration': 10.0,
+            'phases': [{'name': 'build', 'duration': 10.0}],
+            'output': {'files': 10, 'bytes': 2048},
+        }]
+
+        # When
+        with self.logged_in('punchagan'):
+            for content in ('{}', json.dumps(reports)):
+                get_content = Mock(return_value=content)
+                with patch('github_utils.get_file_content', get_content):
+                    response = self.app.get('/report/punchagan/blog')
+
+                # Then
+                self.assertEqual(200, response.status_code)
+
+        self.assertIn('abcdef0', response.data)
+
+    def test_should_show_metrics(self):
+        # Given
+        self.app.get('/faq')
+
+        # When
+        response = self.app.get('/metrics')
+
+        # Then
+        self.assertEqual(200, response.status_code)
+        self.assertIn(
+            'statiki_request_seconds_count'
+            '{method="GET",status="200",view="show_faq"}',
+            response.data
+        )
+        self.assertIn('statiki_db_queries_total', response.data)
+
+    def test_should_reset_metrics_after_fork(self):
+        # Given
+        statiki.warm_up()
+        self.app.get('/faq')
+
+        # When
+        statiki.after_fork()
+
+        # Then
+        self.assertEqual(
+            0, statiki.REQUEST_LATENCY.get(
+                view='show_faq', method='GET', status=200
+            )
+        )
+
+    def test_should_hide_profile_from_non_admins(self):
+        # When
+        with self.logged_in('fred'):
+            response = self.app.get('/admin/profile')
+
+        # Then
+        self.assertEqual(404, response.status_code)
+
+    def test_should_profile_requests_for_admins(self):
+        # Given
+        statiki.profiling.configure(self.tempdir)
+
+        # When
+        with patch('statiki.ADMIN_USERS', ['punchagan']):
+            with self.logged_in('punchagan'):
+                self.app.post('/admin/profile', data={'rate': '100'})
+                self.app.get('/faq')
+                summary = self.app.get('/admin/profile')
+                download = self.app.get('/admin/profile.pstats')
+                self.app.post('/admin/profile', data={'action': 'stop'})
+        statiki.profiling.configure(None)
+
+        # Then
+        self.assertIn('show_faq', summary.data)
+        self.assertEqual(200, download.status_code)
+        self.assertEqual('application/octet-stream', download.mimetype)
+
+    def test_should_reject_invalid_profile_options(self):
+        # Given
+        statiki.profiling.configure(self.tempdir)
+        invalid = [
+            {'rate': 'lots'}, {'rate': '200'}, {'rate': 'nan'},
+            {'seconds': '-1'}, {'seconds': 'inf'}, {'seconds': 'soon'},
+        ]
+
+        # When
+        with patch('statiki.ADMIN_USERS', ['punchagan']):
+            with self.logged_in('punchagan'):
+                responses = [
+                    self.app.post('/admin/profile', data=data)
+                    for data in invalid
+                ]
+        statiki.profiling.configure(None)
+
+        # Then
+        self.assertEqual(
+            [400] * len(invalid),
+            [response.status_code for response in responses]
+        )
+
     def test_should_show_faq(self):
         # When
         response = self.app.get('/faq')
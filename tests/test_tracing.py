@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+# Standard library
+import json
+import unittest
+
+# 3rd-party library
+from mock import Mock, patch
+from requests import Response
+
+# Local library
+import http_utils
+import jobs
+import tracing
+
+
+class TestTracing(unittest.TestCase):
+
+    def tearDown(self):
+        tracing.finish_trace()
+        tracing.configure(None)
+
+    def test_should_not_trace_when_off(self):
+        # Given
+        tracing.configure(None)
+
+        # When
+        trace = tracing.start_trace('manage')
+        with tracing.span('get_repo_id') as span:
+            pass
+
+        # Then
+        self.assertIsNone(trace)
+        self.assertIsNone(span)
+        self.assertIsNone(tracing.finish_trace())
+
+    def test_should_record_spans_of_traced_functions(self):
+        # Given
+        tracing.configure(10)
+
+        @tracing.traced
+        def enable_hook():
+            with tracing.span('PUT api.travis-ci.org'):
+                pass
+
+        # When
+        tracing.start_trace('manage')
+        enable_hook()
+        trace = tracing.finish_trace()
+
+        # Then
+        data = trace.to_dict()
+        self.assertEqual('manage', data['name'])
+        self.assertEqual('enable_hook', data['children'][0]['name'])
+        self.assertEqual(
+            'PUT api.travis-ci.org',
+            data['children'][0]['children'][0]['name']
+        )
+
+    def test_should_record_status_and_size_of_upstream_calls(self):
+        # Given
+        tracing.configure(10)
+        response = Response()
+        response.status_code = 201
+        response._content = 'x' * 42
+
+        # When
+        tracing.start_trace('create_repo')
+        with patch('requests.post', Mock(return_value=response)):
+            http_utils.post('https://api.github.com/user/repos')
+        trace = tracing.finish_trace()
+
+        # Then
+        span = trace.to_dict()['children'][0]
+        self.assertEqual('POST api.github.com', span['name'])
+        self.assertEqual(
+            {'path': '/user/repos', 'status': 201, 'bytes': 42},
+            span['attributes']
+        )
+
+    def test_should_log_slow_traces(self):
+        # Given
+        tracing.configure(0)
+
+        # When
+        with patch('tracing.logger') as logger:
+            tracing.start_trace('manage')
+            tracing.finish_trace()
+
+        # Then
+        args, _ = logger.warning.call_args
+        self.assertEqual('manage', json.loads(args[2])['name'])
+
+    def test_should_not_log_fast_traces(self):
+        # Given
+        tracing.configure(10)
+
+        # When
+        with patch('tracing.logger') as logger:
+            tracing.start_trace('manage')
+            tracing.finish_trace()
+
+        # Then
+        self.assertFalse(logger.warning.called)
+
+    def test_should_carry_trace_into_jobs(self):
+        # Given
+        tracing.configure(10)
+        root = tracing.start_trace('authorized')
+
+        def warmup():
+            return tracing.current()
+
+        # When
+        job = jobs.submit(warmup)
+        job.done.wait(5)
+
+        # Then
+        self.assertEqual('job:warmup', job.result.name)
+        self.assertEqual(root.trace_id, job.result.trace_id)
+
+    def test_should_not_run_cancelled_jobs(self):
+        # Given
+        function = Mock(__name__='warmup')
+        job = jobs.Job(function, (), {})
+
+        # When
+        job.cancel()
+        job.run()
+
+        # Then
+        self.assertFalse(function.called)
+        self.assertTrue(job.done.is_set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,574 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" Tests for the build and deploy script run on Travis. """
+
+# Standard library
+import json
+import os
+from os.path import abspath, dirname, join
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# 3rd-party library
+from fabric.api import hide
+from mock import Mock, patch
+
+# Local library
+sys.path.insert(0, join(dirname(dirname(abspath(__file__))), 'utils'))
+import travis_fabfile
+
+
+class TestTravisFabfile(unittest.TestCase):
+
+    #### 'TestCase' protocol ##################################################
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.remote_dir = join(self.temp_dir, 'remote.git')
+        self.repo_dir = join(self.temp_dir, 'repo')
+        self.old_cwd = os.getcwd()
+        self.old_env = os.environ.copy()
+        os.environ['TRAVIS_REPO_SLUG'] = 'fred/blog'
+        self._create_repos()
+        os.chdir(self.repo_dir)
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        os.environ.clear()
+        os.environ.update(self.old_env)
+        travis_fabfile.DATA.clear()
+        del travis_fabfile.TIMINGS[:]
+        del travis_fabfile.PHASES[:]
+        travis_fabfile.OUTPUT.clear()
+        shutil.rmtree(self.temp_dir)
+
+    #### Tests ####
+
+    def test_should_push_nothing_for_unchanged_output(self):
+        # Given
+        output = {'index.html': 'Hello', 'about.html': 'About'}
+        self._deploy(output)
+        before = self._get_remote_objects()
+
+        # When
+        self._deploy(output)
+
+        # Then
+        self.assertEqual(before, self._get_remote_objects())
+        self.assertEqual(1, self._count_output_commits())
+
+    def test_should_push_only_changes(self):
+        # Given
+        output = {'index.html': 'Hello', 'about.html': 'About' * 10000}
+        self._deploy(output)
+        count, size = self._get_remote_objects()
+
+        # When
+        output['index.html'] = 'Hello, world!'
+        self._deploy(output)
+
+        # Then
+        new_count, new_size = self._get_remote_objects()
+        # A commit, a tree, and blobs for the file, manifest and report.
+        self.assertEqual(5, new_count - count)
+        self.assertLess(new_size - size, 10000)
+        self.assertEqual(2, self._count_output_commits())
+        index = self._git('show', 'gh-pages:index.html', remote=True)
+        self.assertEqual('Hello, world!', index)
+
+    def test_should_ignore_files_git_ignores_in_manifest(self):
+        # Given
+        output = {'index.html': 'Hello', '.gitignore': '.doit.db\n'}
+        self._deploy(dict(output, **{'.doit.db': 'state 1'}))
+        before = self._get_remote_objects()
+
+        # When
+        self._deploy(dict(output, **{'.doit.db': 'state 2'}))
+
+        # Then
+        self.assertEqual(before, self._get_remote_objects())
+        files = self._git('ls-tree', '--name-only', 'gh-pages', remote=True)
+        self.assertNotIn('.doit.db', files.split())
+
+    def test_should_deploy_over_malformed_manifest(self):
+        # Given
+        output = {'index.html': 'Hello'}
+        self._deploy(output)
+        self._push_concurrently({travis_fabfile.MANIFEST: '{"trunc'})
+
+        # When
+        self._deploy(output)
+
+        # Then
+        manifest = json.loads(
+            self._git(
+                'show', 'gh-pages:%s' % travis_fabfile.MANIFEST, remote=True
+            )
+        )
+        self.assertIn('index.html', manifest)
+
+    def test_should_not_commit_unchanged_output(self):
+        # Given
+        output = {'index.html': 'Hello'}
+        self._deploy(output)
+
+        # When
+        self._deploy(output)
+
+        # Then
+        commands = [timing['command'] for timing in travis_fabfile.TIMINGS]
+        self.assertFalse(
+            any(command.startswith('git commit') for command in commands)
+        )
+        self.assertFalse(
+            any(command.startswith('git push') for command in commands)
+        )
+
+    def test_should_retry_push_rejected_by_concurrent_deploy(self):
+        # Given
+        self._deploy({'index.html': 'Hello'})
+
+        # When
+        self._deploy(
+            {'index.html': 'Hello, world!'}, concurrent={'about.html': 'About'}
+        )
+
+        # Then
+        self.assertEqual(3, self._count_output_commits())
+        files = self._git('ls-tree', '--name-only', 'gh-pages', remote=True)
+        self.assertNotIn('about.html', files.split())
+        index = self._git('show', 'gh-pages:index.html', remote=True)
+        self.assertEqual('Hello, world!', index)
+        reports = json.loads(
+            self._git(
+                'show', 'gh-pages:%s' % travis_fabfile.REPORT, remote=True
+            )
+        )
+        self.assertEqual(2, len(reports))
+
+    def test_should_commit_manifest(self):
+        # Given
+        output = {'index.html': 'Hello'}
+
+        # When
+        self._deploy(output)
+
+        # Then
+        manifest = json.loads(
+            self._git(
+                'show', 'gh-pages:%s' % travis_fabfile.MANIFEST, remote=True
+            )
+        )
+        self.assertEqual(
+            {'index.html': 'f7ff9e8b7bb2e09b70935a5d785e0cc5d9d0abf0'},
+            manifest
+        )
+
+    def test_should_remove_deleted_files(self):
+        # Given
+        output = {'index.html': 'Hello', 'about.html': 'About'}
+        self._deploy(output)
+
+        # When
+        del output['about.html']
+        self._deploy(output)
+
+        # Then
+        files = self._git('ls-tree', '--name-only', 'gh-pages', remote=True)
+        self.assertNotIn('about.html', files.split())
+        self.assertIn('index.html', files.split())
+
+    def test_should_force_push_orphan_branch(self):
+        # Given
+        output = {'index.html': 'Hello'}
+        self._deploy(output)
+        travis_fabfile.DATA['DEPLOY_MODE'] = 'orphan'
+
+        # When
+        self._deploy(output)
+
+        # Then
+        self.assertEqual(1, self._count_output_commits())
+
+    def test_should_commit_deletions_in_constant_commands(self):
+        # Given
+        posts = join(self.repo_dir, 'posts')
+        os.makedirs(posts)
+        for i in range(50):
+            with open(join(posts, '%s.html' % i), 'w') as f:
+                f.write('%s' % i)
+        self._git('add', '.')
+        self._git('commit', '-m', 'Add posts')
+        shutil.rmtree(posts)
+
+        # When
+        with hide('everything'):
+            travis_fabfile._git_commit_all('Delete posts')
+
+        # Then
+        self.assertEqual('', self._git('ls-files', 'posts'))
+        self.assertEqual(2, len(travis_fabfile.TIMINGS))
+
+    def test_should_parse_commit_range(self):
+        self.assertEqual(
+            ('abc1234', 'def5678'),
+            travis_fabfile._parse_commit_range('abc1234...def5678')
+        )
+        self.assertEqual(
+            ('abc1234', 'def5678'),
+            travis_fabfile._parse_commit_range('abc1234..def5678\n')
+        )
+        self.assertIsNone(travis_fabfile._parse_commit_range(''))
+        self.assertIsNone(travis_fabfile._parse_commit_range('abc1234'))
+        self.assertIsNone(
+            travis_fabfile._parse_commit_range('0000000...def5678')
+        )
+        self.assertIsNone(
+            travis_fabfile._parse_commit_range('abc1234...def; rm -rf /')
+        )
+
+    def test_should_get_changed_paths(self):
+        # Given
+        start = self._git('rev-parse', 'HEAD')
+        self._commit({'README.md': 'Hi', 'posts/1.rst': 'One'})
+        end = self._git('rev-parse', 'HEAD')
+
+        # When
+        with hide('everything'):
+            paths = travis_fabfile._get_changed_paths(
+                '%s...%s' % (start, end)
+            )
+
+        # Then
+        self.assertEqual(['README.md', 'posts/1.rst'], sorted(paths))
+
+    def test_should_not_get_changed_paths_for_unknown_commits(self):
+        # When
+        with hide('everything'):
+            paths = travis_fabfile._get_changed_paths('abcdef0...1234567')
+
+        # Then
+        self.assertIsNone(paths)
+
+    def test_should_skip_build_without_source_changes(self):
+        # Given
+        start = self._git('rev-parse', 'HEAD')
+        self._commit({'README.md': 'Hi', 'README.rst': 'Hello'})
+        end = self._git('rev-parse', 'HEAD')
+        os.environ['TRAVIS_COMMIT_RANGE'] = '%s...%s' % (start, end)
+
+        # When
+        with hide('everything'):
+            changed = travis_fabfile._sources_changed()
+
+        # Then
+        self.assertFalse(changed)
+
+    def test_should_build_with_deploy_setup_changes(self):
+        # Given
+        start = self._git('rev-parse', 'HEAD')
+        self._commit({'.travis.yml': 'language: python'})
+        end = self._git('rev-parse', 'HEAD')
+        os.environ['TRAVIS_COMMIT_RANGE'] = '%s...%s' % (start, end)
+        travis_fabfile.DATA['BUILD_EXCLUDE'] = '.travis.yml'
+
+        # When
+        with hide('everything'):
+            changed = travis_fabfile._sources_changed()
+
+        # Then
+        self.assertTrue(changed)
+
+    def test_should_build_site_not_deployed_yet(self):
+        # Given
+        start = self._git('rev-parse', 'HEAD')
+        self._commit({'README.md': 'Hi'})
+        end = self._git('rev-parse', 'HEAD')
+        os.environ['TRAVIS_COMMIT_RANGE'] = '%s...%s' % (start, end)
+        os.environ['TRAVIS_PULL_REQUEST'] = 'false'
+
+        # When
+        with patch('travis_fabfile.git_config_setup', Mock()):
+            with patch('travis_fabfile.populate_source', Mock()):
+                with patch('travis_fabfile.build_and_deploy') as deploy:
+                    with hide('everything'):
+                        travis_fabfile.main()
+
+        # Then
+        self.assertTrue(deploy.called)
+
+    def test_should_skip_build_of_deployed_site_without_changes(self):
+        # Given
+        self._deploy({'index.html': 'Hello'})
+        self._git('checkout', '-q', '-f', 'master')
+        start = self._git('rev-parse', 'HEAD')
+        self._commit({'README.md': 'Hi'})
+        end = self._git('rev-parse', 'HEAD')
+        os.environ['TRAVIS_COMMIT_RANGE'] = '%s...%s' % (start, end)
+        os.environ['TRAVIS_PULL_REQUEST'] = 'false'
+
+        # When
+        with patch('travis_fabfile.build_and_deploy') as deploy:
+            with hide('everything'):
+                travis_fabfile.main()
+
+        # Then
+        self.assertFalse(deploy.called)
+
+    def test_should_build_with_source_changes(self):
+        # Given
+        start = self._git('rev-parse', 'HEAD')
+        self._commit({'README.md': 'Hi', 'posts/1.rst': 'One'})
+        end = self._git('rev-parse', 'HEAD')
+        os.environ['TRAVIS_COMMIT_RANGE'] = '%s...%s' % (start, end)
+
+        # When
+        with hide('everything'):
+            changed = travis_fabfile._sources_changed()
+
+        # Then
+        self.assertTrue(changed)
+
+    def test_should_use_configured_path_filters(self):
+        # Given
+        start = self._git('rev-parse', 'HEAD')
+        self._commit({'posts/1.rst': 'One', 'drafts/2.rst': 'Two'})
+        end = self._git('rev-parse', 'HEAD')
+        os.environ['TRAVIS_COMMIT_RANGE'] = '%s...%s' % (start, end)
+        travis_fabfile.DATA['BUILD_INCLUDE'] = 'conf.py, pages/'
+        travis_fabfile.DATA['BUILD_EXCLUDE'] = 'drafts/'
+
+        # When
+        with hide('everything'):
+            changed = travis_fabfile._sources_changed()
+
+        # Then
+        self.assertFalse(changed)
+
+    def test_should_build_with_unknown_changes(self):
+        # Given
+        os.environ.pop('TRAVIS_COMMIT_RANGE', None)
+
+        # When/Then
+        self.assertTrue(travis_fabfile._sources_changed())
+
+    def test_should_build_with_all_cpus(self):
+        # Given
+        cpu_count = Mock(return_value=4)
+
+        # When
+        with patch('multiprocessing.cpu_count', cpu_count):
+            processes = travis_fabfile._get_build_processes()
+
+        # Then
+        self.assertEqual(4, processes)
+
+    def test_should_build_with_configured_processes(self):
+        # Given
+        travis_fabfile.DATA['BUILD_PROCESSES'] = '2'
+
+        # When
+        processes = travis_fabfile._get_build_processes()
+
+        # Then
+        self.assertEqual(2, processes)
+
+    def test_should_build_with_all_cpus_for_invalid_processes(self):
+        # Given
+        travis_fabfile.DATA['BUILD_PROCESSES'] = 'four'
+        cpu_count = Mock(return_value=4)
+
+        # When
+        with patch('multiprocessing.cpu_count', cpu_count):
+            processes = travis_fabfile._get_build_processes()
+
+        # Then
+        self.assertEqual(4, processes)
+
+    def test_should_build_serially_with_unsafe_plugins(self):
+        # Given
+        travis_fabfile.DATA['BUILD_PROCESSES'] = '8'
+        os.makedirs(join(self.repo_dir, 'plugins', 'localsearch'))
+
+        # When
+        processes = travis_fabfile._get_build_processes()
+
+        # Then
+        self.assertEqual(1, processes)
+
+    def test_should_time_deploy_phases(self):
+        # When
+        self._deploy({'index.html': 'Hello'})
+
+        # Then
+        phases = [phase['name'] for phase in travis_fabfile.PHASES]
+        self.assertEqual(
+            ['checkout', 'build', 'manifest', 'commit', 'push'], phases
+        )
+
+    def test_should_commit_report_history(self):
+        # Given
+        self._deploy({'index.html': 'Hello'})
+
+        # When
+        self._deploy({'index.html': 'Hello, world!'})
+
+        # Then
+        reports = json.loads(
+            self._git(
+                'show', 'gh-pages:%s' % travis_fabfile.REPORT, remote=True
+            )
+        )
+        self.assertEqual(2, len(reports))
+        report = reports[-1]
+        self.assertEqual({'files': 1, 'bytes': 13}, report['output'])
+        self.assertEqual(
+            ['checkout', 'build', 'manifest'],
+            [phase['name'] for phase in report['phases']]
+        )
+        self.assertIn(
+            'git reset -q',
+            [command['command'] for command in report['commands']]
+        )
+
+    def test_should_start_fresh_report_history_for_malformed_report(self):
+        # Given
+        self._deploy({'index.html': 'Hello'})
+
+        for content in ('[{"trunc', '{"build": "1"}'):
+            self._push_concurrently({travis_fabfile.REPORT: content})
+
+            # When
+            self._deploy({'index.html': content})
+
+            # Then
+            reports = json.loads(
+                self._git(
+                    'show', 'gh-pages:%s' % travis_fabfile.REPORT, remote=True
+                )
+            )
+            self.assertEqual(1, len(reports))
+
+    #### Private protocol #####################################################
+
+    def _build_html(self, output):
+        """ Return a replacement for _build_html, that writes given output. """
+
+        def build_html():
+            for name in os.listdir('.'):
+                if name == '.git':
+                    continue
+                elif os.path.isdir(name):
+                    shutil.rmtree(name)
+                else:
+                    os.remove(name)
+
+            for name, content in output.items():
+                with open(name, 'w') as f:
+                    f.write(content)
+
+        return build_html
+
+    def _commit(self, files):
+        """ Commit the given files to the repository. """
+
+        for name, content in files.items():
+            path = join(self.repo_dir, name)
+            if not os.path.exists(dirname(path)):
+                os.makedirs(dirname(path))
+            with open(path, 'w') as f:
+                f.write(content)
+
+        self._git('add', '.')
+        self._git('commit', '-m', 'Update')
+
+    def _count_output_commits(self):
+        """ Return the number of commits on the deployed output branch. """
+
+        log = self._git('rev-list', 'gh-pages', remote=True)
+        return len(log.split())
+
+    def _create_repos(self):
+        """ Create a bare remote, and a clone with some source files. """
+
+        subprocess.check_output(['git', 'init', '--bare', self.remote_dir])
+        subprocess.check_output(['git', 'init', self.repo_dir])
+        self._git('config', 'user.name', 'Fred')
+        self._git('config', 'user.email', 'fred@example.com')
+        self._git('remote', 'add', 'origin', self.remote_dir)
+
+        with open(join(self.repo_dir, 'conf.py'), 'w') as f:
+            f.write('TIMEZONE = "UTC"\n')
+        self._git('add', '.')
+        self._git('commit', '-m', 'Add sources')
+        self._git('push', 'origin', 'HEAD:master')
+
+    def _deploy(self, output, concurrent=None):
+        """ Run a deploy from the source branch, with the given output.
+
+        If concurrent files are given, another build pushes them to the
+        output branch, while this one is building.
+
+        """
+
+        self._git('checkout', '-q', '-f', 'master')
+        self._git('clean', '-q', '-f', '-d', '-x')
+        del travis_fabfile.TIMINGS[:]
+        del travis_fabfile.PHASES[:]
+
+        build_html = self._build_html(output)
+        if concurrent is not None:
+            def build_html(build_html=build_html):
+                self._push_concurrently(concurrent)
+                build_html()
+
+        with patch('travis_fabfile._build_html', build_html):
+            with hide('everything'):
+                travis_fabfile.build_and_deploy()
+
+    def _get_remote_objects(self):
+        """ Return the number and total size of objects in the remote. """
+
+        sizes = self._git(
+            'cat-file', '--batch-all-objects', '--batch-check=%(objectsize)',
+            remote=True
+        ).split()
+
+        return len(sizes), sum(int(size) for size in sizes)
+
+    def _push_concurrently(self, files):
+        """ Push a commit adding files to the output branch, from a clone. """
+
+        clone_dir = tempfile.mkdtemp(dir=self.temp_dir)
+        subprocess.check_output(
+            ['git', 'clone', '-q', '-b', 'gh-pages', self.remote_dir,
+             clone_dir]
+        )
+        for name, content in files.items():
+            with open(join(clone_dir, name), 'w') as f:
+                f.write(content)
+
+        for args in (
+                ('config', 'user.name', 'Jane'),
+                ('config', 'user.email', 'jane@example.com'),
+                ('add', '.'),
+                ('commit', '-q', '-m', 'Concurrent deploy'),
+                ('push', '-q', 'origin', 'gh-pages')):
+            subprocess.check_output(('git',) + args, cwd=clone_dir)
+
+    def _git(self, *args, **kwargs):
+        """ Run a git command in the repository, or the remote. """
+
+        cwd = self.remote_dir if kwargs.get('remote') else self.repo_dir
+
+        return subprocess.check_output(('git',) + args, cwd=cwd).strip()
+
+
+if __name__ == '__main__':
+    unittest.main()
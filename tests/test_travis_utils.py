@@ -4,13 +4,21 @@
 # See the LICENSE file for license rights and limitations (MIT).
 
 
+import json
 import os
 from mock import Mock, patch
+import sys
+import threading
 import unittest
 
+import http_utils
 import travis_utils
 import yaml
 
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'benchmarks'))
+from fake_upstreams import PUBLIC_KEY
+
 
 def get_gh_token(bogus):
     """ Returns the GH token to use. """
@@ -29,6 +37,94 @@ TRAVIS_TOKEN = (
 )
 
 
+class TestEncryption(unittest.TestCase):
+
+    def setUp(self):
+        travis_utils._encrypted.clear()
+
+    def test_should_encrypt_once(self):
+        # Given
+        get_key = Mock(return_value=PUBLIC_KEY.replace('RSA PUBLIC', 'PUBLIC'))
+
+        # When
+        with patch('travis_utils.get_public_key', get_key):
+            first = travis_utils.get_encrypted_text(THIS_REPO, 'GH_TOKEN=x')
+            second = travis_utils.get_encrypted_text(THIS_REPO, 'GH_TOKEN=x')
+            other = travis_utils.get_encrypted_text(THIS_REPO, 'GH_TOKEN=y')
+
+        # Then
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(2, get_key.call_count)
+
+    def test_should_not_cache_without_key(self):
+        # Given
+        get_key = Mock(return_value='')
+
+        # When
+        with patch('travis_utils.get_public_key', get_key):
+            travis_utils.get_encrypted_text(THIS_REPO, 'GH_TOKEN=x')
+            travis_utils.get_encrypted_text(THIS_REPO, 'GH_TOKEN=x')
+
+        # Then
+        self.assertEqual(2, get_key.call_count)
+
+
+
+class TestHooks(unittest.TestCase):
+
+    def setUp(self):
+        travis_utils._hooks.clear()
+
+    def test_should_share_concurrent_fetches_of_hooks(self):
+        # Given
+        started = threading.Event()
+        joined = threading.Event()
+        release = threading.Event()
+        wait = http_utils._Flight.wait
+        results = []
+
+        def slow_get(url, **kwargs):
+            started.set()
+            release.wait(5)
+            body = json.dumps([
+                {'id': 1, 'owner_name': 'fred', 'name': 'blog',
+                 'active': True, 'description': 'A blog'},
+            ])
+            iter_content = Mock(return_value=[body])
+            return Mock(status_code=200, iter_content=iter_content)
+
+        def join(flight):
+            joined.set()
+            return wait(flight)
+
+        def get_hooks():
+            results.append(travis_utils.get_hooks('token'))
+
+        get = Mock(side_effect=slow_get)
+        threads = [threading.Thread(target=get_hooks) for _ in range(2)]
+
+        # When
+        with patch('http_utils.get', get):
+            with patch('http_utils._Flight.wait', join):
+                threads[0].start()
+                started.wait(5)
+                threads[1].start()
+                joined.wait(5)
+                release.set()
+                for thread in threads:
+                    thread.join(5)
+
+        # Then
+        self.assertEqual(1, get.call_count)
+        self.assertEqual(2, len(results))
+        self.assertIs(results[0], results[1])
+        self.assertEqual(
+            {'id': 1, 'owner_name': 'fred', 'name': 'blog', 'active': True},
+            results[0][('fred', 'blog')]
+        )
+
+
 @unittest.skipIf(TRAVIS_TOKEN == BOGUS, 'Need a real GitHubtoken...')
 class TestTravisUtils(unittest.TestCase):
 
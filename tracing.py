@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2014 Puneeth Chaganti and others.
+# See the LICENSE file for license rights and limitations (MIT).
+
+""" Lightweight in-process tracing of the work done for a request.
+
+A trace is a tree of spans, each with a name, timing and some attributes.
+Traces slower than the configured threshold are logged as JSON.  When
+tracing is off, no trace is started and spans cost an attribute lookup.
+
+"""
+
+# Standard library
+from contextlib import contextmanager
+from functools import wraps
+import json
+import logging
+import threading
+import time
+import uuid
+
+logger = logging.getLogger('statiki.trace')
+
+_local = threading.local()
+_state = {'threshold': None}
+
+
+class Span(object):
+    """ A timed piece of work, possibly made of other spans. """
+
+    def __init__(self, name, trace_id, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.attributes = attributes or {}
+        self.children = []
+        self.start = time.time()
+        self.duration = None
+
+    def finish(self):
+        self.duration = time.time() - self.start
+
+    def to_dict(self):
+        data = {
+            'name': self.name,
+            'duration': round(self.duration or 0, 4),
+            'offset': 0,
+        }
+        if self.attributes:
+            data['attributes'] = self.attributes
+        if self.children:
+            data['children'] = [
+                dict(
+                    child.to_dict(),
+                    offset=round(child.start - self.start, 4)
+                )
+                for child in self.children
+            ]
+        return data
+
+
+def configure(threshold=None):
+    """ Turn on tracing, logging traces slower than threshold seconds. """
+
+    _state['threshold'] = threshold
+
+
+def current():
+    """ Return the active span of this thread, if any. """
+
+    return getattr(_local, 'span', None)
+
+
+def finish_trace():
+    """ Finish the trace of this thread, and log it if it is slow. """
+
+    root = getattr(_local, 'root', None)
+    _local.root = _local.span = None
+
+    if root is None:
+        return None
+
+    root.finish()
+    if root.duration > _state['threshold']:
+        trace = dict(root.to_dict(), trace_id=root.trace_id)
+        logger.warning('Slow %s: %s', root.name, json.dumps(trace))
+
+    return root
+
+
+@contextmanager
+def span(name, **attributes):
+    """ Record a span as a child of the active span, if any. """
+
+    parent = current()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(name, parent.trace_id, attributes)
+    parent.children.append(child)
+    _local.span = child
+
+    try:
+        yield child
+
+    except Exception as e:
+        child.attributes['error'] = e.__class__.__name__
+        raise
+
+    finally:
+        child.finish()
+        _local.span = parent
+
+
+def start_trace(name, trace_id=None, **attributes):
+    """ Start a trace in this thread, if tracing is on. """
+
+    if _state['threshold'] is None:
+        return None
+
+    root = Span(name, trace_id or uuid.uuid4().hex, attributes)
+    _local.root = _local.span = root
+
+    return root
+
+
+def traced(func):
+    """ Decorator to record a span for each call of the function. """
+
+    @wraps(func)
+    def decorated(*args, **kwargs):
+        if current() is None:
+            return func(*args, **kwargs)
+
+        with span(func.__name__):
+            return func(*args, **kwargs)
+
+    return decorated
+
+
+def wrap(func, name=None):
+    """ Return a function that runs func in a trace linked to the active one.
+
+    Useful to carry the trace context into work run by other threads.
+
+    """
+
+    parent = current()
+    if parent is None:
+        return func
+
+    name = name or func.__name__
+    trace_id = parent.trace_id
+
+    @wraps(func)
+    def wrapped(*args, **kwargs):
+        start_trace(name, trace_id=trace_id)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            finish_trace()
+
+    return wrapped
@@ -7,43 +7,93 @@
 
 # Standard library
 import base64
+import hashlib
 import json
 from os.path import dirname, join
 import re
 
-# 3rd party library
-import requests
-import rsa
-import yaml
+# Local library
+import cache
+import http_utils
+import tracing
 
+# Base URLs of the Travis API and status page.
+API_URL = 'https://api.travis-ci.org'
+STATUS_URL = 'http://status.travis-ci.com'
 
+STATUS_RE = re.compile('(<div.*?class="page-status.*".*>((.|\s)*?)</div>)')
+WHITESPACE_RE = re.compile('\s+')
+
+# Fields of the hooks that are used, and kept.
+HOOK_FIELDS = ('id', 'owner_name', 'name', 'active')
+
+# Contents of the scripts run on travis, read once.
+_scripts = {}
+
+DAY = 24 * 60 * 60
+
+# Encrypted text, by repository and hash of the data.
+_encrypted = cache.Cache('travis_encrypted', 256, ttl=DAY)
+# Public keys, by repository.
+_keys = cache.Cache('travis_public_key', 256, ttl=DAY)
+# Travis tokens of users, by their GitHub token, never written to disk.
+_tokens = cache.Cache('travis_token', 1024, ttl=DAY, shared=False)
+# Hooks of users, by (owner, name) of the repository, by Travis token.
+_hooks = cache.Cache('travis_hooks', 256, ttl=10 * 60)
+# The status of Travis, as shown on the status page.
+_status = cache.Cache('travis_status', 1, ttl=60)
+
+
+def clear_caches():
+    """ Forget all the data cached from travis. """
+
+    for cache_ in (_encrypted, _keys, _tokens, _hooks, _status):
+        cache_.clear()
+
+
+@tracing.traced
 def enable_hook(repo_id, token):
     """ Enable the travis hook for the repository with the given id. """
 
     payload = json.dumps(dict(hook=dict(active=True, id=repo_id)))
     headers = get_header(token)
-    url = 'https://api.travis-ci.org/hooks/%s' % repo_id
-    response = requests.put(url, data=payload, headers=headers)
+    url = '%s/hooks/%s' % (API_URL, repo_id)
+    response = http_utils.put(url, data=payload, headers=headers)
 
     return response.status_code == 200
 
 
 def get_access_token(github_token):
-    url = 'https://api.travis-ci.org/auth/github'
+    url = '%s/auth/github' % API_URL
     data = {'github_token': github_token}
 
-    return requests.post(url, data=data).json().get('access_token')
+    return http_utils.post(url, data=data).json().get('access_token')
 
 
 def get_encrypted_text(repo_name, data):
-    """ Return encrypted text for the data. """
+    """ Return encrypted text for the data.
+
+    Encrypting needs the public key from travis, and is slow, so the result
+    is reused for the same data.
+
+    """
+
+    cache_key = (repo_name, hashlib.sha1(data).hexdigest())
+    secure = _encrypted.get(cache_key)
+    if secure is not None:
+        return secure
 
     public_key = get_public_key(repo_name)
 
     if len(public_key) > 0:
+        import rsa
+
         key = rsa.PublicKey.load_pkcs1_openssl_pem(public_key)
         secure = base64.encodestring(rsa.encrypt(data, key))
-        secure, _ = re.subn('\s+', '', secure)
+        secure = WHITESPACE_RE.sub('', secure)
+        _encrypted.set(
+            cache_key, secure, namespace=cache.repo_namespace(repo_name)
+        )
 
     else:
         secure = 'Some encrypted data ...'
@@ -60,36 +110,60 @@ def get_header(token):
     }
 
 
+@tracing.traced
+def get_hooks(token, refresh=False):
+    """ Return the hooks of the user, by (owner, name), or None.
+
+    The hooks are cached, and fetched again only if asked to refresh.  The
+    listing is parsed as it is read, keeping only the fields used, since it
+    can be very large.  Concurrent calls for a token share one fetch.
+
+    """
+
+    hooks = None if refresh else _hooks.get(token)
+    if hooks is not None:
+        return hooks
+
+    return http_utils.share(('travis_hooks', token), _fetch_hooks, token)
+
+
+@tracing.traced
 def get_public_key(repo):
     """ Get a public key for the repository from travis. """
 
-    url = 'https://api.travis-ci.org/repos/%s' % repo
-    response = requests.get(url)
+    public_key = _keys.get(repo)
+    if public_key is not None:
+        return public_key
+
+    url = '%s/repos/%s' % (API_URL, repo)
+    response = http_utils.get(url)
 
     public_key = response.json().get('public_key', '')
+    public_key = public_key.replace('RSA PUBLIC', 'PUBLIC')
 
-    return public_key.replace('RSA PUBLIC', 'PUBLIC')
+    if len(public_key) > 0:
+        _keys.set(repo, public_key, namespace=cache.repo_namespace(repo))
+
+    return public_key
 
 
+@tracing.traced
 def get_repo_id(full_name, token):
     """ Get the id for a repository from travis. """
 
-    if hook_exists(full_name, token):
-        url = 'https://api.travis-ci.org/repos/%s' % full_name
-        response = requests.get(url).json()
-        repo_id = response.get('id')
-
-    else:
-        repo_id = None
+    hook = _get_hook(full_name, token)
 
-    return repo_id
+    return hook['id'] if hook is not None else None
 
 
 def get_script_contents(script_name, config=None):
     """ Get the contents of the script to be run on travis. """
 
-    with open(join(dirname(__file__), 'utils', script_name)) as f:
-        contents = f.read()
+    if script_name not in _scripts:
+        with open(join(dirname(__file__), 'utils', script_name)) as f:
+            _scripts[script_name] = f.read()
+
+    contents = _scripts[script_name]
 
     if config:
         from pprint import pformat
@@ -102,12 +176,15 @@ def get_script_contents(script_name, config=None):
 
 
 def get_status():
-    """ Return the server status of GitHub. """
+    """ Return the server status of Travis; cached for a minute. """
 
-    response = requests.get('http://status.travis-ci.com')
-    pattern = '(<div.*?class="page-status.*".*>((.|\s)*?)</div>)'
+    status = _status.get(STATUS_URL)
+    if status is None:
+        response = http_utils.get(STATUS_URL)
+        status = STATUS_RE.findall(response.text)[0][1].strip()
+        _status.set(STATUS_URL, status)
 
-    return re.findall(pattern, response.text)[0][1].strip()
+    return status
 
 
 def get_yaml_contents(full_name, script_name, git_info, user_pages=False):
@@ -137,48 +214,39 @@ def get_yaml_contents(full_name, script_name, git_info, user_pages=False):
         'script': 'fab -f %s main' % script_name,
     }
 
+    import yaml
+
     return yaml.dump(config)
 
 
+@tracing.traced
 def hook_exists(full_name, token):
     """ Return True if a hook for the repository is listed on travis. """
 
-    headers = {
-        'Authorization': 'token %s' % token,
-    }
-    response = requests.get(
-        'http://api.travis-ci.org/hooks', headers=headers
-    )
-
-    owner, name = full_name.split('/')
-    if response.status_code == 200:
-        repositories = [
-            repo for repo in response.json()
-            if repo['name'] == name and repo['owner_name'] == owner
-        ]
-        hook_exists = len(repositories) > 0
-
-    else:
-        hook_exists = False
-
-    return hook_exists
+    return _get_hook(full_name, token) is not None
 
 
+@tracing.traced
 def is_travis_user(github_token):
     """ Check if a user is a Travis user.
 
-    Return the travis token if so, else None.
+    Return the travis token if so, else None.  The token is cached, since
+    it does not change for a GitHub token.
 
     """
 
+    travis_token = _tokens.get(github_token)
+    if travis_token is not None:
+        return travis_token
+
     travis_token = get_access_token(github_token)
     headers = {
         'Authorization': 'token %s' % travis_token,
         'Content-Type': 'application/json; charset=UTF-8'
     }
 
-    response = requests.get(
-        'https://api.travis-ci.org/users/', headers=headers
+    response = http_utils.get(
+        '%s/users/' % API_URL, headers=headers
     )
 
     if response.status_code == 200:
@@ -186,15 +254,23 @@ def is_travis_user(github_token):
     else:
         synced_at = None
 
-    return travis_token if synced_at is not None else None
+    if synced_at is None:
+        return None
+
+    _tokens.set(
+        github_token, travis_token,
+        namespace=cache.token_namespace(github_token)
+    )
+
+    return travis_token
 
 
 def start_sync(token):
     """ Start syncing repositories for the user with the given token. """
 
     headers = get_header(token)
-    response = requests.post(
-        'http://api.travis-ci.org/users/sync', headers=headers
+    response = http_utils.post(
+        '%s/users/sync' % API_URL, headers=headers
     )
 
     return (
@@ -203,6 +279,7 @@ def start_sync(token):
     )
 
 
+@tracing.traced
 def sync_with_github(token):
     """ Sync the repositories of the user on Travis from GitHub. """
 
@@ -211,6 +288,9 @@ def sync_with_github(token):
     else:
         synced = False
 
+    # The sync may have added hooks.
+    _hooks.delete(token)
+
     return synced
 
 
@@ -223,8 +303,8 @@ def wait_to_sync(token):
 
     for count in range(6):
 
-        response = requests.get(
-            'http://api.travis-ci.org/users/', headers=headers
+        response = http_utils.get(
+            '%s/users/' % API_URL, headers=headers
         )
 
         if response.status_code == 200:
@@ -239,3 +319,41 @@ def wait_to_sync(token):
             break
 
     return finished
+
+
+#### Private protocol #########################################################
+
+def _fetch_hooks(token):
+    """ Fetch the hooks of the user, and cache them; None on failure. """
+
+    headers = {
+        'Authorization': 'token %s' % token,
+    }
+    response = http_utils.get(
+        '%s/hooks' % API_URL, headers=headers, stream=True
+    )
+
+    if response.status_code != 200:
+        response.close()
+        return None
+
+    hooks = dict(
+        ((hook['owner_name'], hook['name']), hook)
+        for hook in http_utils.iter_json_array(response, HOOK_FIELDS)
+    )
+    _hooks.set(token, hooks, namespace=cache.token_namespace(token))
+
+    return hooks
+
+
+def _get_hook(full_name, token):
+    """ Return the hook for the repository listed on travis, if any. """
+
+    key = tuple(full_name.split('/'))
+    hooks = _hooks.get(token)
+
+    # Repositories are added to travis by syncs, so look again if missing.
+    if hooks is None or key not in hooks:
+        hooks = get_hooks(token, refresh=True)
+
+    return hooks.get(key) if hooks is not None else None
@@ -2,31 +2,106 @@
 
 """ A fabric file for deploying the site from TravisCI. """
 
+from contextlib import contextmanager
+from fnmatch import fnmatch
+import hashlib
+import json
+import multiprocessing
 import os
+import re
+import time
 
-from fabric.api import local, settings, shell_env
+from fabric.api import abort, local, settings, shell_env
 
 
 DATA = {}
 
+# Hashes of the deployed files, committed along with the output.
+MANIFEST = '.statiki-manifest.json'
+
+# Reports of recent builds, committed along with the output.
+REPORT = '.statiki-report.json'
+REPORT_HISTORY = 50
+
+# Paths of the deploy setup, written by Statiki.  Pushes changing them are
+# always built, say to publish a site for the first time, or with new options.
+DEPLOY_PATHS = ('.travis.yml', 'travis_fabfile.py')
+
+# Number of files and bytes in the output.
+OUTPUT = {}
+
+# Durations of all the commands run by the script.
+TIMINGS = []
+
+# Durations of the phases of the build.
+PHASES = []
+
+# Options understood by this script, and not passed on to Nikola's conf.py.
+# These can be overridden in DATA.
+OPTIONS = {
+    # 'incremental' commits only the changes on top of the deployed output
+    # branch, 'orphan' recreates the output branch and force pushes it.
+    'DEPLOY_MODE': 'incremental',
+
+    # Glob patterns of source paths, separated by commas or whitespace.  A
+    # push is built only if it changes an included path that isn't excluded.
+    'BUILD_INCLUDE': '*',
+    'BUILD_EXCLUDE': 'README*',
+
+    # Number of processes used by Nikola to build the site.  Defaults to the
+    # number of CPUs available.
+    'BUILD_PROCESSES': '',
+
+    # Plugins whose tasks are not safe to run in parallel.  Sites using them
+    # are built serially.
+    'SERIAL_PLUGINS': 'localsearch tipue_search',
+}
+
 
 def build_and_deploy():
     """ Build and deploy the output. """
 
+    incremental = _get_option('DEPLOY_MODE') == 'incremental'
+    branch = _get_output_branch()
+
     with shell_env(TZ=_get_timezone()):
-        _create_output_branch()
-        _build_html()
-        _git_commit_all()
-        _git_push(_get_output_branch())
+        with _phase('checkout'):
+            incremental = _create_output_branch(incremental)
+
+        with _phase('build'):
+            _build_html()
+
+        if not _commit_output():
+            return
+
+        with _phase('push'):
+            pushed = _git_push(branch, force=not incremental)
+
+        if pushed:
+            return
+
+        # A build of a later push deployed first, so commit on top of it.
+        print('Push to %s was rejected, retrying on top of it.' % branch)
+        with _phase('checkout'):
+            if not _fetch_branch(branch):
+                abort('Could not fetch %s to retry the push.' % branch)
+            _local('git reset -q --soft FETCH_HEAD')
+
+        if not _commit_output():
+            return
+
+        with _phase('push'):
+            if not _git_push(branch):
+                abort('Push to %s was rejected again.' % branch)
 
 
 def git_config_setup():
     """ Setup git for pushing from Travis. """
 
-    local('git config user.email $GIT_EMAIL')
-    local('git config user.name $GIT_NAME')
+    _local('git config user.email $GIT_EMAIL')
+    _local('git config user.name $GIT_NAME')
 
-    local(
+    _local(
         'git remote set-url --push origin '
         'https://$GH_TOKEN@github.com/$TRAVIS_REPO_SLUG.git'
     )
@@ -39,12 +114,14 @@ def init_site():
 
     command = CommandInit()
     SAMPLE_CONF['SITE_URL'] = _get_site_url()
-    SAMPLE_CONF.update(DATA)
+    SAMPLE_CONF.update(
+        (key, value) for key, value in DATA.items() if key not in OPTIONS
+    )
     command.execute({'demo': True}, ['demo'])
 
-    local('mv demo/* . && rmdir demo')
-    local('touch files/.nojekyll')
-    local('rm *.pyc')
+    _local('mv demo/* . && rmdir demo')
+    _local('touch files/.nojekyll')
+    _local('rm *.pyc')
 
 
 def populate_source():
@@ -55,10 +132,10 @@ def populate_source():
 
     branch = _get_source_branch()
 
-    local('git checkout %s' % branch)
+    _local('git checkout %s' % branch)
     init_site()
     _git_commit_all('Initial commit\n[skip ci]')
-    _git_push(branch)
+    _git_push(branch, force=True)
 
 
 def main():
@@ -67,32 +144,194 @@ def main():
     if not os.environ.get('TRAVIS_PULL_REQUEST', 'false') == 'false':
         return
 
-    git_config_setup()
-    populate_source()
+    if os.path.exists('conf.py') and not _sources_changed():
+        if _is_deployed(_get_output_branch()):
+            print('No changes to the sources of the site, nothing to build.')
+            return
+        print('No changes to the sources, but the site is not deployed yet.')
+
+    with _phase('setup'):
+        git_config_setup()
+
+    with _phase('populate'):
+        populate_source()
+
     build_and_deploy()
 
+    print('Time taken by each phase:')
+    for phase in PHASES:
+        print('    %(name)-10s %(duration)8.2fs' % phase)
+
+    _print_report()
+
 
 #### Private protocol #########################################################
 
 def _build_html():
     """ Run the build command and get rid of everything else. """
 
+    processes = _get_build_processes()
+    command = 'nikola build' if processes == 1 else (
+        'nikola build -n %d' % processes
+    )
+
     # Build twice until getnikola/nikola#1032 is fixed.
-    local('nikola build && nikola build')
+    _local(command)
+    _local(command)
 
     ## Remove all the source files, we only want the output!
-    local('ls | grep -v output | xargs rm -rf')
+    _local('ls | grep -v output | xargs rm -rf')
+    # And the state of doit, which ls skips, and differs on every build.
+    _local('rm -f .doit.db*')
     with settings(warn_only=True):
-        local('mv output/* output/.* .')
+        _local('mv output/* output/.* .')
+
+
+def _commit_output():
+    """ Commit the output, its manifest and report, if the output changed.
+
+    Returns False if the output is the same as on the current branch.
+
+    """
+
+    with _phase('manifest'):
+        changed = _update_manifest()
+
+    if not changed:
+        print('Output has not changed, nothing to deploy.')
+        return False
+
+    _write_report()
+
+    with _phase('commit'):
+        _git_commit_all()
+
+    return True
+
 
+def _create_output_branch(incremental=False):
+    """ Switch to the output branch, keeping the working tree intact.
+
+    In incremental mode, the branch starts off at the deployed output, so that
+    only the changes are committed and pushed.  Otherwise, or if there is no
+    deployed output yet, an orphan branch is created.
+
+    Returns True if the branch is based on the deployed output.
+
+    """
 
-def _create_output_branch():
     branch = _get_output_branch()
 
+    if incremental and _fetch_branch(branch):
+        _local('git update-ref refs/heads/%s FETCH_HEAD' % branch)
+        _local('git symbolic-ref HEAD refs/heads/%s' % branch)
+        _local('git reset -q')
+        return True
+
+    with settings(warn_only=True):
+        _local('git branch -D %s' % branch)
+
+    _local('git checkout --orphan %s' % branch)
+
+    return False
+
+
+def _fetch_branch(branch):
+    """ Shallow fetch a branch from origin, and return True on success. """
+
     with settings(warn_only=True):
-        local('git branch -D %s' % branch)
+        result = _local('git fetch --depth=1 origin %s' % branch, capture=True)
+
+    return result.succeeded
+
+
+def _get_build_processes():
+    """ Return the number of processes to use for building the site. """
+
+    processes = str(_get_option('BUILD_PROCESSES')).strip()
+
+    try:
+        processes = max(int(processes), 1) if len(processes) > 0 else None
+
+    except ValueError:
+        print(
+            'Ignoring BUILD_PROCESSES, which is not a number: %r' % processes
+        )
+        processes = None
+
+    if processes is None:
+        try:
+            processes = multiprocessing.cpu_count()
+        except NotImplementedError:
+            processes = 1
+
+    if processes > 1:
+        serial_plugins = _get_serial_plugins()
+        if len(serial_plugins) > 0:
+            print(
+                'Building serially, since these plugins are not safe to run '
+                'in parallel: %s' % ', '.join(serial_plugins)
+            )
+            processes = 1
+
+    return processes
+
+
+def _get_changed_paths(commit_range):
+    """ Return the paths changed in a commit range, or None if unknown. """
+
+    commits = _parse_commit_range(commit_range)
+    if commits is None:
+        return None
+
+    with settings(warn_only=True):
+        result = _local(
+            'git diff --name-only %s...%s' % commits, capture=True
+        )
+
+    if not result.succeeded:
+        return None
+
+    return [path for path in result.splitlines() if len(path.strip()) > 0]
+
+
+def _get_manifest():
+    """ Return a mapping of paths of all the output files to their hashes.
+
+    The output files are those git would commit: tracked or untracked, but
+    not ignored.  Also, updates the number of files and bytes in OUTPUT.
+
+    """
+
+    manifest = {}
+    size = 0
+
+    paths = _local(
+        'git ls-files -z --cached --others --exclude-standard', capture=True
+    )
+
+    for path in paths.split('\0'):
+        # Tracked files may have been deleted from the working tree.
+        if path in ('', MANIFEST, REPORT) or not os.path.isfile(path):
+            continue
+
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        manifest[path] = hashlib.sha1(content).hexdigest()
+        size += len(content)
+
+    OUTPUT.update(files=len(manifest), bytes=size)
+
+    return manifest
+
 
-    local('git checkout --orphan %s' % branch)
+def _get_option(name):
+    return DATA.get(name, OPTIONS[name])
+
+
+def _get_patterns(name):
+    return _get_option(name).replace(',', ' ').split()
 
 
 def _get_output_branch():
@@ -109,6 +348,39 @@ def _get_source_branch():
     return 'deploy' if _user_pages() else 'master'
 
 
+def _get_report():
+    """ Return a report of the time taken by the build, and its output. """
+
+    def rounded(timings):
+        return [
+            dict(timing, duration=round(timing['duration'], 3))
+            for timing in timings
+        ]
+
+    return {
+        'build': os.environ.get('TRAVIS_BUILD_NUMBER'),
+        'commit': os.environ.get('TRAVIS_COMMIT'),
+        'finished': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'duration': round(sum(phase['duration'] for phase in PHASES), 3),
+        'phases': rounded(PHASES),
+        'commands': rounded(TIMINGS),
+        'output': dict(OUTPUT),
+    }
+
+
+def _get_serial_plugins():
+    """ Return the plugins used by the site, that need a serial build. """
+
+    if not os.path.isdir('plugins'):
+        return []
+
+    plugins = set(os.listdir('plugins'))
+
+    return [
+        name for name in _get_patterns('SERIAL_PLUGINS') if name in plugins
+    ]
+
+
 def _get_site_url():
     user, repo = _get_repo_name()
     if _user_pages():
@@ -134,30 +406,202 @@ def _get_timezone():
 def _git_commit_all(message=''):
     """ Commit all the changes to the repo. """
 
-    # Remove deleted files
-    result = local('git ls-files --deleted -z', capture=True)
-    for path in result.split('\x00'):
-        if len(path.strip()) > 0:
-            local('git rm %s' % path, capture=True)
-
-    # Add new files
-    local('git add .', capture=True)
+    # Stage new, modified and deleted files, in one go.
+    _local('git add -A .', capture=True)
 
     # Commit
     with settings(warn_only=True):
         if not message:
             message = "$(date)"
-        local('git commit -m "%s"' % message)
+        _local('git commit -m "%s"' % message)
+
+
+def _git_push(branch, force=False):
+    """ Push any changes, to the specified branch.
+
+    Returns False if the push was rejected, since the branch has commits
+    that aren't on ours, say of a concurrent build.  Aborts on other errors.
+
+    """
+
+    with settings(warn_only=True):
+        result = _local(
+            'git push %(force)sorigin %(branch)s:%(branch)s' % {
+                'branch': branch, 'force': '-f ' if force else ''
+            },
+            capture=True
+        )
+
+    if result.succeeded:
+        print('Pushed to %s' % branch)
+        return True
+
+    if '[rejected]' in result.stderr:
+        return False
+
+    abort('Push to %s failed:\n%s' % (branch, result.stderr))
+
+
+def _git_show(path):
+    """ Return the parsed JSON file at path on the current branch, or None.
+
+    None is also returned for a file that isn't valid JSON, say one edited
+    by hand, so that a deploy starts afresh instead of failing.
+
+    """
+
+    with settings(warn_only=True):
+        content = _local('git show HEAD:%s' % path, capture=True)
+
+    if not content.succeeded:
+        return None
+
+    try:
+        return json.loads(content)
+    except ValueError:
+        print('Ignoring %s, which is not valid JSON.' % path)
+        return None
+
+
+def _local(command, capture=False):
+    """ Run a command locally, and record the time it took. """
+
+    start = time.time()
+
+    try:
+        return local(command, capture=capture)
+
+    finally:
+        duration = time.time() - start
+        TIMINGS.append({'command': command, 'duration': duration})
+        print('Took %.2fs: %s' % (duration, command))
+
+
+def _is_deployed(branch):
+    """ Return True if the output branch exists on origin. """
+
+    with settings(warn_only=True):
+        result = _local(
+            'git ls-remote --exit-code origin refs/heads/%s' % branch,
+            capture=True
+        )
+
+    return result.succeeded
 
 
-def _git_push(branch):
-    """ Push any changes, to the specified branch. """
+def _is_source_path(path, include, exclude):
+    """ Return True if a path matches an included and no excluded pattern. """
 
-    local(
-        'git push -f origin %(branch)s:%(branch)s' % {'branch': branch},
-        capture=True
+    def matches(pattern):
+        return (
+            fnmatch(path, pattern)
+            or path.startswith(pattern.rstrip('/') + '/')
+        )
+
+    return (
+        any(matches(pattern) for pattern in include)
+        and not any(matches(pattern) for pattern in exclude)
+    )
+
+
+def _parse_commit_range(commit_range):
+    """ Return the start and end commits of a range like abc...def.
+
+    Returns None, if the range is malformed, or starts at the null commit.
+
+    """
+
+    match = re.match(
+        r'^([0-9a-f]{7,40})\.{2,3}([0-9a-f]{7,40})$', commit_range.strip()
     )
-    print('Pushed to %s' % branch)
+
+    if match is None or set(match.group(1)) == set('0'):
+        return None
+
+    return match.groups()
+
+
+def _print_report():
+    """ Print the report of the build, as a fenced block. """
+
+    print('Build report:')
+    print('```json')
+    print(json.dumps(_get_report(), indent=2, sort_keys=True))
+    print('```')
+
+
+@contextmanager
+def _phase(name):
+    """ Record the time taken by a phase of the build. """
+
+    start = time.time()
+
+    try:
+        yield
+
+    finally:
+        PHASES.append({'name': name, 'duration': time.time() - start})
+
+
+def _sources_changed():
+    """ Return True if the pushed commits change the sources of the site.
+
+    If the changes cannot be determined, they are assumed to be relevant.
+
+    """
+
+    paths = _get_changed_paths(os.environ.get('TRAVIS_COMMIT_RANGE', ''))
+    if paths is None or any(path in DEPLOY_PATHS for path in paths):
+        return True
+
+    include = _get_patterns('BUILD_INCLUDE')
+    exclude = _get_patterns('BUILD_EXCLUDE')
+
+    return any(_is_source_path(path, include, exclude) for path in paths)
+
+
+def _update_manifest():
+    """ Write the manifest of the output, and return True if it changed.
+
+    The manifest is compared with the one on the current branch, which is the
+    deployed output when deploying incrementally, and the changes are printed.
+
+    """
+
+    manifest = _get_manifest()
+    deployed = _git_show(MANIFEST)
+    if not isinstance(deployed, dict):
+        deployed = {}
+
+    changed = sorted(
+        path for path in set(manifest) | set(deployed)
+        if manifest.get(path) != deployed.get(path)
+    )
+
+    if len(changed) == 0:
+        return False
+
+    with open(MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    print('%d changed files:' % len(changed))
+    for path in changed:
+        print('    %s' % path)
+
+    return True
+
+
+def _write_report():
+    """ Add a report of the current build, to those of the deployed builds. """
+
+    reports = _git_show(REPORT)
+    if not isinstance(reports, list):
+        # Start a fresh history, if the deployed one was mangled.
+        reports = []
+    reports.append(_get_report())
+
+    with open(REPORT, 'w') as f:
+        json.dump(reports[-REPORT_HISTORY:], f, indent=2, sort_keys=True)
 
 
 def _user_pages():